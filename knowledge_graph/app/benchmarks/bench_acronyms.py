@@ -0,0 +1,103 @@
+'''
+Benchmark of the acronym expansion: replace_Acronyms against the AcronymExpander of util/utils.py, on the ECSS
+acronym list. Both are run on the same sentences, the names of the ElementDefinitions and Parameters of EM .json
+files or synthetic names made of acronyms and words, and their output is compared.
+Run from the app directory:
+    python benchmarks/bench_acronyms.py [--em_dir_path <dir of EMs>] [--sentences 1000]
+'''
+
+import argparse
+import os
+import random
+import sys
+import time
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from util.utils import AcronymExpander, iter_json_array, load_Acronyms, replace_Acronyms
+
+# Words of the synthetic names, between the acronyms
+WORDS = ('Solar', 'Array', 'Battery', 'power', 'unit', 'wheel', 'thermal', 'control', 'of', 'the', 'Panel', 'harness',
+         'Structure', 'mode', 'sensor', '2', 'A', 'x')
+
+
+def parse_args():
+    parser = argparse.ArgumentParser()
+    parser.add_argument(
+        "--acronymsFile", "-aF", type=str, required=False,
+        help="Acronyms list, one 'acronym | expansion' per line",
+        default=os.path.join('util', 'ecss_acronyms.txt')
+    )
+    parser.add_argument(
+        "--em_dir_path", "-ed", type=str, required=False,
+        help="Directory containing EMs, synthetic names are used if not given"
+    )
+    parser.add_argument(
+        "--sentences", "-n", type=int, required=False,
+        help="Number of sentences, replace_Acronyms takes tens of milliseconds per sentence", default=1000
+    )
+    parser.add_argument(
+        "--seed", "-s", type=int, required=False,
+        help="Random seed of the synthetic names", default=0
+    )
+    return parser.parse_args()
+
+
+def em_names(em_dir_path):
+    for path, subdirs, files in os.walk(em_dir_path):
+        for name in files:
+            if name.endswith('.json') and name not in ('Header.json', 'Metadata.json'):
+                for item in iter_json_array(os.path.join(path, name)):
+                    if item.get('classKind') in ('ElementDefinition', 'Parameter') and item.get('name'):
+                        yield item['name']
+
+
+def synthetic_names(acronyms, nb_sentences, seed=0):
+    '''
+    :return: names of 1 to 6 words, acronyms (as listed, lowercase or plural) and other words, with underscores or
+             spaces between them
+    '''
+    rng = random.Random(seed)
+    names = []
+    for _ in range(nb_sentences):
+        words = []
+        for _ in range(rng.randint(1, 6)):
+            if rng.random() < 0.5:
+                acronym = rng.choice(acronyms)
+                words.append(rng.choice((acronym, acronym.lower(), acronym + 's')))
+            else:
+                words.append(rng.choice(WORDS))
+        names.append(rng.choice((' ', '_')).join(words))
+    return names
+
+
+def main(acronymsFile, em_dir_path, sentences, seed):
+    acronyms, expansions = load_Acronyms(acronymsFile)
+    start = time.perf_counter()
+    expander = AcronymExpander(acronyms, expansions)
+    print(f'AcronymExpander of {len(acronyms)} acronyms built in {time.perf_counter() - start:.3f}s')
+
+    if em_dir_path:
+        names = list(dict.fromkeys(em_names(em_dir_path)))[:sentences]
+    else:
+        names = synthetic_names(acronyms, sentences, seed)
+
+    start = time.perf_counter()
+    expected = [replace_Acronyms(name, acronyms, expansions) for name in names]
+    reference_seconds = time.perf_counter() - start
+    start = time.perf_counter()
+    expanded = [expander.expand(name) for name in names]
+    expander_seconds = time.perf_counter() - start
+
+    differences = [(name, a, b) for name, a, b in zip(names, expected, expanded) if a != b]
+    for name, a, b in differences[:20]:
+        print(f'{name!r}:\n  replace_Acronyms: {a!r}\n   AcronymExpander: {b!r}')
+    print(f'replace_Acronyms: {len(names) / reference_seconds:12,.0f} sentences/s ({reference_seconds:.3f}s)')
+    print(f' AcronymExpander: {len(names) / expander_seconds:12,.0f} sentences/s ({expander_seconds:.3f}s)')
+    print(f'         speedup: {reference_seconds / expander_seconds:.0f}x, '
+          f'{len(names) - len(differences)}/{len(names)} identical outputs')
+    return len(differences)
+
+
+if __name__ == "__main__":
+    sys.exit(1 if main(**vars(parse_args())) else 0)
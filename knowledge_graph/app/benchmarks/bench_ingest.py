@@ -0,0 +1,201 @@
+'''
+Benchmark of the ingest of Engineering Models: entity phase (migrate_em_json.load_data_into_typedb, through
+load_mission_entities) and relationship phase (load_mission_relationships) on synthetic EMs of increasing size
+(see synthetic.synthetic_engineering_model). By default the queries are committed to the in-process fake TypeDB
+client (util/fake_typedb.py), which measures the Python side of the pipeline; with --fakeTypeDB false they are
+inserted into the database --dbName of a TypeDB server, whose schema must be defined.
+Results are written to a .json file of --resultsDir, and compared with a previous result file given as --baseline.
+Run from the app directory:
+    python benchmarks/bench_ingest.py [--sizes 10000,100000,1000000] [--writers 4] [--baseline <results.json>]
+'''
+
+import argparse
+import contextlib
+import io
+import os
+import resource
+import subprocess
+import sys
+import tempfile
+import time
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+import ujson as json
+from typedb.client import SessionType, TypeDBOptions
+
+import migrate_em_json
+from migrationTemplates import TEMPLATES
+from templateCompiler import compile_templates, parse_schema
+from util.connection import core_client, use_fake_typedb
+from util.telemetry import telemetry
+from synthetic import synthetic_engineering_model, write_engineering_model, items_per_element
+
+RESULTS_DIR = os.path.join(os.path.dirname(os.path.abspath(__file__)), 'results')
+
+# Metrics compared with the baseline, higher is better
+COMPARED = ('entities_per_second', 'relationships_per_second', 'items_per_second')
+
+
+def parse_args():
+    parser = argparse.ArgumentParser()
+    parser.add_argument(
+        "--sizes", "-s", type=str, required=False,
+        help="Comma separated numbers of items of the synthetic EMs", default="10000,100000,1000000"
+    )
+    parser.add_argument(
+        "--schemaFile", "-sF", type=str, required=False,
+        help="TypeDB schema file the classes and relationships of the synthetic items are taken from",
+        default=os.path.join('TypeDB', 'schema', 'TypeDBSchemaECSS_relunique.tql')
+    )
+    parser.add_argument(
+        "--writers", "-w", type=int, required=False,
+        help="Number of entity batches committed concurrently", default=1
+    )
+    parser.add_argument(
+        "--generatorProcesses", "-gP", type=int, required=False,
+        help="Number of processes rendering the queries, 0 to render them in the committing process", default=0
+    )
+    parser.add_argument(
+        "--fakeTypeDB", "-fT", type=str, required=False,
+        help="true, or path of the .json configuration of the fake TypeDB client (e.g. with simulated latencies), "
+             "false to insert into a TypeDB server", default="true"
+    )
+    parser.add_argument(
+        "--address", "-a", type=str, required=False,
+        help="Address of the TypeDB server, with --fakeTypeDB false", default="localhost:1729"
+    )
+    parser.add_argument(
+        "--dbName", "-n", type=str, required=False,
+        help="Database the EMs are inserted into, with --fakeTypeDB false", default="bench_ingest"
+    )
+    parser.add_argument(
+        "--resultsDir", "-r", type=str, required=False,
+        help="Directory the results are written to", default=RESULTS_DIR
+    )
+    parser.add_argument(
+        "--baseline", "-b", type=str, required=False,
+        help="Result file of a previous run the results are compared with"
+    )
+    parser.add_argument(
+        "--seed", type=int, required=False,
+        help="Random seed of the synthetic EMs", default=0
+    )
+    return parser.parse_args()
+
+
+def git_commit():
+    try:
+        return subprocess.run(['git', 'rev-parse', '--short', 'HEAD'], capture_output=True, text=True,
+                              cwd=os.path.dirname(os.path.abspath(__file__))).stdout.strip() or None
+    except OSError:
+        return None
+
+
+def peak_rss_mb():
+    # ru_maxrss is in kilobytes on Linux, in bytes on macOS
+    rss = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+    return round(rss / (1024 * 1024 if sys.platform == 'darwin' else 1024), 1)
+
+
+def commit_latencies(report):
+    '''
+    :return: dict kind -> percentiles of the commit latency (ms)
+    '''
+    return {timing['labels']['kind']: {f'p{q}': round(timing[f'p{q}'] * 1000, 2) if timing[f'p{q}'] is not None
+                                       else None for q in (50, 90, 99)}
+            for timing in report['timings'].get('commit_seconds', [])}
+
+
+def bench_size(nb_items, compiled, schema_types, writers, generator_processes, address, dbName, seed):
+    '''
+    Generates a synthetic EM of about nb_items items and inserts it, entities then relationships
+    :return: dict of results
+    '''
+    nb_elements = max(1, round(nb_items / items_per_element()))
+    start = time.perf_counter()
+    files = synthetic_engineering_model(compiled, TEMPLATES, schema_types, nb_elements, seed=seed)
+
+    with tempfile.TemporaryDirectory() as directory:
+        mission = f'bench{nb_items}'
+        nb_items = write_engineering_model(os.path.join(directory, mission), files)
+        del files
+        generation_seconds = time.perf_counter() - start
+        em_files = migrate_em_json.load_em_files(directory)[mission]
+
+        telemetry.reset()
+        options = TypeDBOptions()
+        options.session_idle_timeout_millis = 300_000
+        # progress bars and per-file messages of the pipeline are not part of the results
+        with core_client(address) as client, contextlib.redirect_stdout(io.StringIO()), \
+                contextlib.redirect_stderr(io.StringIO()):
+            if not client.databases().contains(dbName):
+                client.databases().create(dbName)
+            with client.session(dbName, SessionType.DATA, options) as session:
+                start = time.perf_counter()
+                sink, failed = migrate_em_json.load_mission_entities(em_files, session, TEMPLATES, writers=writers,
+                                                                     mission=mission,
+                                                                     generator_processes=generator_processes)
+                entity_seconds = time.perf_counter() - start
+                start = time.perf_counter()
+                nb_relationships = migrate_em_json.load_mission_relationships(session, sink, mission=mission)
+                relationship_seconds = time.perf_counter() - start
+
+    report = telemetry.report()
+    return {'items': nb_items, 'elements': nb_elements, 'relationships': nb_relationships,
+            'failed_batches': failed, 'generation_seconds': round(generation_seconds, 3),
+            'entity_seconds': round(entity_seconds, 3), 'relationship_seconds': round(relationship_seconds, 3),
+            'entities_per_second': round(nb_items / entity_seconds, 1),
+            'relationships_per_second': round(nb_relationships / relationship_seconds, 1)
+            if relationship_seconds else None,
+            'items_per_second': round(nb_items / (entity_seconds + relationship_seconds), 1),
+            'commit_latency_ms': commit_latencies(report), 'peak_rss_mb': peak_rss_mb()}
+
+
+def compare(results, baseline_file):
+    '''
+    Prints the ratio of each metric to the one of the baseline, for the sizes of both runs
+    '''
+    with open(baseline_file, 'r', encoding='utf-8') as file:
+        baseline = {str(result['size']): result for result in json.load(file)['results']}
+    print(f'\nCompared with {baseline_file}:')
+    for result in results:
+        previous = baseline.get(str(result['size']))
+        if previous is None:
+            continue
+        ratios = ', '.join(f'{metric} {result[metric] / previous[metric]:.2f}x' for metric in COMPARED
+                           if result.get(metric) and previous.get(metric))
+        print(f'{result["size"]:>10,}: {ratios}')
+
+
+def main(sizes, schemaFile, writers, generatorProcesses, fakeTypeDB, address, dbName, resultsDir,
+         baseline, seed):
+    if str(fakeTypeDB).lower() != 'false':
+        use_fake_typedb(fakeTypeDB)
+    compiled = compile_templates(schemaFile)
+    schema_types = parse_schema(schemaFile)
+
+    results = []
+    for size in sorted(int(size) for size in sizes.split(',')):
+        result = dict(size=size, **bench_size(size, compiled, schema_types, writers, generatorProcesses,
+                                              address, dbName, seed))
+        results.append(result)
+        print(f'{size:>10,}: {result["entities_per_second"]:10,.0f} entities/s, '
+              f'{result["relationships_per_second"] or 0:10,.0f} relationships/s, '
+              f'commit p99 {result["commit_latency_ms"].get("Entity", {}).get("p99")} ms, '
+              f'peak RSS {result["peak_rss_mb"]} MB')
+
+    os.makedirs(resultsDir, exist_ok=True)
+    path = os.path.join(resultsDir, time.strftime('ingest_%Y%m%d_%H%M%S.json'))
+    with open(path, 'w', encoding='utf-8') as file:
+        json.dump({'timestamp': time.time(), 'commit': git_commit(),
+                   'settings': {'writers': writers,
+                                'generatorProcesses': generatorProcesses, 'fakeTypeDB': fakeTypeDB, 'seed': seed},
+                   'results': results}, file, indent=2)
+    print(f'Results written to {path}')
+    if baseline:
+        compare(results, baseline)
+
+
+if __name__ == "__main__":
+    main(**vars(parse_args()))
@@ -0,0 +1,83 @@
+'''
+Benchmark of the migration templates: items rendered per second by the hand-written templates of
+migrationTemplates.py and by the templates compiled from the schema layer (templateCompiler.py), on the same
+synthetic Engineering Model. Relationships are collected in a RelationshipBuffer, as in the rendering processes.
+Run from the app directory:
+    python benchmarks/bench_templates.py [--items 100000] [--classes ElementDefinition,Parameter,...]
+'''
+
+import argparse
+import os
+import sys
+import time
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from migrationTemplates import TEMPLATES, set_relationship_sink
+from templateCompiler import compile_templates
+from util.relationships import RelationshipBuffer
+from synthetic import synthetic_items
+
+
+def parse_args():
+    parser = argparse.ArgumentParser()
+    parser.add_argument(
+        "--schemaFile", "-sF", type=str, required=False,
+        help="TypeDB schema file the templates are compiled from",
+        default=os.path.join('TypeDB', 'schema', 'TypeDBSchemaECSS_relunique.tql')
+    )
+    parser.add_argument(
+        "--items", "-n", type=int, required=False,
+        help="Number of synthetic items", default=100_000
+    )
+    parser.add_argument(
+        "--classes", "-c", type=str, required=False,
+        help="Comma separated classKinds of the synthetic items, defaults to all classes"
+    )
+    parser.add_argument(
+        "--repeat", "-r", type=int, required=False,
+        help="Number of runs per engine, the fastest one is reported", default=3
+    )
+    return parser.parse_args()
+
+
+def time_templates(Templates, items, repeat):
+    '''
+    :return: seconds of the fastest of `repeat` runs rendering all items, number of relationships collected
+    '''
+    buffer = RelationshipBuffer()
+    set_relationship_sink(buffer)
+    best = float('inf')
+    for _ in range(repeat):
+        nb_relationships = 0
+        start = time.perf_counter()
+        for item in items:
+            Templates[item['classKind']](item).replace('\\', '')
+            nb_relationships += len(buffer.drain())
+        best = min(best, time.perf_counter() - start)
+    return best, nb_relationships
+
+
+def main(schemaFile, items, classes, repeat):
+    start = time.perf_counter()
+    compiled = compile_templates(schemaFile)
+    print(f'{len(compiled)} templates compiled in {time.perf_counter() - start:.3f}s')
+
+    classes = classes.split(',') if classes else None
+    items = synthetic_items(items, compiled, TEMPLATES, classes)
+
+    previous_sink = set_relationship_sink(RelationshipBuffer())
+    try:
+        results = {engine: time_templates(Templates, items, repeat)
+                   for engine, Templates in (('hand-written', TEMPLATES), ('compiled', compiled))}
+    finally:
+        set_relationship_sink(previous_sink)
+
+    for engine, (seconds, nb_relationships) in results.items():
+        print(f'{engine:>12}: {len(items) / seconds:12,.0f} items/s ({seconds:.3f}s for {len(items)} items, '
+              f'{nb_relationships} relationships)')
+    print(f'     speedup: {results["hand-written"][0] / results["compiled"][0]:.2f}x')
+
+
+if __name__ == "__main__":
+    main(**vars(parse_args()))
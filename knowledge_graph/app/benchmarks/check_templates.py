@@ -0,0 +1,147 @@
+'''
+Equivalence check of the templates compiled from the schema layer (templateCompiler.py) against the hand-written
+templates of migrationTemplates.py.
+Both are run on the same items, from EM .json files or synthetic ones, and their output is compared:
+- attributes of the insert query, as (attribute, value) pairs, the variable names are ignored
+- relationships, as (relationship, role 1, class of player 1, player 1, role 2, player 2), each one as many times as
+  it is written
+- class of the other player of each relationship, reported separately as any class the player belongs to matches it
+Differences are summed up per classKind, run from the app directory:
+    python benchmarks/check_templates.py [--em_dir_path <dir of EMs>]
+'''
+
+import argparse
+import os
+import re
+import sys
+from collections import Counter, defaultdict
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from migrationTemplates import TEMPLATES, set_relationship_sink
+from templateCompiler import compile_templates
+from util.relationships import RelationshipBuffer
+from util.utils import iter_json_array
+from synthetic import synthetic_items
+
+
+def parse_args():
+    parser = argparse.ArgumentParser()
+    parser.add_argument(
+        "--schemaFile", "-sF", type=str, required=False,
+        help="TypeDB schema file the templates are compiled from",
+        default=os.path.join('TypeDB', 'schema', 'TypeDBSchemaECSS_relunique.tql')
+    )
+    parser.add_argument(
+        "--em_dir_path", "-ed", type=str, required=False,
+        help="Directory containing EMs, synthetic items are used if not given"
+    )
+    parser.add_argument(
+        "--items", "-n", type=int, required=False,
+        help="Number of synthetic items", default=10_000
+    )
+    parser.add_argument(
+        "--verbose", "-v", type=lambda x: (str(x).lower() == 'true'), required=False,
+        help="Print the differing attributes and relationships", default=False
+    )
+    return parser.parse_args()
+
+
+def query_attributes(query):
+    '''
+    :return: set of (attribute, value) of an insert query
+    '''
+    return set(re.findall(r'has ([\w-]+) "([^"]*)"', query)) | set(re.findall(r'has ([\w-]+) ([^",;\s]+)', query))
+
+
+def render(template, item, buffer):
+    '''
+    :return: (query attributes, Counter of relationships, dict relationship -> class of the other player), or the
+             exception raised by the template
+    '''
+    try:
+        query = template(item).replace('\\', '')
+    except Exception as error:
+        buffer.drain()
+        return error
+    rows = buffer.drain()
+    return (query_attributes(query),
+            Counter((relation, r1, c1, p1, r2, p2) for relation, r1, c1, p1, r2, c2, p2 in rows),
+            {(relation, p2): c2 for relation, r1, c1, p1, r2, c2, p2 in rows})
+
+
+def em_items(em_dir_path):
+    for path, subdirs, files in os.walk(em_dir_path):
+        for name in files:
+            if name.endswith('.json') and name not in ('Header.json', 'Metadata.json'):
+                yield from iter_json_array(os.path.join(path, name))
+
+
+def main(schemaFile, em_dir_path, items, verbose):
+    compiled = compile_templates(schemaFile)
+    if em_dir_path:
+        items = em_items(em_dir_path)
+    else:
+        items = synthetic_items(items, compiled, TEMPLATES)
+
+    buffer = RelationshipBuffer()
+    previous_sink = set_relationship_sink(buffer)
+    stats = defaultdict(Counter)
+    examples = defaultdict(set)
+    try:
+        for item in items:
+            classKind = item.get('classKind')
+            if classKind not in TEMPLATES or classKind not in compiled:
+                stats[classKind]['no template'] += 1
+                continue
+            stats[classKind]['items'] += 1
+
+            legacy = render(TEMPLATES[classKind], item, buffer)
+            new = render(compiled[classKind], item, buffer)
+            if isinstance(legacy, Exception) or isinstance(new, Exception):
+                for engine, result in (('hand-written', legacy), ('compiled', new)):
+                    if isinstance(result, Exception):
+                        stats[classKind][f'{engine} error'] += 1
+                        examples[classKind].add(f'{engine} error: {result!r}')
+                continue
+
+            differences = {
+                'attributes only hand-written': legacy[0] - new[0],
+                'attributes only compiled': new[0] - legacy[0],
+                'relationships only hand-written': legacy[1] - new[1],
+                'relationships only compiled': new[1] - legacy[1],
+                'player class': {(key, legacy[2][key], new[2][key]) for key in legacy[2].keys() & new[2].keys()
+                                 if legacy[2][key] != new[2][key]},
+            }
+            if not any(differences.values()):
+                stats[classKind]['identical'] += 1
+            for kind, difference in differences.items():
+                if difference:
+                    stats[classKind][kind] += 1
+                    if kind.startswith('attributes'):
+                        examples[classKind].update(f'{kind}: {attribute}' for attribute, value in difference)
+                    elif kind.startswith('relationships'):
+                        examples[classKind].update(f'{kind}: {relation[0]}' for relation in difference)
+                    else:
+                        examples[classKind].update(f'{kind}: {relation} {legacy_class} -> {new_class}'
+                                                   for (relation, p2), legacy_class, new_class in difference)
+    finally:
+        set_relationship_sink(previous_sink)
+
+    nb_items = sum(counts['items'] for counts in stats.values())
+    nb_identical = sum(counts['identical'] for counts in stats.values())
+    print(f'{nb_identical}/{nb_items} items with identical output, {len(stats)} classes\n')
+    for classKind in sorted(stats, key=str):
+        counts = stats[classKind]
+        if counts['identical'] == counts['items']:
+            continue
+        print(f'{classKind}: ' + ', '.join(f'{kind} {counts[kind]}' for kind in sorted(counts) if kind != 'items'))
+        if verbose:
+            for example in sorted(examples[classKind]):
+                print(f'    {example}')
+
+    return nb_identical == nb_items
+
+
+if __name__ == "__main__":
+    sys.exit(0 if main(**vars(parse_args())) else 1)
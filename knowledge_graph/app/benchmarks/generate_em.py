@@ -0,0 +1,72 @@
+'''
+Generator of synthetic Engineering Models: writes CDP4-shaped exports (SiteDirectory.json, the reference data
+library, EngineeringModel.json and one Iteration file per mission) which can be inserted like real EMs, e.g. with
+`main.py --em_dir_path <outDir>` or by benchmarks/bench_ingest.py. See synthetic.synthetic_engineering_model.
+Run from the app directory:
+    python benchmarks/generate_em.py --outDir datasets_synthetic [--missions 2] [--elements 10000]
+'''
+
+import argparse
+import os
+import sys
+import time
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from migrationTemplates import TEMPLATES
+from templateCompiler import compile_templates, parse_schema
+from synthetic import synthetic_engineering_model, write_engineering_model
+
+
+def parse_args():
+    parser = argparse.ArgumentParser()
+    parser.add_argument(
+        "--outDir", "-o", type=str, required=True,
+        help="Directory the missions are written to, one sub-directory per mission"
+    )
+    parser.add_argument(
+        "--schemaFile", "-sF", type=str, required=False,
+        help="TypeDB schema file the classes and relationships of the items are taken from",
+        default=os.path.join('TypeDB', 'schema', 'TypeDBSchemaECSS_relunique.tql')
+    )
+    parser.add_argument(
+        "--missions", "-m", type=int, required=False,
+        help="Number of missions", default=1
+    )
+    parser.add_argument(
+        "--elements", "-e", type=int, required=False,
+        help="Number of ElementDefinitions per mission", default=1000
+    )
+    parser.add_argument(
+        "--parametersPerElement", "-p", type=int, required=False,
+        help="Number of Parameters per ElementDefinition", default=8
+    )
+    parser.add_argument(
+        "--valueSetsPerParameter", "-v", type=int, required=False,
+        help="Number of ParameterValueSets per Parameter", default=1
+    )
+    parser.add_argument(
+        "--usagesPerElement", "-u", type=int, required=False,
+        help="Number of ElementUsages per ElementDefinition", default=1
+    )
+    parser.add_argument(
+        "--seed", "-s", type=int, required=False,
+        help="Random seed of the first mission, the following missions use the next seeds", default=0
+    )
+    return parser.parse_args()
+
+
+def main(outDir, schemaFile, missions, elements, parametersPerElement, valueSetsPerParameter, usagesPerElement, seed):
+    compiled = compile_templates(schemaFile)
+    schema_types = parse_schema(schemaFile)
+    for mission in range(missions):
+        start = time.perf_counter()
+        files = synthetic_engineering_model(compiled, TEMPLATES, schema_types, elements, parametersPerElement,
+                                            valueSetsPerParameter, usagesPerElement, seed + mission)
+        directory = os.path.join(outDir, f'SyntheticMission{mission + 1}')
+        nb_items = write_engineering_model(directory, files)
+        print(f'{directory}: {nb_items} items in {len(files)} files ({time.perf_counter() - start:.1f}s)')
+
+
+if __name__ == "__main__":
+    main(**vars(parse_args()))
@@ -0,0 +1,241 @@
+'''
+Synthetic Engineering Model items, used to benchmark and compare the migration templates without a real EM export.
+The keys of each item are taken from the compiled template of its class (attributes and relationships of the schema)
+and from the keys read by the hand-written template, shaped the way the hand-written template reads them.
+synthetic_engineering_model builds a whole CDP4-shaped export (SiteDirectory, reference data library, EngineeringModel
+and Iteration files) at a given scale, with a consistent containment tree and references between its items.
+'''
+
+import functools
+import inspect
+import os
+import random
+import re
+import uuid
+from collections import defaultdict
+
+import ujson as json
+
+from templateCompiler import supertypes
+
+WORDS = ('power', 'thermal', 'battery', 'solar', 'array', 'antenna', 'mass', 'payload', 'orbit', 'attitude',
+         'control', 'subsystem', 'structure', 'propulsion', 'tank', 'sensor', 'camera', 'radiator', 'harness', 'data')
+
+
+@functools.lru_cache(maxsize=None)
+def key_shapes(template):
+    '''
+    Shapes of the item keys read by a hand-written template function
+    :param template: template function of migrationTemplates.py
+    :return: dict key -> 'list', 'ordered' (list of {"k", "v"}), 'str' (value converted with str()),
+             'clean' (value array) or 'plain'
+    '''
+    source = inspect.getsource(template)
+    shapes = {}
+    for key in set(re.findall(r'item\["(\w+)"\]', source)):
+        loop = re.search(r'for (\w+) in item\["%s"\]' % key, source)
+        if loop:
+            body = re.split(r'\n    \S', source[loop.end():], 1)[0]
+            ordered = re.search(r'\b%s\[["\']v["\']\]' % loop.group(1), body)
+            shapes[key] = 'ordered' if ordered else 'list'
+        elif re.search(r'item\["%s"\]\[0\]' % key, source):
+            shapes[key] = 'list'
+        elif re.search(r'str\(item\["%s"\]\)' % key, source):
+            shapes[key] = 'str'
+        elif re.search(r'clean\(item\["%s"\]\)' % key, source):
+            shapes[key] = 'clean'
+        else:
+            shapes[key] = 'plain'
+    return shapes
+
+
+def new_id(rng):
+    return str(uuid.UUID(int=rng.getrandbits(128)))
+
+
+def text(rng, nb_words=3):
+    return ' '.join(rng.choice(WORDS) for _ in range(nb_words))
+
+
+def synthetic_item(classKind, compiled, legacy, rng):
+    '''
+    :param classKind: class of the item
+    :param compiled: compiled template of the class
+    :param legacy: hand-written template function of the class
+    :param rng: random.Random
+    :return: item dict
+    '''
+    shapes = key_shapes(legacy) if legacy is not None else {}
+    relationship_keys = {relationship[0] for relationship in compiled.relationships}
+    keys = {key for attribute, key, written in compiled.attributes} | relationship_keys | set(shapes)
+
+    item = {}
+    # sorted, the random draws do not depend on the hash seed
+    for key in sorted(keys):
+        shape = shapes.get(key, 'list' if key in relationship_keys else 'plain')
+        if shape == 'ordered':
+            item[key] = [{'k': rng.randrange(10**6), 'v': new_id(rng) if key in relationship_keys else text(rng)}
+                         for _ in range(rng.randint(1, 3))]
+        elif shape == 'list':
+            item[key] = [new_id(rng) if key in relationship_keys else text(rng) for _ in range(rng.randint(1, 3))]
+        elif shape == 'str':
+            item[key] = rng.random() < 0.5
+        elif shape == 'clean':
+            item[key] = '["%.3f"]' % rng.random()
+        elif key in relationship_keys:
+            item[key] = new_id(rng)
+        else:
+            item[key] = text(rng)
+
+    item['iid'] = new_id(rng)
+    item['classKind'] = classKind
+    item['revisionNumber'] = rng.randint(1, 500)
+    return item
+
+
+def synthetic_items(nb_items, compiled_templates, legacy_templates, classes=None, seed=0):
+    '''
+    :param nb_items: number of items
+    :param compiled_templates: dict classKind -> compiled template
+    :param legacy_templates: dict classKind -> hand-written template function
+    :param classes: classKinds to draw the items from, defaults to all classes with a template
+    :param seed: random seed, the same seed always gives the same items
+    :return: list of items
+    '''
+    rng = random.Random(seed)
+    classes = classes or sorted(compiled_templates)
+    return [synthetic_item(classKind, compiled_templates[classKind], legacy_templates.get(classKind), rng)
+            for classKind in (rng.choice(classes) for _ in range(nb_items))]
+
+
+# Containment tree of a synthetic Engineering Model: (parent classKind, JSON key, child classKind, children per parent).
+# Strings are arguments of synthetic_engineering_model, fractions are averages (e.g. 0.3 definition per element)
+SITE_DIRECTORY_TREE = (
+    ('SiteDirectory', 'domain', 'DomainOfExpertise', 6),
+    ('SiteDirectory', 'person', 'Person', 12),
+    ('SiteDirectory', 'personRole', 'PersonRole', 2),
+    ('SiteDirectory', 'participantRole', 'ParticipantRole', 2),
+    ('SiteDirectory', 'model', 'EngineeringModelSetup', 1),
+    # the hand-written template of EngineeringModelSetup expects at least one participant, as in the exports
+    ('EngineeringModelSetup', 'participant', 'Participant', 2),
+    ('EngineeringModelSetup', 'iterationSetup', 'IterationSetup', 1),
+    ('SiteDirectory', 'siteReferenceDataLibrary', 'SiteReferenceDataLibrary', 1),
+    ('SiteReferenceDataLibrary', 'parameterType', 'SimpleQuantityKind', 30),
+    ('SiteReferenceDataLibrary', 'parameterType', 'TextParameterType', 4),
+    ('SiteReferenceDataLibrary', 'parameterType', 'BooleanParameterType', 3),
+    ('SiteReferenceDataLibrary', 'scale', 'RatioScale', 15),
+    ('SiteReferenceDataLibrary', 'unit', 'SimpleUnit', 15),
+    ('SiteReferenceDataLibrary', 'definedCategory', 'Category', 20),
+)
+ENGINEERING_MODEL_TREE = (
+    ('EngineeringModel', 'iteration', 'Iteration', 1),
+    ('Iteration', 'option', 'Option', 2),
+    ('Iteration', 'element', 'ElementDefinition', 'nb_elements'),
+    ('ElementDefinition', 'parameter', 'Parameter', 'parameters_per_element'),
+    ('ElementDefinition', 'containedElement', 'ElementUsage', 'usages_per_element'),
+    ('ElementDefinition', 'parameterGroup', 'ParameterGroup', 0.5),
+    ('ElementDefinition', 'definition', 'Definition', 0.3),
+    ('Parameter', 'valueSet', 'ParameterValueSet', 'value_sets_per_parameter'),
+)
+
+# Classes whose items are written to their own file, with the items they contain
+FILE_ROOTS = {'SiteDirectory': 'SiteDirectory.json',
+              'SiteReferenceDataLibrary': os.path.join('SiteReferenceDataLibraries', '{iid}.json'),
+              'EngineeringModel': os.path.join('EngineeringModels', '{model}', 'EngineeringModel.json'),
+              'Iteration': os.path.join('EngineeringModels', '{model}', 'Iterations', '{iid}.json')}
+
+
+def items_per_element(parameters_per_element=8, value_sets_per_parameter=1, usages_per_element=1):
+    '''
+    :return: average number of items of the Iteration file per ElementDefinition
+    '''
+    return 1 + parameters_per_element * (1 + value_sets_per_parameter) + usages_per_element + 0.5 + 0.3
+
+
+def synthetic_engineering_model(compiled_templates, legacy_templates, schema_types, nb_elements=1000,
+                                parameters_per_element=8, value_sets_per_parameter=1, usages_per_element=1, seed=0):
+    '''
+    CDP4-shaped export of one mission: the items of the containment trees SITE_DIRECTORY_TREE and
+    ENGINEERING_MODEL_TREE, each with the keys read by both templates of its class. Containment keys list the
+    children of the item, references point to random items of the referenced class (or of its subclasses) if the model
+    has any, other relationship keys are empty
+    :param compiled_templates: dict classKind -> compiled template
+    :param legacy_templates: dict classKind -> hand-written template function
+    :param schema_types: types of the schema, see templateCompiler.parse_schema
+    :param nb_elements: number of ElementDefinitions
+    :param parameters_per_element: number of Parameters per ElementDefinition
+    :param value_sets_per_parameter: number of ParameterValueSets per Parameter
+    :param usages_per_element: number of ElementUsages per ElementDefinition
+    :param seed: random seed, the same seed always gives the same model
+    :return: dict file path, relative to the directory of the mission -> list of items
+    '''
+    rng = random.Random(seed)
+    counts = {'nb_elements': nb_elements, 'parameters_per_element': parameters_per_element,
+              'value_sets_per_parameter': value_sets_per_parameter, 'usages_per_element': usages_per_element}
+    files = defaultdict(list)
+    by_class = defaultdict(list)
+    model_iid = new_id(rng)
+
+    def add(classKind, file):
+        item = synthetic_item(classKind, compiled_templates[classKind], legacy_templates.get(classKind), rng)
+        shapes = key_shapes(legacy_templates[classKind]) if classKind in legacy_templates else {}
+        for key, relation, role1, role2, class2 in compiled_templates[classKind].relationships:
+            item[key] = [] if shapes.get(key, 'list') in ('list', 'ordered') else None
+        if classKind == 'EngineeringModel':
+            item['iid'] = model_iid
+        if classKind in FILE_ROOTS:
+            file = FILE_ROOTS[classKind].format(iid=item['iid'], model=model_iid)
+        files[file].append(item)
+        by_class[classKind].append(item)
+        return item, file
+
+    def grow(item, file, tree):
+        shapes = key_shapes(legacy_templates[item['classKind']]) if item['classKind'] in legacy_templates else {}
+        for parent, key, child, number in tree:
+            if parent != item['classKind']:
+                continue
+            number = counts[number] if isinstance(number, str) else number
+            for _ in range(int(number) + (rng.random() < number % 1)):
+                child_item, child_file = add(child, file)
+                item[key].append({'k': len(item[key]), 'v': child_item['iid']} if shapes.get(key) == 'ordered'
+                                 else child_item['iid'])
+                grow(child_item, child_file, tree)
+
+    for root, tree in (('SiteDirectory', SITE_DIRECTORY_TREE), ('EngineeringModel', ENGINEERING_MODEL_TREE)):
+        grow(*add(root, None), tree)
+
+    # references, to any class inheriting from the referenced one
+    pools = {}
+    for classKind in list(by_class):
+        for parent in supertypes(schema_types, classKind):
+            pools.setdefault(parent, []).extend(item['iid'] for item in by_class[classKind])
+    for classKind, items in by_class.items():
+        shapes = key_shapes(legacy_templates[classKind]) if classKind in legacy_templates else {}
+        references = [(key, class2) for key, relation, role1, role2, class2
+                      in compiled_templates[classKind].relationships
+                      if role1 == 'refersTo' and class2 != 'Thing' and pools.get(class2)]
+        for item in items:
+            for key, class2 in references:
+                shape = shapes.get(key, 'list')
+                if shape == 'plain':
+                    item[key] = rng.choice(pools[class2])
+                elif shape == 'ordered':
+                    item[key] = [{'k': k, 'v': rng.choice(pools[class2])} for k in range(rng.randint(1, 2))]
+                elif shape == 'list':
+                    item[key] = [rng.choice(pools[class2]) for _ in range(rng.randint(1, 2))]
+    return dict(files)
+
+
+def write_engineering_model(directory, files):
+    '''
+    Writes the files of synthetic_engineering_model, one JSON array of items per file
+    :param directory: directory of the mission, as in the datasets directory read by migrate_em_json.load_em_files
+    :param files: dict file path -> list of items
+    :return: number of written items
+    '''
+    for path, items in files.items():
+        path = os.path.join(directory, path)
+        os.makedirs(os.path.dirname(path), exist_ok=True)
+        with open(path, 'w', encoding='utf-8') as file:
+            json.dump(items, file)
+    return sum(len(items) for items in files.values())
@@ -0,0 +1,83 @@
+# This Source Code Form is subject to the terms of the Mozilla Public License, v. 2.0.
+# If a copy of the MPL was not distributed with this file, You can obtain one at https://mozilla.org/MPL/2.0/.
+# ----------------        2022 University of Strathclyde and Author ----------------
+# -------------------------------- Author: Paul Darm --------------------------------
+# ------------------------- e-mail: paul.darm@strath.ac.uk --------------------------
+
+'''
+Loads the .tql shards rendered offline by `main.py --emitTql <dir>` (see migrate_em_json.emit_typeql) into a
+TypeDB database whose schema is already defined: the entity shards first, then the relationship shards, each
+committed by parallel WRITE transactions.
+'''
+
+import argparse
+import time
+
+from typedb.client import SessionType, TypeDBOptions
+
+import migrate_em_json
+from util.telemetry import telemetry
+from util.connection import core_client, use_fake_typedb
+
+
+def parse_args():
+
+    parser = argparse.ArgumentParser()
+
+    parser.add_argument(
+        "--dbName", "-n", type=str, required=True,
+        help="Name of Knowledge Graph"
+    )
+    parser.add_argument(
+        "--tqlDir", "-t", type=str, required=True,
+        help="Directory of the .tql shards and of their manifest"
+    )
+    parser.add_argument(
+        "--writers", "-w", type=int, required=False,
+        help="Number of parallel write transactions", default=4
+    )
+    parser.add_argument(
+        "--address", "-a", type=str, required=False,
+        help="Address of the TypeDB server", default="localhost:1729"
+    )
+    parser.add_argument(
+        "--runReport", "-rR", type=str, required=False,
+        help="JSON report of the run, {} is replaced by the database name",
+        default=migrate_em_json.RUN_REPORT_FILE
+    )
+    parser.add_argument(
+        "--metricsFile", "-mF", type=str, required=False,
+        help="Optional file the metrics of the run are written to in the Prometheus text format"
+    )
+    parser.add_argument(
+        "--fakeTypeDB", "-fT", type=str, required=False,
+        help="Load into the in-process fake TypeDB client instead of a server: true, or path of its .json "
+             "configuration (util/fake_typedb.py)"
+    )
+    return parser.parse_args()
+
+
+def main(dbName, tqlDir, writers, address, runReport, metricsFile, fakeTypeDB=None):
+    if fakeTypeDB:
+        use_fake_typedb(fakeTypeDB)
+    start = time.time()
+    telemetry.reset()
+    telemetry.run.update(dbName=dbName, tqlDir=tqlDir, writers=writers)
+    migrate_em_json.start_rejected_report(dbName)
+
+    with core_client(address) as client:
+        if not client.databases().contains(dbName):
+            print(f'Database {dbName} not found, define its schema first')
+            return
+        options = TypeDBOptions()
+        options.session_idle_timeout_millis = 300_000
+        with client.session(dbName, SessionType.DATA, options) as session:
+            nb_committed = migrate_em_json.load_typeql_shards(session, tqlDir, writers)
+
+    print(f'\n{nb_committed} queries of {tqlDir} loaded into {dbName} in ', round((time.time() - start) / 60, 2),
+          'minutes.')
+    migrate_em_json.write_run_report(dbName, runReport, metricsFile)
+
+
+if __name__ == "__main__":
+    main(**vars(parse_args()))
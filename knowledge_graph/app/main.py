@@ -5,6 +5,10 @@
 # ------------------------- e-mail: paul.darm@strath.ac.uk --------------------------
 import argparse
 import migrate_em_json, similarityMetadata, similarityElements
+from util.telemetry import telemetry
+from util.connection import use_fake_typedb, fake_typedb
+from util.embedding_cache import use_embedding_cache
+from util.embedding_codec import use_embedding_format, FORMATS
 
 def parse_args():
 
@@ -47,17 +51,123 @@ def parse_args():
         "--meta_dir", "-md", type=str, required=False,
         help="Directory to metadata", default='.\\Metadata'
     )
+    parser.add_argument(
+        "--relationshipSpill", "-rS", type=int, required=False,
+        help="Number of relationships kept in memory before they are spilled to disk", default=500_000
+    )
+    parser.add_argument(
+        "--writers", "-w", type=int, required=False,
+        help="Number of parallel write transactions committing entity batches", default=1
+    )
+    parser.add_argument(
+        "--iidMap", "-im",  type=lambda x: (str(x).lower() == 'true'), required=False,
+        help="Record TypeDB iids of inserted entities to match relationships by iid", default=False
+    )
+    parser.add_argument(
+        "--skipExisting", "-sE",  type=lambda x: (str(x).lower() == 'true'), required=False,
+        help="Skip items and relationships already in the Knowledge Graph", default=False
+    )
+    parser.add_argument(
+        "--resume", "-r",  type=lambda x: (str(x).lower() == 'true'), required=False,
+        help="Resume the data insertion from the last checkpoint of the database", default=False
+    )
+    parser.add_argument(
+        "--generatorProcesses", "-gP", type=int, required=False,
+        help="Number of processes parsing EM files and rendering insert queries, 0 renders them while committing",
+        default=0
+    )
+    parser.add_argument(
+        "--missionWorkers", "-mW", type=int, required=False,
+        help="Number of processes inserting missions in parallel, each with its own TypeDB client", default=1
+    )
+    parser.add_argument(
+        "--runReport", "-rR", type=str, required=False,
+        help="JSON report of the run (throughput, commit latencies, retries), {} is replaced by the database name",
+        default=migrate_em_json.RUN_REPORT_FILE
+    )
+    parser.add_argument(
+        "--metricsFile", "-mF", type=str, required=False,
+        help="Optional file the metrics of the run are written to in the Prometheus text format"
+    )
+    parser.add_argument(
+        "--incremental", "-iC",  type=lambda x: (str(x).lower() == 'true'), required=False,
+        help="Only insert new items and re-insert the items whose revisionNumber changed (new EM iterations)",
+        default=False
+    )
+    parser.add_argument(
+        "--emitTql", "--emit-tql", "-eT", type=str, required=False,
+        help="Only render the insert queries of the EMs to .tql shards in this directory, without TypeDB server "
+             "(load them with loadTql.py)"
+    )
+    parser.add_argument(
+        "--shardSize", "-sS", type=int, required=False,
+        help="Maximum number of queries per .tql shard", default=100_000
+    )
+    parser.add_argument(
+        "--fakeTypeDB", "-fT", type=str, required=False,
+        help="Run against the in-process fake TypeDB client instead of a server (to profile the pipelines): "
+             "true, or path of a .json file with its canned answers and simulated latencies (util/fake_typedb.py)"
+    )
+    parser.add_argument(
+        "--encodeBatchSize", "-eB", type=int, required=False,
+        help="Number of texts (metadata values, element names) encoded per forward pass of the sentence transformer",
+        default=64
+    )
+    parser.add_argument(
+        "--embeddingCache", "-eC", type=str, required=False,
+        help="Directory of the persistent cache of the embeddings of metadata values and element names (default "
+             "app/embeddingCache), empty to disable it"
+    )
+    parser.add_argument(
+        "--embeddingFormat", "-eF", type=str, required=False, choices=list(FORMATS) + ['text'],
+        help="Format of the s_bert_embedding attributes written: base64 of the float32 or float16 vector, or the "
+             "legacy text of the list of floats (util/embedding_codec.py)", default='float32'
+    )
+    parser.add_argument(
+        "--dryRun", "-dry", type=lambda x: (str(x).lower() == 'true'), required=False,
+        help="Only list the EM files in insertion order, their schedule on the mission workers and the predicted "
+             "wall time (from the throughput of the previous run report), without inserting anything",
+        default=False
+    )
     return parser.parse_args()
 
 
-def main(dbName, defineSchema, schemaFile, defineRules, rulesFile, insertData, em_dir_path, insertMetadata, meta_dir):
+def main(dbName, defineSchema, schemaFile, defineRules, rulesFile, insertData, em_dir_path, insertMetadata, meta_dir,
+         relationshipSpill, writers, iidMap, skipExisting, resume, generatorProcesses,
+         missionWorkers, runReport, metricsFile, incremental, emitTql, shardSize, fakeTypeDB, dryRun,
+         encodeBatchSize, embeddingCache, embeddingFormat='float32'):
+
+    if fakeTypeDB:
+        use_fake_typedb(fakeTypeDB)
+    if embeddingCache is not None:
+        use_embedding_cache(embeddingCache)
+    use_embedding_format(embeddingFormat)
 
     ## inserts data into KG
-    migrate_em_json.main(dbName, defineSchema, schemaFile, defineRules, rulesFile, insertData, em_dir_path, insertMetadata, meta_dir)
+    migrate_em_json.main(dbName, defineSchema, schemaFile, defineRules, rulesFile, insertData, em_dir_path, insertMetadata, meta_dir,
+                         relationship_spill=relationshipSpill, writers=writers, use_iid_map=iidMap,
+                         skip_existing=skipExisting, resume=resume, generator_processes=generatorProcesses,
+                         mission_workers=missionWorkers,
+                         report_file=runReport, metrics_file=metricsFile, emit_tql=emitTql, shard_size=shardSize,
+                         incremental=incremental, dry_run_only=dryRun,
+                         encode_batch_size=encodeBatchSize)
+    if emitTql or dryRun:
+        ## nothing is inserted into the KG (with emitTql the similarity stages run after loading the shards)
+        return
     ## insert Metadata similarity relationships
-    similarityMetadata.main(dbName)
+    with telemetry.timer('stage_seconds', stage='similarity_metadata'):
+        similarityMetadata.main(dbName)
     ## insert Element similarity
-    similarityElements.main(dbName)
+    with telemetry.timer('stage_seconds', stage='similarity_elements'):
+        similarityElements.main(dbName, encodeBatchSize)
+    ## the report written by the migration is completed with the timings of the similarity stages
+    if runReport:
+        telemetry.write_json(runReport.format(dbName))
+    if metricsFile:
+        telemetry.write_prometheus(metricsFile)
+    if fake_typedb() is not None:
+        print(f'Fake TypeDB: {len(fake_typedb().queries)} queries in {fake_typedb().nb_commits} commits '
+              f'recorded by the main process')
 
 if __name__ == "__main__":
     main(**vars(parse_args()))
\ No newline at end of file
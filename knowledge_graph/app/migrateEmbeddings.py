@@ -0,0 +1,129 @@
+# This Source Code Form is subject to the terms of the Mozilla Public License, v. 2.0.
+# If a copy of the MPL was not distributed with this file, You can obtain one at https://mozilla.org/MPL/2.0/.
+# ----------------        2022 University of Strathclyde and Author ----------------
+# -------------------------------- Author: Paul Darm --------------------------------
+# ------------------------- e-mail: paul.darm@strath.ac.uk --------------------------
+
+'''
+Rewrites the s_bert_embedding attributes of a KG still in the legacy text format (str of the list of floats) in the
+compact format of util/embedding_codec.py, in place: each owner gets the re-encoded value instead of the legacy one,
+then the legacy attributes no longer owned are deleted. Can be interrupted and run again, only the legacy values
+left are read.
+'''
+
+import argparse
+import time
+
+from typedb.client import SessionType, TransactionType, TypeDBOptions
+
+from util.telemetry import telemetry
+from util.connection import core_client, use_fake_typedb
+from util.embedding_codec import FORMATS, encode_embedding, decode_embedding
+
+# s_bert_embedding values in the legacy format, which all start with the "[" of the list
+LEGACY_PATTERN = '^\\\\['
+
+
+def parse_args():
+
+    parser = argparse.ArgumentParser()
+
+    parser.add_argument(
+        "--dbName", "-n", type=str, required=True,
+        help="Name of Knowledge Graph"
+    )
+    parser.add_argument(
+        "--format", "-f", type=str, required=False, choices=list(FORMATS),
+        help="Format the embeddings are rewritten in", default='float32'
+    )
+    parser.add_argument(
+        "--batchSize", "-b", type=int, required=False,
+        help="Number of owners whose embedding is rewritten per write transaction", default=500
+    )
+    parser.add_argument(
+        "--address", "-a", type=str, required=False,
+        help="Address of the TypeDB server", default="localhost:1729"
+    )
+    parser.add_argument(
+        "--fakeTypeDB", "-fT", type=str, required=False,
+        help="Run against the in-process fake TypeDB client instead of a server: true, or path of its .json "
+             "configuration (util/fake_typedb.py)"
+    )
+    return parser.parse_args()
+
+
+def read_legacy(session, batch_size):
+    '''
+    :return: list of (owner iid, attribute iid, legacy value) of at most batch_size owners of a legacy embedding
+    '''
+    query = f'match $x has s_bert_embedding $e; $e like "{LEGACY_PATTERN}"; get $x, $e; limit {batch_size};'
+    with session.transaction(TransactionType.READ) as read_transaction:
+        return [(ans.get('x').get_iid(), ans.get('e').get_iid(), ans.get('e').get_value())
+                for ans in read_transaction.query().match(query)]
+
+
+def rewrite(session, owners, format):
+    '''
+    Replaces the legacy embedding of the owners by the re-encoded one, in one write transaction
+    :param owners: list of (owner iid, attribute iid, legacy value), see read_legacy
+    :return: number of characters saved
+    '''
+    encoded = {}
+    saved = 0
+    with session.transaction(TransactionType.WRITE) as write_transaction:
+        for owner, attribute, value in owners:
+            if value not in encoded:
+                encoded[value] = encode_embedding(decode_embedding(value), format)
+            # the ownership, not the attribute: owners of the same value beyond this batch keep it until their turn
+            write_transaction.query().delete(f'match $x iid {owner}; $e iid {attribute}; delete $x has $e;')
+            write_transaction.query().insert(f'match $x iid {owner}; insert $x has s_bert_embedding '
+                                             f'"{encoded[value]}";')
+            saved += len(value) - len(encoded[value])
+        write_transaction.commit()
+    return saved
+
+
+def delete_orphans(session):
+    '''
+    Deletes the legacy embeddings no longer owned by any concept
+    '''
+    with session.transaction(TransactionType.WRITE) as write_transaction:
+        write_transaction.query().delete(f'match $e isa s_bert_embedding; $e like "{LEGACY_PATTERN}"; '
+                                         f'not {{ $x has $e; }}; delete $e isa s_bert_embedding;')
+        write_transaction.commit()
+
+
+def main(dbName, format, batchSize, address, fakeTypeDB=None):
+    if fakeTypeDB:
+        use_fake_typedb(fakeTypeDB)
+    start = time.time()
+    nb_owners = 0
+    saved = 0
+    rewritten = set()
+
+    with core_client(address) as client:
+        if not client.databases().contains(dbName):
+            print(f'Database {dbName} not found')
+            return
+        options = TypeDBOptions()
+        options.session_idle_timeout_millis = 300_000
+        with client.session(dbName, SessionType.DATA, options) as session:
+            while True:
+                owners = [owner for owner in read_legacy(session, batchSize) if owner[:2] not in rewritten]
+                # nothing left, or only owners whose rewrite was not seen by the read (no progress possible)
+                if not owners:
+                    break
+                with telemetry.timer('embedding_migration_batch'):
+                    saved += rewrite(session, owners, format)
+                rewritten.update(owner[:2] for owner in owners)
+                nb_owners += len(owners)
+                telemetry.count('embeddings_migrated', len(owners), format=format)
+                print(f'{nb_owners} embeddings rewritten, {saved / 2 ** 20:.1f} MB saved')
+            delete_orphans(session)
+
+    print(f'\n{nb_owners} s_bert_embedding values of {dbName} rewritten in {format} in ',
+          round((time.time() - start) / 60, 2), f'minutes, {saved / 2 ** 20:.1f} MB saved.')
+
+
+if __name__ == "__main__":
+    main(**vars(parse_args()))
@@ -24,6 +24,10 @@ import sys, os
 from fnmatch import fnmatch
 import ujson as json
 import time
+import traceback
+import multiprocessing
+from concurrent.futures import ProcessPoolExecutor, as_completed
+from queue import Empty
 import uuid
 try:
     import pathlib
@@ -33,139 +37,533 @@ import logging
 
 from typedb.client import *
 from migrationTemplates import *
+from util.relationships import RelationshipSink, RelationshipBuffer
+from util.writers import BatchWriterPool
+from util.idmap import IidMap
+from util.checkpoint import Checkpoint
+from util.batching import AdaptiveBatchSize, commit_batch, start_rejected_report
+from util.telemetry import Telemetry, telemetry
+from util.tqlshards import ShardWriter, iter_shard, write_manifest, read_manifest
+from util.connection import core_client
+from util.scheduling import discover_em_files, print_schedule
 from collections import Counter
 from tqdm import tqdm
-from util.utils import (load_Acronyms, replace_Acronyms, typeql_batch_insertion)
+from util.utils import (typeql_batch_insertion, iter_json_array)
+from util.normalization import get_normalizer
+from util.embedding_cache import encode_cached, get_embedding_cache
+from util.embedding_codec import encode_embedding
 
 from sentence_transformers import SentenceTransformer, util
 
+# Machine-readable report of the run written at the end of main, see util/telemetry.py
+RUN_REPORT_FILE = 'runReport_{}.json'
+
+# Maximum number of rendered chunks of items waiting to be committed, per EM file rendered by a worker process
+RENDERING_QUEUE_SIZE = 64
+# Spill file of the relationships collected for each mission
+RELATIONSHIPS_SPILL_FILE = 'tempRelationships_{}.jsonl'
+# Number of metadata strings encoded per forward pass of the sentence transformer
+METADATA_ENCODE_BATCH_SIZE = 64
+# Sentence transformer embedding the metadata, also the key of its vectors in the embedding cache
+SBERT_MODEL = 'all-mpnet-base-v2'
+# Namespace of the uuid5 ids of the metadata entities and relations, see metadata_id
+METADATA_NAMESPACE = uuid.UUID('6f1c8f5e-3b0a-5d8e-9c1e-2a7d4b6e8f10')
+
 # --------------------------
 # Methods
 # --------------------------
-def build_engineering_model_graph(em_files, session, Templates):
+def build_engineering_model_graph(em_files, session, Templates, spill_threshold=500_000, writers=1, iid_map=None,
+                                  existing_ids=None, existing_rel_ids=None, mission='', checkpoint=None,
+                                  generator_processes=0):
     """
     Function to insert entities and attributes into a TypeDB database
     :param inputs: .json files containing all data on one Engineering Model
     :param data_path: file path of .json files
     :param session: running TypeDB session where data is being migrated
     :param Templates: function templates used to build the insert queries
+    :param spill_threshold: number of relationships kept in memory before they are spilled to disk
+    :param writers: number of entity batches committed concurrently
+    :param iid_map: optional IidMap recording the TypeDB iid of each inserted entity, used to match relationships
+    :param existing_ids: optional set of ids already in the database, these items are not inserted again, or dict
+                         id -> revisionNumber (incremental ingest, see fetch_existing_revisions): items of another
+                         revision are deleted with their relations and inserted again
+    :param existing_rel_ids: optional set of rel-ids already in the database, these relationships are not inserted again
+    :param mission: name of the mission the EM files belong to
+    :param checkpoint: optional Checkpoint recording the progress, finished files and committed items are skipped
+    :param generator_processes: If > 0, parse the EM files and render their queries in that many worker processes,
+                                while this process commits the rendered queries
+    """
+    if checkpoint is not None and checkpoint.is_mission_done(mission):
+        print(f'Engineering Model of the "{mission}" mission already inserted according to checkpoint')
+        return
+
+    sink, failed = load_mission_entities(em_files, session, Templates, spill_threshold, writers, iid_map, existing_ids,
+                                         mission, checkpoint, generator_processes, existing_rel_ids)
+    # checkpoint stays at the last batch committed before a failure, to be resumed from there
+    load_mission_relationships(session, sink, iid_map, existing_rel_ids, mission, None if failed else checkpoint)
+
+    return
+
+def load_mission_entities(em_files, session, Templates, spill_threshold=500_000, writers=1, iid_map=None,
+                          existing_ids=None, mission='', checkpoint=None, generator_processes=0, existing_rel_ids=None):
+    """
+    Entity phase of build_engineering_model_graph: inserts the items of all EM files of one mission and collects
+    their relationships, parameters as in build_engineering_model_graph. The rel-ids of the relations deleted with
+    changed items (incremental ingest) are removed from existing_rel_ids
+    :return: (RelationshipSink holding the relationships of the mission, number of batches which could not be committed)
     """
     #inputs, data_path
-    #Init json file containing all relationships
-    init = {'relationship': [], 'role1': [], 'class1': [], 'player1': [], 'role2': [], 'class2': [],
-            'player2': []}
-    with open('tempRelationships.json', 'w') as file:
-        json.dump(init, file)
+    #Init sink collecting all relationships written by the templates, one spill file per mission to resume from
+    sink = RelationshipSink(RELATIONSHIPS_SPILL_FILE.format(mission), spill_threshold)
+    if checkpoint is not None:
+        sink.restore(checkpoint.mission(mission)['relationships'])
+        checkpoint.sink = sink
+    set_relationship_sink(sink)
+
+    pending_files = []
+    for path in em_files:
+        tem_path = pathlib.Path(path)
+        if checkpoint is not None and checkpoint.is_file_done(mission, tem_path):
+            print("Skipping " + str(tem_path) + ", already inserted according to checkpoint")
+            continue
+        pending_files.append(tem_path)
+
+    # Queries of all files are rendered ahead by the worker processes, each file through its own bounded queue
+    start_offsets = {tem_path: checkpoint.file_offset(mission, tem_path) for tem_path in pending_files} \
+        if checkpoint is not None else None
+    executor, manager, renderings = start_rendering_workers(pending_files, Templates, generator_processes,
+                                                            start_offsets)
 
     # Insert all entities with their attributes, identify entities's roles and relationship partners
-    i=0
-    for path in em_files:
+    nb_failed = 0
+    for tem_path in pending_files:
 
-        tem_path = pathlib.Path(path)
         #input = pathlib.Path(tem_path, input + '.json')
         print("Loading from " + str(tem_path) + " into TypeDB ...")##.json
-        load_data_into_typedb(tem_path, session, Templates)
-        i=i+1
+        rendered = iter_rendered_queue(*renderings[tem_path], sink) if tem_path in renderings else None
+        with telemetry.timer('phase_seconds', kind='Entity', mission=mission):
+            failed = load_data_into_typedb(tem_path, session, Templates, writers, iid_map, existing_ids, mission,
+                                           checkpoint, rendered, existing_rel_ids)
+        if tem_path in renderings:
+            # rendering timings of the worker process
+            telemetry.merge(renderings[tem_path][1].result())
+        nb_failed += len(failed)
+        if checkpoint is not None:
+            if failed:
+                print(f'--> Checkpoint of "{mission}" not updated anymore in this run, rerun to resume')
+                checkpoint.sink = None
+                checkpoint = None
+            else:
+                checkpoint.file_done(mission, tem_path, len(sink))
 
+    if executor is not None:
+        executor.shutdown()
+        manager.shutdown()
+    if checkpoint is not None:
+        checkpoint.sink = None
+
+    return sink, nb_failed
+
+def start_rendering_workers(em_files, Templates, generator_processes, start_offsets=None):
+    '''
+    Starts rendering EM files in worker processes ahead of their insertion, see render_em_file_worker
+    :param em_files: list of EM files, rendered in this order
+    :param generator_processes: number of worker processes, nothing is started if 0
+    :param start_offsets: optional dict EM file -> number of items at the start of the file to skip
+    :return: (executor, manager, dict EM file -> (queue, future) to read with iter_rendered_queue), the executor
+             and manager are None if no process is started
+    '''
+    if generator_processes <= 0:
+        return None, None, {}
+    manager = multiprocessing.Manager()
+    executor = ProcessPoolExecutor(max_workers=generator_processes)
+    renderings = {}
+    for tem_path in em_files:
+        queue = manager.Queue(maxsize=RENDERING_QUEUE_SIZE)
+        start_offset = start_offsets.get(tem_path, 0) if start_offsets is not None else 0
+        future = executor.submit(render_em_file_worker, tem_path, Templates, start_offset, queue)
+        renderings[tem_path] = (queue, future)
+    return executor, manager, renderings
+
+def load_mission_relationships(session, sink, iid_map=None, existing_rel_ids=None, mission='', checkpoint=None):
+    """
+    Relationship phase of build_engineering_model_graph: inserts the relationships collected for one mission
+    :param sink: RelationshipSink returned by load_mission_entities
+    :param checkpoint: optional Checkpoint, records that the relationships of the mission are inserted
+    :return: number of relationships of the mission
+    """
     # Insert all relationships
-    load_relationships_into_typedb(session)
+    with telemetry.timer('phase_seconds', kind='Relationship', mission=mission):
+        load_relationships_into_typedb(session, sink, iid_map, existing_rel_ids)
+    nb_relationships = len(sink)
+    if checkpoint is not None:
+        checkpoint.relationships_done(mission)
+    sink.clear()
 
-    return
+    return nb_relationships
+
+# Settings of the processes inserting missions in parallel, set by init_mission_worker
+mission_worker_settings = {}
 
-def commitRelationships(session, file):
+def init_mission_worker(settings, lock):
+    '''
+    Initializer of the processes inserting missions, the settings are sent once per process instead of with each task
+    :param settings: dict of the arguments shared by all missions, see build_missions_in_parallel
+    :param lock: multiprocessing lock shared by the checkpoints and iid maps of all processes
+    '''
+    mission_worker_settings.update(settings)
+    mission_worker_settings['lock'] = lock
+    start_rejected_report(settings['dbName'], truncate=False)
+
+def open_mission_worker_session(client):
+    options = TypeDBOptions()
+    options.session_idle_timeout_millis = 300_000
+    return client.session(mission_worker_settings['dbName'], SessionType.DATA, options)
+
+def mission_entities_worker(mission, em_files):
+    '''
+    Entity phase of one mission in a worker process, with its own TypeDB client and session
+    :return: summary of the phase
+    '''
+    settings = mission_worker_settings
+    start = time.time()
+    # the process may have inserted other missions before, only the telemetry of this mission is sent back
+    telemetry.reset()
+    checkpoint = Checkpoint(settings['checkpoint_path'], lock=settings['lock'])
+    if checkpoint.is_mission_done(mission):
+        print(f'Engineering Model of the "{mission}" mission already inserted according to checkpoint')
+        return {'files': len(em_files), 'done': True}
+    iid_map = IidMap(settings['iid_map_path'], settings['lock']) if settings['iid_map_path'] else None
+
+    print(f'Inserting Engineering Model of the "{mission}" mission')
+    with core_client(settings['address']) as client:
+        with open_mission_worker_session(client) as session:
+            sink, failed = load_mission_entities(em_files, session, settings['Templates'], settings['spill_threshold'],
+                                                 settings['writers'], iid_map, settings['existing_ids'], mission,
+                                                 checkpoint, settings['generator_processes'],
+                                                 settings['existing_rel_ids'])
+    # the relationship phase may run in another process, it reads them back from the spill file
+    sink.flush()
+    return {'files': len(em_files), 'done': False, 'failed_batches': failed, 'relationships': len(sink),
+            'entities_minutes': round((time.time() - start) / 60, 2), 'telemetry': telemetry.state()}
+
+def mission_relationships_worker(mission, nb_relationships, failed_batches):
+    '''
+    Relationship phase of one mission in a worker process, with its own TypeDB client and session
+    :param nb_relationships: number of relationships in the spill file of the mission
+    :param failed_batches: number of entity batches which failed, the checkpoint is not completed if any
+    :return: summary of the phase
+    '''
+    settings = mission_worker_settings
+    start = time.time()
+    telemetry.reset()
+    checkpoint = Checkpoint(settings['checkpoint_path'], lock=settings['lock']) if not failed_batches else None
+    iid_map = IidMap(settings['iid_map_path'], settings['lock']) if settings['iid_map_path'] else None
+    sink = RelationshipSink(RELATIONSHIPS_SPILL_FILE.format(mission), settings['spill_threshold'])
+    sink.restore(nb_relationships)
+
+    with core_client(settings['address']) as client:
+        with open_mission_worker_session(client) as session:
+            existing_rel_ids = settings['existing_rel_ids']
+            if isinstance(settings['existing_ids'], dict):
+                # relations of changed items may have been deleted by the entity phase of any process
+                existing_rel_ids = fetch_existing_ids(session, 'rel-id')
+            load_mission_relationships(session, sink, iid_map, existing_rel_ids, mission, checkpoint)
+    return {'relationships_minutes': round((time.time() - start) / 60, 2), 'telemetry': telemetry.state()}
+
+def build_missions_in_parallel(em_list, mission_workers, settings):
+    '''
+    Inserts the Engineering Models of several missions in parallel, one mission per worker process.
+    The entity phases of all missions run first, the relationship phases only start once all entities are inserted:
+    they do not contend with the entity inserts anymore, and relationships to reference data inserted by another
+    mission find their players.
+    :param em_list: dict mission -> list of EM files, see load_em_files
+    :param mission_workers: number of worker processes
+    :param settings: dict of the arguments shared by all missions: dbName, address, Templates, spill_threshold,
+                     writers, iid_map_path, existing_ids, existing_rel_ids, checkpoint_path, generator_processes
+    :return: dict mission -> summary, the telemetry of the workers is merged into the telemetry of this process
+    '''
+    summary = {mission: {} for mission in em_list}
+    with ProcessPoolExecutor(max_workers=mission_workers, initializer=init_mission_worker,
+                             initargs=(settings, multiprocessing.Lock())) as executor:
+        futures = {executor.submit(mission_entities_worker, mission, paths): mission
+                   for mission, paths in em_list.items()}
+        for future in as_completed(futures):
+            mission = futures[future]
+            try:
+                result = future.result()
+                telemetry.merge(result.pop('telemetry', {'counters': {}, 'samples': {}}))
+                summary[mission].update(result)
+            except Exception as error:
+                logging.error(f'Insertion of the entities of "{mission}" failed: {error}')
+                summary[mission]['error'] = repr(error)
+
+        print(f'\nEntities of {len(em_list)} missions inserted, inserting relationships...')
+        futures = {executor.submit(mission_relationships_worker, mission, result['relationships'],
+                                   result['failed_batches']): mission
+                   for mission, result in summary.items() if 'error' not in result and not result['done']}
+        for future in as_completed(futures):
+            mission = futures[future]
+            try:
+                result = future.result()
+                telemetry.merge(result.pop('telemetry', {'counters': {}, 'samples': {}}))
+                summary[mission].update(result)
+            except Exception as error:
+                logging.error(f'Insertion of the relationships of "{mission}" failed: {error}')
+                summary[mission]['error'] = repr(error)
+
+    print_missions_summary(summary)
+    return summary
+
+def print_missions_summary(summary):
+    print("\n --------------------------------------------------------- ")
+    print(f'Summary of the insertion of {len(summary)} missions:')
+    for mission, result in sorted(summary.items()):
+        if 'error' in result:
+            status = 'FAILED ' + result['error']
+        elif result.get('done'):
+            status = 'already inserted according to checkpoint'
+        else:
+            status = f"{result['relationships']} relationships, {result['failed_batches']} failed batches, " \
+                     f"entities {result['entities_minutes']} min, " \
+                     f"relationships {result.get('relationships_minutes', '-')} min"
+        print(f' | {mission} | {result.get("files", 0)} files | {status}')
+    print(f"Total: {sum(result.get('files', 0) for result in summary.values())} files, "
+          f"{sum(result.get('relationships', 0) for result in summary.values())} relationships, "
+          f"{sum(result.get('failed_batches', 0) for result in summary.values())} failed batches, "
+          f"{sum('error' in result for result in summary.values())} missions failed")
+
+def commitRelationships(session, sink, iid_map=None, existing_rel_ids=None):
     '''
     Function to insert relationships in TypeDB session
     :param session: running TypeDB session where data is being migrated
-    :param file: .json file storing information on relationships
+    :param sink: RelationshipSink storing information on relationships
+    :param iid_map: optional IidMap, players found in it are matched by iid instead of by class and id attribute
+    :param existing_rel_ids: optional set of rel-ids already in the database, these relationships are skipped
     '''
 
-    # Load data contained in tempRelationships.json
-    with open(file, 'r') as infile:
-        input = json.load(infile)
-        relationship=input["relationship"]
-        role1=input["role1"]
-        class1=input["class1"]
-        player1=input["player1"]
-        role2=input["role2"]
-        class2=input["class2"]
-        player2=input["player2"]
-
     #write insert query for each relationship
 
-    counter = 0
-    batch = 128
+    adaptive_size = AdaptiveBatchSize(128)
     batch_query = []
-    for item_count, idx in enumerate(tqdm(range(len(relationship)))):
-        # match player 1
-        typeql_insert_query = 'match $player1 isa ' + class1[idx] + ', has id "' + player1[idx] + '";'
-        # match player 2
-        typeql_insert_query += ' $player2 isa ' + class2[idx] + ', has id "' + player2[idx] + '";'
-        # write insert relationship query
-        # typeql_insert_query += " insert (" + role1[idx] + ": $player1, " + role2[idx] + ": $player2) isa " + \
-        #                        relationship[idx] + ";"
-        typeql_insert_query += " insert (" + role1[idx] + ": $player1, " + role2[idx] + ": $player2) isa " + \
-                                relationship[idx] +', has rel-id "' +player1[idx]+player2[idx]+'";'
-        counter += 1
-        if counter < batch and item_count != len(relationship) - 1:
-            # batch_query.append(input["template"](item))
-            batch_query.append(typeql_insert_query)
-
-        else:
-            with session.transaction(TransactionType.WRITE) as transaction:
-                # batch_query.append(input["template"](item))
-                batch_query.append(typeql_insert_query)
-                # print("Executing TypeQL BatchQuery: \n" + "\n".join([query for query in batch_query]))
-                for query in batch_query:
-                    transaction.query().insert(query)
-
-                # transaction.commit()
-                # counter = 0
-                # batch_query = []
-                ## tries to commit the files, throws error if they are already in the KG (checks unique id for each item)
-                try:
-                    transaction.commit()
-                except TypeDBClientException:
-                    transaction.close()
-                    for query in batch_query:
-
-                        try:
-                            with session.transaction(TransactionType.WRITE) as transaction:
-                                transaction.query().insert(query)
-                                transaction.commit()
-                                print('Inserted Query: ' + query)
-                        except:
-                            # print('--> Query throws exception:')
-                            # print(query)
-                            logging.info('Relationship already in Knowledge Graph ' + query)
-
-                counter = 0
-                batch_query = []
-
+    batch_bytes = 0
+    skipped = 0
+    # players matched by iid, or by class and id attribute (fallback for players missing from the iid map)
+    matched = Counter()
+    for relationship, role1, class1, player1, role2, class2, player2 in tqdm(sink, total=len(sink)):
+        if existing_rel_ids is not None and player1 + player2 in existing_rel_ids:
+            skipped += 1
+            continue
+        iid1 = iid_map.get(player1) if iid_map is not None else None
+        iid2 = iid_map.get(player2) if iid_map is not None else None
+        matched['iid' if iid1 else 'attribute'] += 1
+        matched['iid' if iid2 else 'attribute'] += 1
+        typeql_insert_query = relationship_query(relationship, role1, class1, player1, role2, class2, player2,
+                                                 iid1, iid2)
+        # batch_query.append(input["template"](item))
+        batch_query.append(typeql_insert_query)
+        batch_bytes += len(typeql_insert_query)
+        if adaptive_size.full(len(batch_query), batch_bytes):
+            ## tries to commit the batch, bisects it if some are already in the KG (checks unique rel-id)
+            commit_batch(session, batch_query, 'Relationship', adaptive_size=adaptive_size)
+            batch_query = []
+            batch_bytes = 0
+
+    commit_batch(session, batch_query, 'Relationship', adaptive_size=adaptive_size)
+    if skipped:
+        print(f'{skipped} relationships already in Knowledge Graph skipped')
+    telemetry.count('skipped_existing', skipped, kind='Relationship')
+    for match, value in matched.items():
+        telemetry.count('players_matched', value, match=match)
 
     return
 
-def load_relationships_into_typedb(session):
+def relationship_query(relationship, role1, class1, player1, role2, class2, player2, iid1=None, iid2=None):
+    '''
+    :param iid1: optional TypeDB iid of player 1, matched by class and id attribute otherwise
+    :param iid2: optional TypeDB iid of player 2
+    :return: insert query of one relationship collected by the templates
+    '''
+    # match player 1, directly by iid if known
+    if iid1:
+        typeql_insert_query = 'match $player1 iid ' + iid1 + ';'
+    else:
+        typeql_insert_query = 'match $player1 isa ' + class1 + ', has id "' + player1 + '";'
+    # match player 2
+    if iid2:
+        typeql_insert_query += ' $player2 iid ' + iid2 + ';'
+    else:
+        typeql_insert_query += ' $player2 isa ' + class2 + ', has id "' + player2 + '";'
+    # write insert relationship query
+    # typeql_insert_query += " insert (" + role1 + ": $player1, " + role2 + ": $player2) isa " + \
+    #                        relationship + ";"
+    typeql_insert_query += " insert (" + role1 + ": $player1, " + role2 + ": $player2) isa " + \
+                            relationship +', has rel-id "' +player1+player2+'";'
+    return typeql_insert_query
+
+def load_relationships_into_typedb(session, sink, iid_map=None, existing_rel_ids=None):
     """
     Provides an overview of detected relationships, before inserting them into TypeDB KG
     :param session: running TypeDB session where data is being migrated
+    :param sink: RelationshipSink holding the relationships collected by the templates
+    :param iid_map: optional IidMap used to match the players of the relationships by iid
+    :param existing_rel_ids: optional set of rel-ids already in the database, these relationships are skipped
     """
     #  Relationships
-    with open('tempRelationships.json', 'r') as infile:
-        input = json.load(infile)
     print("\n --------------------------------------------------------- ")
-    print("Detection of", len(input["relationship"]), "relationships:")
-    counter = Counter(input["relationship"])
-    for key, value in counter.most_common():
+    print("Detection of", len(sink), "relationships:")
+    for key, value in sink.counts.most_common():
         print(' | ', key, ' | ', value)
+    if iid_map is not None:
+        # players inserted without recording their iid (e.g. in a previous run) are resolved in bulk
+        players = {player for row in sink for player in (row[3], row[6]) if player not in iid_map
+                   and (existing_rel_ids is None or row[3] + row[6] not in existing_rel_ids)}
+        if players:
+            print(f'Resolving iids of {len(players)} relationship players...')
+            print(f'{iid_map.resolve(session, players)} iids resolved')
     print("Insertion of Relationships: Start...")
-    commitRelationships(session, 'tempRelationships.json')
+    commitRelationships(session, sink, iid_map, existing_rel_ids)
     print("Insertion of Relationships: Success!")
 
     return
 
-def load_data_into_typedb(input, session, Templates):
+def fetch_existing_revisions(session):
+    '''
+    Streams the ids of all items in the database with their revisionNumber, used by the incremental ingest
+    :param session: running TypeDB session
+    :return: dict id -> revisionNumber (None for items without revisionNumber)
+    '''
+    revisions = dict.fromkeys(fetch_existing_ids(session, 'id'))
+    with session.transaction(TransactionType.READ) as transaction:
+        iterator = transaction.query().match('match $x has id $id, has revisionNumber $revision; get $id, $revision;')
+        for ans in iterator:
+            revisions[ans.get('id').get_value()] = ans.get('revision').get_value()
+    return revisions
+
+def delete_items(session, ids, existing_rel_ids=None):
+    '''
+    Deletes the entities of an older revision of some items, with the relations they play in (their relationships
+    are inserted again by the relationship phase, relationships from items of other missions are restored once these
+    missions are ingested again), in a single WRITE transaction
+    :param session: running TypeDB session
+    :param ids: CDP4 ids of the items
+    :param existing_rel_ids: optional set of rel-ids already in the database, the rel-ids of the deleted relations
+                             are removed from it
+    :return: set of rel-ids of the deleted relationships
+    '''
+    deleted_rel_ids = set()
+    with session.transaction(TransactionType.WRITE) as transaction:
+        for id in ids:
+            match = f'match $x isa entity, has id "{id}";'
+            for ans in transaction.query().match(match + ' $r ($x) isa relation, has rel-id $rel; get $rel;'):
+                deleted_rel_ids.add(ans.get('rel').get_value())
+            transaction.query().delete(match + ' $r ($x) isa relation; delete $r isa relation;')
+            transaction.query().delete(match + ' delete $x isa entity;')
+        transaction.commit()
+    if existing_rel_ids is not None:
+        existing_rel_ids.difference_update(deleted_rel_ids)
+    telemetry.count('deleted_relationships', len(deleted_rel_ids))
+    return deleted_rel_ids
+
+def fetch_existing_ids(session, attribute='id'):
+    '''
+    Streams all values of an identifier attribute owned by data in the database, used to skip items
+    and relationships already inserted by a previous run
+    :param session: running TypeDB session
+    :param attribute: identifier attribute, "id" for entities or "rel-id" for relationships
+    :return: set of attribute values
+    '''
+    with session.transaction(TransactionType.READ) as transaction:
+        iterator = transaction.query().match(f'match $x has {attribute} $value; get $value;')
+        return {ans.get('value').get_value() for ans in iterator}
+
+def render_items(input, Templates, start_offset=0, stats=None):
+    '''
+    Streams the items of an EM file and builds their insert queries with the templates,
+    the relationships are written by the templates into the current relationship sink
+    :param input: .json file containing the classes and classes' data to parse and migrate
+    :param Templates: function templates used to build the insert queries
+    :param start_offset: number of items at the start of the file to skip
+    :param stats: Telemetry counting the items rendered and the rendering time per classKind, by default the
+                  telemetry of the run
+    :return: generator of (item index, classKind, id, revisionNumber, insert query or None if the class has no
+             template)
+    '''
+    stats = stats if stats is not None else telemetry
+    # counted locally and added to the telemetry once the file is done
+    nb_rendered, render_seconds = Counter(), Counter()
+    try:
+        for item_index, item in enumerate(iter_json_array(input)):
+            if item_index < start_offset:
+                continue
+            classKind = item["classKind"]
+            if classKind in Templates:
+                start = time.perf_counter()
+                typeql_insert_query = Templates[classKind](item).replace('\\', '')
+                render_seconds[classKind] += time.perf_counter() - start
+                nb_rendered[classKind] += 1
+                yield item_index, classKind, item["iid"], item.get("revisionNumber"), typeql_insert_query
+            else:
+                stats.count('missing_templates', classKind=classKind)
+                yield item_index, classKind, item.get("iid"), item.get("revisionNumber"), None
+    finally:
+        for classKind, value in nb_rendered.items():
+            stats.count('items_rendered', value, classKind=classKind)
+            stats.count('render_seconds', render_seconds[classKind], classKind=classKind)
+
+def render_em_file_worker(input, Templates, start_offset, queue, chunk_size=128):
+    '''
+    Worker process rendering the queries of one EM file, see render_items.
+    Rendered items are sent in chunks through the queue, each with the relationships its template wrote,
+    followed by None once the file is done (or by the traceback if rendering failed)
+    :param queue: bounded queue read by iter_rendered_queue in the committing process
+    :param chunk_size: number of rendered items per message
+    :return: state of the Telemetry of the rendering, merged by the committing process
+    '''
+    buffer = RelationshipBuffer()
+    set_relationship_sink(buffer)
+    stats = Telemetry()
+    try:
+        chunk = []
+        for rendered in render_items(input, Templates, start_offset, stats):
+            chunk.append(rendered + (buffer.drain(),))
+            if len(chunk) == chunk_size:
+                queue.put(chunk)
+                chunk = []
+        queue.put(chunk)
+        queue.put(None)
+    except Exception:
+        queue.put(traceback.format_exc())
+    return stats.state()
+
+def iter_rendered_queue(queue, future, sink):
     '''
-      loads the entities and attributes data into a TypeDB session
+    Reads the items rendered by render_em_file_worker, adding their relationships to the sink of this process
+    :param queue: queue the worker writes to
+    :param future: future of the worker, to detect workers which could not start
+    :param sink: RelationshipSink of the committing process
+    :return: generator of (item index, classKind, id, revisionNumber, insert query), as render_items
+    '''
+    while True:
+        try:
+            chunk = queue.get(timeout=1)
+        except Empty:
+            if future.done() and future.exception() is not None:
+                raise RuntimeError('Worker process rendering EM file failed') from future.exception()
+            continue
+        if chunk is None:
+            return
+        if isinstance(chunk, str):
+            raise RuntimeError('Rendering of EM file failed in worker process:\n' + chunk)
+        for item_index, classKind, id, revision, typeql_insert_query, relationships in chunk:
+            for relationship in relationships:
+                sink.append(*relationship)
+            yield item_index, classKind, id, revision, typeql_insert_query
+
+def load_data_into_typedb(input, session, Templates, writers=1, iid_map=None, existing_ids=None, mission='',
+                          checkpoint=None, rendered=None, existing_rel_ids=None):
+    '''
+      loads the entities and attributes data into a TypeDB session, streaming the items from the .json file
       for each item dictionary:
         a. creates a TypeDB transaction
         b. constructs the corresponding TypeQL insert query
@@ -175,19 +573,31 @@ def load_data_into_typedb(input, session, Templates):
       :param input: .json file containing the classes and classes' data to parse and migrate
       :param session: running TypeDB session where data is being migrated
       :param Templates: function templates used to build the insert queries
+      :param writers: number of batches committed concurrently, each in its own WRITE transaction
+      :param iid_map: optional IidMap recording the TypeDB iid of each inserted entity
+      :param existing_ids: optional set of ids already in the database, the templates of these items are still
+                           called to collect their relationships, but their insert query is not sent.
+                           With a dict id -> revisionNumber (incremental ingest), only the items of the same revision
+                           are skipped: the items of another revision are deleted with the relations they play in
+                           (see delete_items) before their new revision is inserted
+      :param mission: name of the mission the file belongs to, used by the checkpoint
+      :param checkpoint: optional Checkpoint, items committed in a previous run are skipped and the offset of the
+                         committed items is recorded after each batch
+      :param rendered: optional generator of items already rendered by a worker process (see iter_rendered_queue),
+                       by default the items are parsed and rendered here with render_items
+      :param existing_rel_ids: optional set of rel-ids already in the database, the rel-ids of the relations deleted
+                               with changed items are removed from it, so the relationship phase inserts them again
+      :return: list of batches which could not be committed
     '''
 
-    with open(input, 'r', encoding='utf-8') as f:
-        items = json.load(f)
-
-    classK=[]
-    for item in items:
-        classK.append(item["classKind"])
-
-    #Print summary of classes/entities found in .json file, to migrate
-    print(f'{len(classK)} Classes to migrate, of {len(list(set(classK)))} different types: {list(set(classK))}')
-    listAvailableTemplates = [x for x in Templates.keys()]
-    classItems=[]
+    # Items are streamed from the file one at a time, query generation and commits overlap with parsing
+    classItems = Counter()
+    skipped = 0
+    # ids of the items of another revision than in the database, deleted before their batch is submitted
+    incremental = isinstance(existing_ids, dict)
+    changed = []
+    nb_changed = 0
+    nb_queued = 0
 
     # For each item, identify class and call corresponding template from 'migrationTemplates.py'
 
@@ -197,241 +607,479 @@ def load_data_into_typedb(input, session, Templates):
     ## b) construct the typeql_insert_query using the corresponding template function
     ## c) execute the query and
     ## d) commit the transaction (load in database)
-    counter = 0
-    batch = 128
+    ## batches start at 128 items, resized by the latency of their commits and the size of their queries
+    adaptive_size = AdaptiveBatchSize(128)
     batch_query = []
-    for item_count, item in enumerate(tqdm(items)):  ## tqdm added
+    batch_bytes = 0
+    commit_bar = tqdm(desc='Committed', unit='items', position=1)
+    # (items offset, number of collected relationships) at the end of each submitted batch, for the checkpoint
+    batch_ends = {}
+    nb_batches = 0
+    start_offset = checkpoint.file_offset(mission, input) if checkpoint is not None else 0
+    if start_offset:
+        print(f'Resuming after the {start_offset} items committed according to checkpoint')
+    if rendered is None:
+        rendered = render_items(input, Templates, start_offset)
+
+    def on_committed(index, batch_query, inserted):
+        commit_bar.update(len(batch_query))
+        # the checkpoint only moves over batches committed without failure before them
+        if checkpoint is not None and not pool.failed:
+            offset, relationships = batch_ends.pop(index)
+            checkpoint.batch_committed(mission, input, offset, relationships)
+
+    ## batch entries are (CDP4 id, query) pairs
+    pool = BatchWriterPool(lambda batch_query: commit_batch(session, [query for id, query in batch_query], 'Entity',
+                                                            [id for id, query in batch_query], iid_map,
+                                                            adaptive_size), writers,
+                           on_committed=on_committed)
+    for item_index, classKind, id, revision, typeql_insert_query in tqdm(rendered, desc="Rendered", unit="items"):
         """To avoid running out of memory, it’s recommended that every single query gets created and committed in a single transaction. 
         However, for faster migration of large datasets, this can happen once for every n queries, 
         where n is the maximum number of queries guaranteed to run on a single transaction."""
-        classItems.append(item["classKind"])
-        if item["classKind"] in listAvailableTemplates:
-            counter += 1
-            if counter < batch and item_count != len(items) - 1:
-                #batch_query.append(input["template"](item))
-                batch_query.append(Templates[item["classKind"]](item))
-            else:
-                with session.transaction(TransactionType.WRITE) as transaction:
-                    #batch_query.append(input["template"](item))
-                    batch_query.append(Templates[item["classKind"]](item))
-                    # print("Executing TypeQL BatchQuery: \n" + "\n".join([query for query in batch_query]))
-                    for query in batch_query:
-                        transaction.query().insert(query.replace('\\', ''))
-                    ## tries to commit the files, throws error if they are already in the KG (checks unique id for each item)
-                    try:
-                        transaction.commit()
-                    except TypeDBClientException:
-                        transaction.close()
-                        for query in batch_query:
-
-                            try:
-                                with session.transaction(TransactionType.WRITE) as transaction:
-                                     transaction.query().insert(query)
-                                     transaction.commit()
-                                     print('Inserted Query: ' + query)
-                            except:
-                                #print('--> Query throws exception:')
-                                #print(query)
-                                logging.info('Entity already in Knowledge Graph ' + query)
-
-
-
-                    counter = 0
-                    batch_query = []
+        classItems[classKind] += 1
+        if typeql_insert_query is not None:
+            #batch_query.append(input["template"](item))
+            if existing_ids is not None and id in existing_ids:
+                if not incremental or existing_ids[id] == str(revision):
+                    skipped += 1
+                    continue
+                changed.append(id)
+            nb_queued += 1
+            batch_query.append((id, typeql_insert_query))
+            batch_bytes += len(typeql_insert_query)
+            if adaptive_size.full(len(batch_query), batch_bytes):
+                ## batches are independent of each other, they are committed by the writers of the pool
+                if checkpoint is not None:
+                    batch_ends[nb_batches] = (item_index + 1, len(checkpoint.sink))
+                nb_batches += 1
+                if changed:
+                    delete_items(session, changed, existing_rel_ids)
+                    nb_changed += len(changed)
+                    changed = []
+                pool.submit(batch_query)
+                batch_query = []
+                batch_bytes = 0
         else:
             # if the template for this class has not been found (should not happen)
-            print('--> Template for class ', item["classKind"], ' Missing!\n --------------\n ')
-
-    #Print summary
+            print('--> Template for class ', classKind, ' Missing!\n --------------\n ')
+
+    if batch_query and checkpoint is not None:
+        batch_ends[nb_batches] = (item_index + 1, len(checkpoint.sink))
+    if changed:
+        delete_items(session, changed, existing_rel_ids)
+        nb_changed += len(changed)
+    pool.submit(batch_query)
+    failed = pool.close()
+    commit_bar.close()
+    if failed:
+        print(f'--> {len(failed)} batches of {input} could not be committed, see log for details')
+    telemetry.count('failed_batches', len(failed), kind='Entity')
+    telemetry.count('skipped_existing', skipped, kind='Entity')
+    if incremental:
+        telemetry.count('incremental_items', nb_changed, status='changed')
+        telemetry.count('incremental_items', skipped, status='unchanged')
+        telemetry.count('incremental_items', nb_queued - nb_changed, status='new')
+
+    #Print summary of classes/entities found in .json file, counted while streaming
+    nbItems = sum(classItems.values())
     print("\n --------------------------------------------------------- ")
+    print(f'{nbItems} Classes migrated, of {len(classItems)} different types: {list(classItems)}')
     #print("\nInserted " + str(len(items)) + " items from [ " + input["file"] + ".json] into TypeDB.\n")
 
-    print("\nInserted " + str(len(items)) + " items from "+ str(input) + "into TypeDB.\n")
-    counter = Counter(classItems)
-    for key, value in counter.most_common():
+    print("\nInserted " + str(nbItems - skipped) + " items from "+ str(input) + "into TypeDB.\n")
+    if skipped:
+        print(f'{skipped} items already in Knowledge Graph skipped')
+    if incremental:
+        print(f'Delta: {nb_queued - nb_changed} new, {nb_changed} changed (re-inserted), {skipped} unchanged')
+    for key, value in classItems.most_common():
         print(' | ', key, ' | ', value)
 
-    return
+    return failed
 
-def check_mission_name(session, mission_name):
-        with session.transaction(TransactionType.READ) as transaction:
-            typeql_match_query = 'match $ED isa ElementDefinition,  has name "' + mission_name + '"; get $ED;'
-
-            iterator = transaction.query().match(typeql_match_query)
-            answers = [ans for ans in iterator]
-            answers = [ans.get('ED').get_iid() for ans in answers]
-            if len(answers) == 0:
-                print(f'Database does not contain mission with name {mission_name}')
-                return False
-        return True
+def emit_typeql(em_list, Templates, directory, generator_processes=0, shard_size=100_000, spill_threshold=500_000,
+                **info):
+    '''
+    Offline mode: renders the insert queries of the EM files with the templates, as load_data_into_typedb and
+    commitRelationships would send them, to gzip-compressed .tql shards instead of a TypeDB server.
+    The shards are listed in the manifest of the directory in loading order: the entities of all missions, then
+    their relationships, which match their players by class and id attribute. See load_typeql_shards
+    :param em_list: dict mission -> list of EM files, see load_em_files
+    :param Templates: function templates used to build the insert queries
+    :param directory: output directory of the shards
+    :param generator_processes: If > 0, parse EM files and render the queries in that many worker processes
+    :param shard_size: maximum number of queries per shard
+    :param spill_threshold: number of relationships kept in memory before they are spilled to disk
+    :param info: information on the rendering recorded in the manifest
+    :return: manifest entries of the shards
+    '''
+    os.makedirs(directory, exist_ok=True)
+    entity_shards, relationship_shards = [], []
+    for mission, em_files in em_list.items():
+        print(f'Rendering Engineering Model of the "{mission}" mission')
+        sink = RelationshipSink(os.path.join(directory, RELATIONSHIPS_SPILL_FILE.format(mission)), spill_threshold)
+        set_relationship_sink(sink)
+        executor, manager, renderings = start_rendering_workers(em_files, Templates, generator_processes)
+
+        writer = ShardWriter(directory, f'entities-{mission}', 'Entity', shard_size, mission=mission)
+        for tem_path in em_files:
+            rendered = iter_rendered_queue(*renderings[tem_path], sink) if tem_path in renderings \
+                else render_items(tem_path, Templates)
+            for item_index, classKind, id, revision, typeql_insert_query in tqdm(rendered, desc=str(tem_path),
+                                                                                 unit='items'):
+                if typeql_insert_query is not None:
+                    writer.write(typeql_insert_query)
+                else:
+                    print('--> Template for class ', classKind, ' Missing!\n --------------\n ')
+            if tem_path in renderings:
+                telemetry.merge(renderings[tem_path][1].result())
+        entity_shards += writer.close()
+        if executor is not None:
+            executor.shutdown()
+            manager.shutdown()
+
+        writer = ShardWriter(directory, f'relationships-{mission}', 'Relationship', shard_size, mission=mission)
+        for row in sink:
+            writer.write(relationship_query(*row))
+        relationship_shards += writer.close()
+        print(f'{sum(shard["queries"] for shard in entity_shards if shard["mission"] == mission)} items and '
+              f'{len(sink)} relationships of "{mission}" rendered')
+        sink.clear()
+
+    shards = entity_shards + relationship_shards
+    write_manifest(directory, shards, **info)
+    print(f'{len(shards)} shards written to {directory}')
+    return shards
+
+def load_typeql_shards(session, directory, writers=1):
+    '''
+    Replays the .tql shards written by emit_typeql, in the order of their manifest: each shard is committed in
+    batches sized by AdaptiveBatchSize, by `writers` parallel WRITE transactions, through commit_batch (failed
+    batches are bisected and the rejected queries reported in the report of the run, see start_rejected_report)
+    :param session: running TypeDB session where data is being loaded
+    :param directory: directory of the shards and of their manifest
+    :param writers: number of parallel WRITE transactions
+    :return: number of committed queries
+    '''
+    manifest = read_manifest(directory)
+    nb_committed = 0
+
+    def on_committed(index, batch_query, committed):
+        nonlocal nb_committed
+        nb_committed += committed
+        commit_bar.update(len(batch_query))
+
+    for kind in ('Entity', 'Relationship'):
+        # relationships only match their players once all entities are committed
+        shards = [shard for shard in manifest['shards'] if shard['kind'] == kind]
+        if not shards:
+            continue
+        adaptive_size = AdaptiveBatchSize(128)
+        pool = BatchWriterPool(lambda batch_query: commit_batch(session, batch_query, kind,
+                                                                adaptive_size=adaptive_size), writers,
+                               on_committed=on_committed)
+        commit_bar = tqdm(desc=kind, unit='queries', total=sum(shard['queries'] for shard in shards))
+        with telemetry.timer('phase_seconds', kind=kind, mission='shards'):
+            for shard in shards:
+                batch_query = []
+                batch_bytes = 0
+                for query in iter_shard(os.path.join(directory, shard['file'])):
+                    batch_query.append(query)
+                    batch_bytes += len(query)
+                    if adaptive_size.full(len(batch_query), batch_bytes):
+                        pool.submit(batch_query)
+                        batch_query = []
+                        batch_bytes = 0
+                pool.submit(batch_query)
+            failed = pool.close()
+        commit_bar.close()
+        if failed:
+            print(f'--> {len(failed)} batches of {kind} shards could not be committed, see log for details')
+        telemetry.count('failed_batches', len(failed), kind=kind)
+    return nb_committed
+
+def metadata_id(mission_name, *key):
+    '''
+    Deterministic id of a metadata entity or relation, the same in every run: inserting the metadata of a mission
+    again finds the ids already in the database
+    :param mission_name: name of the top ElementDefinition of the mission
+    :param key: field, index of the value in the field and entity or relation, e.g. ("payload", 2, "parameter")
+    '''
+    return str(uuid.uuid5(METADATA_NAMESPACE, '/'.join(str(part) for part in (mission_name,) + key)))
 
+def typeql_string(value):
+    return str(value).replace('\\', '\\\\').replace('"', '\\"')
 
-def check_existing_metadata(session, mission_name):
+def lookup_metadata_anchors(session, mission_names):
+    '''
+    Resolves the entities the metadata of each mission is attached to, for all missions at once (one READ
+    transaction): the top ElementDefinition of the mission (by name), its "Metadata" ParameterGroup if metadata was
+    already inserted, and its Iteration with the highest revisionNumber. For missions with metadata, the ids of the
+    metadata parameters and requirements specifications already inserted are fetched as well
+    :param mission_names: names of the top ElementDefinitions of the missions
+    :return: dict mission name -> {"element": iid, "metadata": iid or None, "metadata_id": id or None,
+             "iteration": iid or None, "revision": revisionNumber or None, "existing": set of ids}, missions not in
+             the database are missing
+    '''
+    anchors = {}
+    mission_names = list(dict.fromkeys(mission_names))
+    if not mission_names:
+        return anchors
+    names = ' or '.join('{ $name "' + typeql_string(name) + '"; }' for name in mission_names) + ';'
+    if len(mission_names) == 1:
+        names = '$name "' + typeql_string(mission_names[0]) + '";'
     with session.transaction(TransactionType.READ) as transaction:
-        typeql_match_query = f'''match $ED isa ElementDefinition,  has name "{mission_name}";
-                                $metadata isa ParameterGroup, has name "Metadata";
-                                (contains: $ED, isContained: $metadata) isa Containment_parameterGroup; get $metadata;'''
+        for ans in transaction.query().match(f'match $ED isa ElementDefinition, has name $name; {names} '
+                                             'get $ED, $name;'):
+            anchors[ans.get('name').get_value()] = {'element': ans.get('ED').get_iid(), 'metadata': None,
+                                                    'metadata_id': None, 'iteration': None, 'revision': None,
+                                                    'existing': set()}
+        if not anchors:
+            return anchors
+        for ans in transaction.query().match(f'match $ED isa ElementDefinition, has name $name; {names} '
+                                             '$metadata isa ParameterGroup, has name "Metadata", has id $id; '
+                                             '(contains: $ED, isContained: $metadata) isa Containment_parameterGroup; '
+                                             'get $name, $metadata, $id;'):
+            anchor = anchors[ans.get('name').get_value()]
+            anchor['metadata'], anchor['metadata_id'] = ans.get('metadata').get_iid(), ans.get('id').get_value()
+        for ans in transaction.query().match(f'match $ED isa ElementDefinition, has name $name; {names} '
+                                             '$iteration isa Iteration, has revisionNumber $it; '
+                                             '(isReferredBy:$ED, refersTo:$iteration) isa Reference_topElement; '
+                                             'get $name, $iteration, $it;'):
+            anchor = anchors[ans.get('name').get_value()]
+            revision = int(ans.get('it').get_value())
+            if anchor['revision'] is None or revision > anchor['revision']:
+                anchor['iteration'], anchor['revision'] = ans.get('iteration').get_iid(), revision
+
+        # metadata inserted by a previous run, its entries are not inserted again
+        with_metadata = [name for name, anchor in anchors.items() if anchor['metadata'] is not None]
+        if with_metadata:
+            names = ' or '.join('{ $name "' + typeql_string(name) + '"; }' for name in with_metadata) + ';' \
+                if len(with_metadata) > 1 else '$name "' + typeql_string(with_metadata[0]) + '";'
+            for query in ('$metadata isa ParameterGroup, has name "Metadata"; '
+                          '(contains: $ED, isContained: $metadata) isa Containment_parameterGroup; '
+                          '(refersTo: $entry, isReferredBy: $metadata) isa Reference_group; $entry has id $id;',
+                          '(isReferredBy:$ED, refersTo:$iteration) isa Reference_topElement; '
+                          '(contains:$iteration, isContained:$entry) isa Containment_requirementsSpecification; '
+                          '$entry has id $id;'):
+                for ans in transaction.query().match(f'match $ED isa ElementDefinition, has name $name; {names} '
+                                                     f'{query} get $name, $id;'):
+                    anchors[ans.get('name').get_value()]['existing'].add(ans.get('id').get_value())
+    return anchors
+
+def pending_metadata(missions, anchors):
+    '''
+    :param missions: list of metadata dictionaries
+    :param anchors: see lookup_metadata_anchors
+    :return: metadata dictionaries of the missions in the database, without metadata yet or with metadata inserted
+             with the ids of metadata_id (to complete)
+    '''
+    pending = []
+    for mission in missions:
+        name = mission.get('TopElementName')
+        assert name != None, f'Metadata file does not specify mission name  {name}'
+        if name not in anchors:
+            print(f'Database does not contain mission with name {name}')
+        elif anchors[name]['metadata'] is not None and anchors[name]['metadata_id'] != metadata_id(name, 'Metadata'):
+            # inserted with random ids, its entries cannot be told apart from new ones
+            print(f'Database already contains metadata for mission with name {name}')
+        else:
+            pending.append(mission)
+    return pending
 
-        iterator = transaction.query().match(typeql_match_query)
-        answers = [ans for ans in iterator]
-        answers = [ans.get('metadata').get_iid() for ans in answers]
-        if len(answers) > 0:
-            print(f'Database already contains metadata for mission with name {mission_name}')
-            return False
-    return True
 
-def addMetadata(session, mission, model):
+def metadata_texts(mission, normalizer):
+    '''
+    Strings of one metadata dictionary embedded by addMetadata: the names of the requirements and the scalar values
+    with their acronyms expanded, the entries of the lists as they are
+    :param mission: metadata dictionary
+    :param normalizer: TextNormalizer expanding the acronyms, see util/normalization.py
+    :return: list of strings
+    '''
+    texts = []
+    for meta in mission.keys() - {'TopElementName', 'iteration'}:
+        if meta == "requirements":
+            texts.extend(normalizer.normalize(entry['name']) for entry in mission[meta])
+        elif type(mission[meta]) == list:
+            texts.extend(mission[meta])
+        else:
+            texts.append(normalizer.normalize(str(mission[meta])))
+    return texts
+
+def encode_metadata(missions, model, batch_size=METADATA_ENCODE_BATCH_SIZE):
+    '''
+    Embeds the strings of all metadata dictionaries at once: the distinct strings are encoded by one batched call of
+    the model instead of one call per field of each mission, strings encoded by a previous run are read from the
+    embedding cache (util/embedding_cache.py)
+    :param missions: list of metadata dictionaries
+    :param model: SentenceTransformer
+    :param batch_size: number of strings per forward pass of the model
+    :return: dict string -> s_bert_embedding attribute value, for addMetadata
+    '''
+    normalizer = get_normalizer()
+    texts = list(dict.fromkeys(text for mission in missions for text in metadata_texts(mission, normalizer)))
+    if not texts:
+        return {}
+    vectors = encode_cached(model, SBERT_MODEL, texts, batch_size=batch_size, show_progress_bar=False)
+    return {text: encode_embedding(vector) for text, vector in zip(texts, vectors)}
+
+def addMetadata(session, mission, model, embeddings=None, anchors=None):
     '''
     Function to insert Metadata provided in emList
+    The metadata of the mission is inserted in one WRITE transaction, matching the entities it is attached to by iid
     :param session: running TypeDB session where data is being migrated
     :param emList: List of metadata dictionaries to be migrated
+    :param embeddings: optional dict string -> embedding of the strings of the metadata, see encode_metadata,
+                       strings missing from it are encoded one by one
+    :param anchors: optional dict mission name -> entities of the mission, see lookup_metadata_anchors, looked up
+                    for this mission if not given
     '''
-    script_dir = os.path.dirname(os.path.abspath(__file__))
-    #print(script_dir)
-    #acronyms_path = pathlib.Path(script_dir,'/util/ecss_acronyms.txt')
-    acronyms_path = os.path.join(script_dir, 'util/ecss_acronyms.txt')
-    #print(acronyms_path)
-    acronyms, expansions = load_Acronyms(acronyms_path)
-    batch_insert_query = []
+    normalizer = get_normalizer()
+    embeddings = {} if embeddings is None else embeddings
+
+    def embedding(text):
+        if text not in embeddings:
+            embeddings[text] = encode_embedding(encode_cached(model, SBERT_MODEL, [text], show_progress_bar=False)[0])
+        return embeddings[text]
+
     assert mission.get(
         'TopElementName') != None, f'Metadata file does not specify mission name  {mission.get("TopElementName")}'
-    if check_mission_name(session, mission.get("TopElementName") ) == False:
+    if anchors is None:
+        anchors = lookup_metadata_anchors(session, [mission['TopElementName']])
+    if not pending_metadata([mission], anchors):
         return
-    if check_existing_metadata(session, mission.get("TopElementName") ) == False:
-        return
-    typeql_insert_query = 'match $ED isa ElementDefinition,  has name "' + mission['TopElementName'] + '";'
-    typeql_insert_query +='insert $metadata isa ParameterGroup, has name "Metadata", has id "' + str(
-        uuid.uuid4()) + '";'
-    typeql_insert_query += '(contains: $ED, isContained: $metadata) isa Containment_parameterGroup, has rel-id "' + str(
-        uuid.uuid4()) + '";'
-    # print(typeql_insert_query)
-
+    anchor = anchors[mission['TopElementName']]
 
+    name = mission['TopElementName']
+    # entries inserted by a previous run have the same ids, they are skipped
+    existing = anchor['existing']
 
-    batch_insert_query.append(typeql_insert_query)
-
+    # parameters are attached to the "Metadata" ParameterGroup inserted with them, requirements to the iteration
+    batch_insert_query = []
+    parameter_queries = []
+    entry_ids = []
     for meta in mission.keys() - {'TopElementName', 'iteration'}:
         ## special case for requirements --> defined as requirements specification in
         if meta == "requirements":
 
-            typeql_match_query = 'match $ED isa ElementDefinition,  has name "' + mission['TopElementName'] + '";'
-            typeql_match_query += '$iteration isa Iteration, has revisionNumber $it;'  # , has name "Metadata";'
-            typeql_match_query += '(isReferredBy:$ED, refersTo:$iteration) isa Reference_topElement; get $it; offset 0; limit 100;'
-            # typeql_match_query = 'match $iteration isa Iteration, has revisionNumber $x; get $x; offset 0; limit 100;'
-            with session.transaction(TransactionType.READ) as transaction:
-                iterator = transaction.query().match(typeql_match_query)
-                iterations = [int(ans.get('it').get_value()) for ans in iterator]
-
-            assert len(iterations) > 0, f'{mission.get("TopElementName")} does not contain any iterations, needs to be reinserted before adding metadata'
-            # if len(iterations)> 1:
-
-            for entry in mission[meta]:
-                typeql_insert_query = 'match $ED isa ElementDefinition,  has name "' + mission['TopElementName'] + '";'
-                typeql_insert_query += f'$iteration isa Iteration, has revisionNumber "{max(iterations)}";'  # , has name "Metadata";'
-                typeql_insert_query += '(isReferredBy:$ED, refersTo:$iteration) isa Reference_topElement;'
+            assert anchor['iteration'] is not None, f'{mission.get("TopElementName")} does not contain any iterations, needs to be reinserted before adding metadata'
+
+            for index, entry in enumerate(mission[meta]):
+                if metadata_id(name, meta, index, 'reqspec') in existing:
+                    continue
+                entry_ids.append(metadata_id(name, meta, index, 'reqspec'))
+                typeql_insert_query = f'match $iteration iid {anchor["iteration"]};'
                 ## insert
                 typeql_insert_query += 'insert $reqspec isa RequirementsSpecification, has name "' + entry[
-                    'name'] + '", has id "' + str(uuid.uuid4()) + '", has s_bert_embedding "' + str(
-                    list(model.encode(replace_Acronyms(entry['name'],acronyms,expansions),show_progress_bar = False))) + '";'
-                typeql_insert_query += '(contains:$iteration, isContained:$reqspec) isa Containment_requirementsSpecification, has rel-id "' + str(
-                    uuid.uuid4()) + '";'  # +str(uuid.uuid4())+'";'
-                typeql_insert_query += '$definition isa Definition, has content "' + entry['definition'] + '", has id "'+str(uuid.uuid4())+'";'
-                typeql_insert_query += '(isContained:$definition, contains:$reqspec) isa Containment_definition, has rel-id "' + str(
-                    uuid.uuid4()) + '";'
+                    'name'] + '", has id "' + metadata_id(name, meta, index, 'reqspec') + '", has s_bert_embedding "' + embedding(
+                    normalizer.normalize(entry['name'])) + '";'
+                typeql_insert_query += '(contains:$iteration, isContained:$reqspec) isa Containment_requirementsSpecification, has rel-id "' + metadata_id(
+                    name, meta, index, 'Containment_requirementsSpecification') + '";'
+                typeql_insert_query += '$definition isa Definition, has content "' + entry['definition'] + '", has id "' + metadata_id(
+                    name, meta, index, 'definition') + '";'
+                typeql_insert_query += '(isContained:$definition, contains:$reqspec) isa Containment_definition, has rel-id "' + metadata_id(
+                    name, meta, index, 'Containment_definition') + '";'
                 # print(typeql_insert_query)
                 batch_insert_query.append(typeql_insert_query)
 
         elif type(mission[meta]) == list:
-            for entry in mission[meta]:
-                typeql_insert_query = 'match $ED isa ElementDefinition,  has name "' + mission['TopElementName'] + '";'
-                typeql_insert_query += '$metadata isa ParameterGroup, has name "Metadata";'
-                typeql_insert_query += '(contains: $ED, isContained: $metadata) isa Containment_parameterGroup;'
-                # typeql_insert_query += 'insert $parameter isa Parameter, has id "'+str(uuid.uuid4())+'";'
-                typeql_insert_query += 'insert $parameter isa Parameter, has id "' + str(
-                    uuid.uuid4()) + '", has s_bert_embedding "' + str(list(model.encode(entry, show_progress_bar=False))) + '";'
-
-                typeql_insert_query += '$parametertype isa SimpleQuantityKind, has name "' + meta + '", has id "' + str(
-                    uuid.uuid4()) + '";'
-                typeql_insert_query += '$parametervalueSet isa ParameterValueSet, has published  "' + entry + '", has id "' + str(
-                    uuid.uuid4()) + '";'
-                # link parameter to metadata group
-                typeql_insert_query += '(refersTo: $parameter, isReferredBy: $metadata) isa Reference_group, has rel-id "' + str(
-                    uuid.uuid4()) + '";'
-                # link parameter to parameter type and value
-                typeql_insert_query += '(contains: $parameter , isContained: $parametervalueSet) isa Containment_valueSet, has rel-id "' + str(
-                    uuid.uuid4()) + '";'
-                typeql_insert_query += '(refersTo: $parameter , isReferredBy: $parametertype) isa Reference_parameterType, has rel-id "' + str(
-                    uuid.uuid4()) + '";'
-                # print(typeql_insert_query)
-                batch_insert_query.append(typeql_insert_query)
+            for index, entry in enumerate(mission[meta]):
+                if metadata_id(name, meta, index, 'parameter') not in existing:
+                    entry_ids.append(metadata_id(name, meta, index, 'parameter'))
+                    parameter_queries.append(metadata_parameter_query(name, meta, index, entry, embedding(entry)))
+
+        elif metadata_id(name, meta, 0, 'parameter') not in existing:
+            entry_ids.append(metadata_id(name, meta, 0, 'parameter'))
+            parameter_queries.append(metadata_parameter_query(name, meta, 0, str(mission[meta]), embedding(
+                normalizer.normalize(str(mission[meta])))))
+
+    if anchor['metadata'] is not None and not parameter_queries and not batch_insert_query:
+        print(f'Database already contains metadata for mission with name {name}')
+        return
 
-        else:
-            typeql_insert_query = 'match $ED isa ElementDefinition,  has name "' + mission['TopElementName'] + '";'
-            typeql_insert_query += '$metadata isa ParameterGroup, has name "Metadata";'
-            typeql_insert_query += '(contains: $ED, isContained: $metadata) isa Containment_parameterGroup;'
-            typeql_insert_query += 'insert $parameter isa Parameter, has id "' + str(
-                uuid.uuid4()) + '", has s_bert_embedding "' + str(
-                list(model.encode(replace_Acronyms(str(mission[meta]),acronyms,expansions)))) + '";'
-
-            typeql_insert_query += '$parametertype isa SimpleQuantityKind, has name "' + meta + '", has id "' + str(
-                uuid.uuid4()) + '";'
-            typeql_insert_query += '$parametervalueSet isa ParameterValueSet, has published  "' + str(
-                mission[meta]) + '", has id "' + str(uuid.uuid4()) + '";'
-            # link parameter to metadata group
-            typeql_insert_query += '(refersTo: $parameter, isReferredBy: $metadata) isa Reference_group, has rel-id "' + str(
-                uuid.uuid4()) + '";'
-            # link parameter to parameter type and value
-            typeql_insert_query += '(contains: $parameter , isContained: $parametervalueSet) isa Containment_valueSet, has rel-id "' + str(
-                uuid.uuid4()) + '";'
-            typeql_insert_query += '(refersTo: $parameter , isReferredBy: $parametertype) isa Reference_parameterType, has rel-id "' + str(
-                uuid.uuid4()) + '";'
-
-            batch_insert_query.append(typeql_insert_query)
-
-    for query in batch_insert_query:
-        # try:
-
-        # with open('commits.txt', 'w+', encoding='utf-8') as f:
-        #     f.write(query)
-        #     f.write('\n')
-
-        with session.transaction(TransactionType.WRITE) as transaction:
+    nb_queries = len(parameter_queries) + len(batch_insert_query) + (anchor['metadata'] is None)
+    with session.transaction(TransactionType.WRITE) as transaction:
+        metadata_iid = anchor['metadata']
+        if metadata_iid is None:
+            typeql_insert_query = f'match $ED iid {anchor["element"]};'
+            typeql_insert_query +='insert $metadata isa ParameterGroup, has name "Metadata", has id "' + metadata_id(
+                name, 'Metadata') + '";'
+            typeql_insert_query += '(contains: $ED, isContained: $metadata) isa Containment_parameterGroup, has rel-id "' + metadata_id(
+                name, 'Metadata', 'Containment_parameterGroup') + '";'
+            metadata_iid = next(transaction.query().insert(typeql_insert_query)).get('metadata').get_iid()
+        for query in parameter_queries:
+            transaction.query().insert(f'match $metadata iid {metadata_iid};' + query)
+        for query in batch_insert_query:
             transaction.query().insert(query)
-            transaction.commit()
+        transaction.commit()
+    anchor['metadata'], anchor['metadata_id'] = metadata_iid, metadata_id(name, 'Metadata')
+    existing.update(entry_ids)
+    telemetry.count('metadata_queries', nb_queries)
+
+def metadata_parameter_query(mission_name, meta, index, value, s_bert_embedding):
+    '''
+    Insert query of one metadata value, a Parameter of the "Metadata" ParameterGroup matched as $metadata
+    :param mission_name: name of the top ElementDefinition of the mission
+    :param meta: name of the metadata field
+    :param index: index of the value in the field, 0 for fields with one value
+    :param value: value of the field
+    :param s_bert_embedding: embedding of the value
+    '''
+    key = (mission_name, meta, index)
+    typeql_insert_query = 'insert $parameter isa Parameter, has id "' + metadata_id(
+        *key, 'parameter') + '", has s_bert_embedding "' + s_bert_embedding + '";'
+
+    typeql_insert_query += '$parametertype isa SimpleQuantityKind, has name "' + meta + '", has id "' + metadata_id(
+        *key, 'parametertype') + '";'
+    typeql_insert_query += '$parametervalueSet isa ParameterValueSet, has published  "' + value + '", has id "' + metadata_id(
+        *key, 'parametervalueSet') + '";'
+    # link parameter to metadata group
+    typeql_insert_query += '(refersTo: $parameter, isReferredBy: $metadata) isa Reference_group, has rel-id "' + metadata_id(
+        *key, 'Reference_group') + '";'
+    # link parameter to parameter type and value
+    typeql_insert_query += '(contains: $parameter , isContained: $parametervalueSet) isa Containment_valueSet, has rel-id "' + metadata_id(
+        *key, 'Containment_valueSet') + '";'
+    typeql_insert_query += '(refersTo: $parameter , isReferredBy: $parametertype) isa Reference_parameterType, has rel-id "' + metadata_id(
+        *key, 'Reference_parameterType') + '";'
+    return typeql_insert_query
 
 
 def load_em_files(em_dir_path):
     """
     Loads .json-files from of EMs from directory
+    The missions with the most items come first, and the largest files first in each mission, so the workers
+    inserting missions (or rendering files) in parallel are not left waiting on one large file at the end
+    (longest-processing-time first, see util/scheduling.py)
     :param em_dir_path: file path string
-    :return: list of dicts containing different EMs jsons
+    :return: dict mission -> list of EM file paths
     """
 
-    paths = {}
-    pattern = "*.json"
-    local_dir = pathlib.Path(em_dir_path)
-    for model in local_dir.iterdir():
-        ##print(model)
-        mission = model.stem
-        # print(name)
-        temp_paths = []
-        for path, subdirs, files in os.walk(model):
-            for name in files:
-                if fnmatch(name, pattern):
-                    if name != 'Header.json' and name != 'Metadata.json':
-                        tem_path = pathlib.PurePath(path, name)
-                        temp_paths.append(tem_path)
-
-        paths[mission] = temp_paths
+    return {mission: [pathlib.PurePath(file['path']) for file in files]
+            for mission, files in discover_em_files(em_dir_path).items()}
 
-    return paths
+def dry_run(em_dir_path, mission_workers=1, report_file=None):
+    """
+    Lists the EM files which would be inserted, in insertion order, with the schedule of the missions on the
+    mission workers and the predicted wall time of the entity phase
+    :param report_file: optional run report of a previous run, its entity throughput predicts the wall time
+    :return: predicted seconds, None if no previous throughput is known
+    """
+    items_per_second = None
+    if report_file and os.path.exists(report_file):
+        with open(report_file, 'r', encoding='utf-8') as file:
+            items_per_second = json.load(file).get('commits', {}).get('Entity', {}).get('queries_per_second')
+    return print_schedule(discover_em_files(em_dir_path), mission_workers, items_per_second)
 
 
 # --------------------------
 # Main
 # --------------------------
 
-def main(dbName, defineSchema, schemaFile, defineRules, rule_dir, insertData, em_dir_path, insertMetadata, meta_dir):
+def main(dbName, defineSchema, schemaFile, defineRules, rule_dir, insertData, em_dir_path, insertMetadata, meta_dir,
+         relationship_spill=500_000, writers=1, use_iid_map=False, skip_existing=False, resume=False,
+         generator_processes=0, mission_workers=1, report_file=RUN_REPORT_FILE,
+         metrics_file=None, emit_tql=None, shard_size=100_000, incremental=False, dry_run_only=False,
+         encode_batch_size=METADATA_ENCODE_BATCH_SIZE):
     '''
     :param dbName: TypeDB database
     :param defineSchema: If yes, define schema layer based on schemaFile
@@ -442,147 +1090,68 @@ def main(dbName, defineSchema, schemaFile, defineRules, rule_dir, insertData, em
     :param em_dir_path: filepath of EMs to load
     :param insertMetadata: If yes, insert Metadata based on emList
     :param meta_dir: Filepath to directory with metadata .jsons
+    :param relationship_spill: number of relationships kept in memory before they are spilled to disk
+    :param writers: number of parallel WRITE transactions used to commit entity batches
+    :param use_iid_map: If yes, record the TypeDB iid of each inserted entity in a persistent map and match
+                        relationships by iid
+    :param skip_existing: If yes, fetch the ids and rel-ids already in the database first and only insert the
+                          missing items and relationships (e.g. when rerunning after a crash)
+    :param resume: If yes, resume the data insertion from the checkpoint manifest of the database, otherwise
+                   start a new manifest
+    :param generator_processes: If > 0, parse EM files and render the insert queries in that many worker processes
+    :param mission_workers: If > 1, insert the missions in parallel in that many processes, each with its own
+                            TypeDB client
+    :param report_file: .json file the report of the run (counts and rendering time per class, commit latency
+                        percentiles, queries per second, retries) is written to, {} is replaced by dbName
+    :param metrics_file: optional file the same metrics are written to in the Prometheus text format
+    :param emit_tql: optional directory, if given the insert queries of the EMs in em_dir_path are only rendered to
+                     .tql shards in it, without connecting to TypeDB (see emit_typeql and loadTql.py)
+    :param shard_size: maximum number of queries per .tql shard
+    :param incremental: If yes, compare the revisionNumber of each item with the one in the database: unchanged items
+                        are skipped, changed items are deleted with their relations and inserted again, new items
+                        are inserted (e.g. to load a new iteration of a mission)
+    :param dry_run_only: If yes, only list the EM files of em_dir_path in insertion order with the schedule of the
+                         missions and the predicted wall time (from the throughput of report_file), see dry_run
+    :param encode_batch_size: number of metadata strings encoded per forward pass of the sentence transformer
     :return:
     '''
 
-    # Templates functions stored in migrationTemplates.py
-    Templates = {"ElementDefinition": elementDefinition_template,
-                 "ElementUsage": elementUsage_template,
-                 "Parameter": Parameter_template,
-                 "ParameterValueSet": ParameterValueSet_template,
-                 "Iteration": Iteration_template,
-                 "DomainFileStore": domainFileStore_template,
-                 "Option": Option_template,
-                 "Publication": Publication_template,
-                 "ParameterGroup": ParameterGroup_template,
-                 "Definition": Definition_template,
-                 "ParameterSubscription": ParameterSubscription_template,
-                 "ParameterSubscriptionValueSet": ParameterSubscriptionValueSet_template,
-                 "RequirementsSpecification": RequirementsSpecification_template,
-                 "HyperLink": HyperLink_template,
-                 "Category": Category_template,
-                 "TextParameterType": TextParameterType_template,
-                 "ParameterTypeComponent": ParameterTypeComponent_template,
-                 "ReferenceSource": ReferenceSource_template,
-                 "BooleanParameterType": BooleanParameterType_template,
-                 "BinaryRelationshipRule": BinaryRelationshipRule_template,
-                 "Alias": Alias_template,
-                 "RatioScale": RatioScale_template,
-                 "ArrayParameterType": ArrayParameterType_template,
-                 "LinearConversionUnit": LinearConversionUnit_template,
-                 "PrefixedUnit": PrefixedUnit_template,
-                 "Glossary": Glossary_template,
-                 "LogarithmicScale": LogarithmicScale_template,
-                 "DerivedUnit": DerivedUnit_template,
-                 "ScaleReferenceQuantityValue": ScaleReferenceQuantityValue_template,
-                 "UnitFactor": UnitFactor_template,
-                 "OrdinalScale": OrdinalScale_template,
-                 "DateTimeParameterType": DateTimeParameterType_template,
-                 "Term": Term_template,
-                 "TimeOfDayParameterType": TimeOfDayParameterType_template,
-                 "QuantityKindFactor": QuantityKindFactor_template,
-                 "ScaleValueDefinition": ScaleValueDefinition_template,
-                 "FileType": FileType_template,
-                 "EnumerationParameterType": EnumerationParameterType_template,
-                 "UnitPrefix": UnitPrefix_template,
-                 "Constant": Constant_template,
-                 "DateParameterType": DateParameterType_template,
-                 "IntervalScale": IntervalScale_template,
-                 "CyclicRatioScale": CyclicRatioScale_template,
-                 "EnumerationValueDefinition": EnumerationValueDefinition_template,
-                 "Citation": Citation_template,
-                 "DecompositionRule": DecompositionRule_template,
-                 "CompoundParameterType": CompoundParameterType_template,
-                 "MappingToReferenceScale": MappingToReferenceScale_template,
-                 "DerivedQuantityKind": DerivedQuantityKind_template,
-                 "ParameterizedCategoryRule": ParameterizedCategoryRule_template,
-                 "SpecializedQuantityKind": SpecializedQuantityKind_template,
-                 "SimpleUnit": SimpleUnit_template,
-                 "SimpleQuantityKind": SimpleQuantityKind_template,
-                 "SiteDirectory": SiteDirectory_template,
-                 "SiteReferenceDataLibrary": SiteReferenceDataLibrary_template,
-                 "Person": Person_template,
-                 "ModelReferenceDataLibrary": ModelReferenceDataLibrary_template,
-                 "EmailAddress": EmailAddress_template,
-                 "DomainOfExpertise": DomainOfExpertise_template,
-                 "EngineeringModelSetup": EngineeringModelSetup_template,
-                 "IterationSetup": IterationSetup_template,
-                 "Participant": Participant_template,
-                 "EngineeringModel": EngineeringModel_template,
-                 "ActualFiniteState": ActualFiniteState_template,
-                 "ActualFiniteStateList": ActualFiniteStateList_template,
-                 "AndExpression": AndExpression_template,
-                 "BinaryRelationship": BinaryRelationship_template,
-                 "BooleanExpression": BooleanExpression_template,
-                 "BuiltInRuleVerification": BuiltInRuleVerification_template,
-                 "CommonFileStore": CommonFileStore_template,
-                 "ConversionBasedUnit": ConversionBasedUnit_template,
-                 "DefinedThing": DefinedThing_template,
-                 "DomainOfExpertiseGroup": DomainOfExpertiseGroup_template,
-                 "ElementBase": ElementBase_template,
-                 "ExclusiveOrExpression": ExclusiveOrExpression_template,
-                 "ExternalIdentifierMap": ExternalIdentifierMap_template,
-                 "File": File_template,
-                 "FileRevision": FileRevision_template,
-                 "FileStore": FileStore_template,
-                 "Folder": Folder_template,
-                 "IdCorrespondence": IdCorrespondence_template,
-                 "MeasurementScale": MeasurementScale_template,
-                 "MeasurementUnit": MeasurementUnit_template,
-                 "ModelLogEntry": ModelLogEntry_template,
-                 "MultiRelationship": MultiRelationship_template,
-                 "MultiRelationshipRule": MultiRelationshipRule_template,
-                 "NaturalLanguage": NaturalLanguage_template,
-                 "NestedElement": NestedElement_template,
-                 "NestedParameter": NestedParameter_template,
-                 "NotExpression": NotExpression_template,
-                 "OrExpression": OrExpression_template,
-                 "Organization": Organization_template,
-                 "ParameterBase": ParameterBase_template,
-                 "ParameterOrOverrideBase": ParameterOrOverrideBase_template,
-                 "ParameterOverride": ParameterOverride_template,
-                 "ParameterOverrideValueSet": ParameterOverrideValueSet_template,
-                 "ParameterType": ParameterType_template,
-                 "ParameterValueSetBase": ParameterValueSetBase_template,
-                 "ParametricConstraint": ParametricConstraint_template,
-                 "ParticipantPermission": ParticipantPermission_template,
-                 "ParticipantRole": ParticipantRole_template,
-                 "PersonPermission": PersonPermission_template,
-                 "PersonRole": PersonRole_template,
-                 "PossibleFiniteState": PossibleFiniteState_template,
-                 "PossibleFiniteStateList": PossibleFiniteStateList_template,
-                 "QuantityKind": QuantityKind_template,
-                 "ReferenceDataLibrary": ReferenceDataLibrary_template,
-                 "ReferencerRule": ReferencerRule_template,
-                 "RelationalExpression": RelationalExpression_template,
-                 "Relationship": Relationship_template,
-                 "Requirement": Requirement_template,
-                 "RequirementsContainer": RequirementsContainer_template,
-                 "RequirementsGroup": RequirementsGroup_template,
-                 "Rule": Rule_template,
-                 "RuleVerification": RuleVerification_template,
-                 "RuleVerificationList": RuleVerificationList_template,
-                 "RuleViolation": RuleViolation_template,
-                 "ScalarParameterType": ScalarParameterType_template,
-                 "SimpleParameterValue": SimpleParameterValue_template,
-                 "SimpleParameterizableThing": SimpleParameterizableThing_template,
-                 "SiteLogEntry": SiteLogEntry_template,
-                 "TelephoneNumber": TelephoneNumber_template,
-                 "TopContainer": TopContainer_template,
-                 "UserPreference": UserPreference_template,
-                 "UserRuleVerification": UserRuleVerification_template,
-                 "Thing": Thing_template}
+    if dry_run_only:
+        dry_run(em_dir_path, mission_workers, report_file.format(dbName) if report_file else None)
+        return
 
     start = time.time()
+    telemetry.reset()
+    telemetry.run.update(dbName=dbName, defineSchema=defineSchema, defineRules=defineRules, insertData=insertData,
+                         insertMetadata=insertMetadata, writers=writers, generator_processes=generator_processes,
+                         mission_workers=mission_workers, incremental=incremental)
+
+    if emit_tql:
+        print(f'\nRENDERING to {emit_tql}:')
+        emit_typeql(load_em_files(em_dir_path), TEMPLATES, emit_tql, generator_processes, shard_size,
+                    relationship_spill, templates='hand-written', schemaFile=schemaFile)
+        print(f'\nRendering done in ', round((time.time() - start) / 60, 2), 'minutes.')
+        write_run_report(dbName, report_file, metrics_file)
+        return
 
     print(' \n --> Make sure that your TypeDB server is running  <-- \n')
+    start_rejected_report(dbName)
+
+    with core_client("localhost:1729") as client:
 
-    with TypeDB.core_client("localhost:1729") as client:
+        # map of CDP4 ids to TypeDB iids, persisted next to the other temporary files of the migration
+        iid_map = IidMap(f'iidMap_{dbName}.tsv') if use_iid_map else None
+        # progress of the data insertion, to resume an interrupted run
+        checkpoint = Checkpoint(f'checkpoint_{dbName}.json', resume)
 
         # check that database exists:
         if not client.databases().contains(dbName):
             client.databases().create(dbName)
             print(f'Database {dbName} created.')
+            # iids of a previous database with the same name are not valid anymore
+            if iid_map is not None:
+                iid_map.reset()
+            checkpoint.reset()
         else:
             print(f'Pre-existing database {dbName} found')
 
@@ -641,18 +1210,39 @@ def main(dbName, defineSchema, schemaFile, defineRules, rule_dir, insertData, em
         with client.session(dbName, SessionType.DATA, options) as session:
             print(f'\nDATA INSERTION:')
             if insertData:
+                Templates = TEMPLATES
                 listAvailableTemplates = [x for x in Templates.keys()]
                 print(len(listAvailableTemplates), ' classes templates available')
+                existing_ids, existing_rel_ids = None, None
+                if skip_existing or incremental:
+                    # incremental: ids with their revisionNumber, to re-insert the items of a new revision
+                    existing_ids = fetch_existing_revisions(session) if incremental \
+                        else fetch_existing_ids(session, 'id')
+                    existing_rel_ids = fetch_existing_ids(session, 'rel-id')
+                    print(f'{len(existing_ids)} items and {len(existing_rel_ids)} relationships already in {dbName}')
                 emList = load_em_files(em_dir_path)
                 print(emList)
-                for mission in emList.keys():
-
-                    print(f'Inserting Engineering Model of the "{mission}" mission')
-                    # build_engineering_model_graph(list(em.keys() - {'name'}),
-                    #                               [em[key] for key in em.keys() - {'name'}],
-                    #                               session, Templates)z
-                    build_engineering_model_graph([path for path in emList[mission]],
-                                                  session, Templates)
+                telemetry.count('em_files', sum(len(paths) for paths in emList.values()))
+                if mission_workers > 1:
+                    # the workers read the manifest and iid map from disk
+                    checkpoint.save()
+                    build_missions_in_parallel(emList, mission_workers, {
+                        'dbName': dbName, 'address': "localhost:1729", 'Templates': Templates,
+                        'spill_threshold': relationship_spill, 'writers': writers,
+                        'iid_map_path': iid_map.path if iid_map is not None else None,
+                        'existing_ids': existing_ids, 'existing_rel_ids': existing_rel_ids,
+                        'checkpoint_path': checkpoint.path, 'generator_processes': generator_processes})
+                else:
+                    for mission in emList.keys():
+
+                        print(f'Inserting Engineering Model of the "{mission}" mission')
+                        # build_engineering_model_graph(list(em.keys() - {'name'}),
+                        #                               [em[key] for key in em.keys() - {'name'}],
+                        #                               session, Templates)z
+                        build_engineering_model_graph([path for path in emList[mission]],
+                                                      session, Templates, relationship_spill, writers, iid_map,
+                                                      existing_ids, existing_rel_ids, mission, checkpoint,
+                                                      generator_processes)
 
 
             if insertMetadata:
@@ -662,28 +1252,56 @@ def main(dbName, defineSchema, schemaFile, defineRules, rule_dir, insertData, em
                 files = [file for file in meta_dir.iterdir()]
                 #script_dir = os.path.dirname(os.path.abspath(__file__))
                 #model_dir = os.path.join(script_dir, 'util/all-mpnet-base-v2_local')
-                model = SentenceTransformer('all-mpnet-base-v2')
+                model = SentenceTransformer(SBERT_MODEL)
 
-                for file in tqdm(files):
+                metas = []
+                for file in files:
 
                     if file.suffix == '.json':
                         with file.open('r+', encoding='utf-8-sig') as f:
-                            meta = json.load(f)
-
-                        ## connect to client --> typeDB server must be running
-
-                        # with TypeDB.core_client("localhost:1729") as client:
-                        #     # Create a database
-                        #     with client.session(dbName, SessionType.DATA) as session:
-                        addMetadata(session, meta, model)
+                            metas.append(json.load(f))
+
+                # entities of all missions in one lookup, missions without EM or with metadata already inserted are
+                # skipped and their strings are not encoded
+                anchors = lookup_metadata_anchors(session, [meta.get('TopElementName') for meta in metas
+                                                            if meta.get('TopElementName') is not None])
+                metas = pending_metadata(metas, anchors)
+                with telemetry.timer('stage_seconds', stage='metadata_encoding'):
+                    embeddings = encode_metadata(metas, model, encode_batch_size)
+                telemetry.count('metadata_embeddings', len(embeddings))
+                if get_embedding_cache(SBERT_MODEL) is not None:
+                    print(f'Embedding cache: {get_embedding_cache(SBERT_MODEL).stats()}')
+
+                for meta in tqdm(metas):
+
+                    ## connect to client --> typeDB server must be running
+
+                    # with TypeDB.core_client("localhost:1729") as client:
+                    #     # Create a database
+                    #     with client.session(dbName, SessionType.DATA) as session:
+                    with telemetry.timer('stage_seconds', stage='metadata'):
+                        addMetadata(session, meta, model, embeddings, anchors)
+                get_normalizer().record()
 
         pass
 
     print(f'\nMigration of Schema: {defineSchema}, Rules: {defineRules} and Data: {insertData} done in ',
           round((time.time() - start) / 60, 2), 'minutes.')
 
+    write_run_report(dbName, report_file, metrics_file)
+
     return
 
+def write_run_report(dbName, report_file=RUN_REPORT_FILE, metrics_file=None):
+    '''
+    Writes the telemetry of the run, see main
+    '''
+    if report_file:
+        telemetry.write_json(report_file.format(dbName))
+        print(f'Report of the run written to {report_file.format(dbName)}')
+    if metrics_file:
+        telemetry.write_prometheus(metrics_file)
+
 if __name__ == "__main__":
     '''
     User Inputs
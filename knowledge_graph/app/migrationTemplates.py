@@ -9,20 +9,33 @@
 This script stores all migrations templates called by migrate_em_json.py,
 Each class element from the engineering model migrated to the knowledge graph requires a template:
 writing the insert query to insert the migrated class instance's attributes and roles into the graph.
-The relationships are committed in bulk after the entities and attributes insertion, they are stored in
-tempRelationships.json in the meantime.
+The relationships are committed in bulk after the entities and attributes insertion, they are collected in
+a RelationshipSink (util/relationships.py) in the meantime.
 Class descriptions found in each template function are extracted from the ECSS-E-TM-10-25A User Manual.
 '''
 
-#import json
-import ujson as json
+from util.relationships import RelationshipSink
 # -------------------------------------------------------------
 # Methods
 # -------------------------------------------------------------
 
+# Sink collecting the relationships written by the templates, replaced with set_relationship_sink()
+relationship_sink = RelationshipSink()
+
+def set_relationship_sink(sink):
+    '''
+    Set the sink the templates write their relationships into
+    :param sink: RelationshipSink
+    :return: previously used sink
+    '''
+    global relationship_sink
+    previous = relationship_sink
+    relationship_sink = sink
+    return previous
+
 def write_relationship(relation, r1, c1, p1, r2, c2, p2 ):
     '''
-    Add new parameters to tempRelationships.json to insert a relationship into Grakn keyspace
+    Add new parameters to the relationship sink to insert a relationship into Grakn keyspace
     :param relation: relationship name
     :param r1: role 1
     :param c1: class of player 1
@@ -37,17 +50,7 @@ def write_relationship(relation, r1, c1, p1, r2, c2, p2 ):
     assert type(r2) == str
     assert type(c2) == str
     assert type(p2) == str
-    with open('tempRelationships.json', 'r') as file:
-        data = json.load(file)
-    data['relationship'].append(relation)
-    data['role1'].append(r1)
-    data['player1'].append(p1)
-    data['class1'].append(c1)
-    data['role2'].append(r2)
-    data['class2'].append(c2)
-    data['player2'].append(p2)
-    with open('tempRelationships.json', 'w') as file:
-        json.dump(data, file)
+    relationship_sink.append(relation, r1, c1, p1, r2, c2, p2)
 
     return
 
@@ -186,7 +189,7 @@ def elementUsage_template(item):
     if item["excludeOption"]:
         for i in item["excludeOption"]:
             write_relationship('Reference_excludeOption', 'refersTo', 'ElementUsage', item["iid"],
-                               'isReferredBy', 'Option ', i)
+                               'isReferredBy', 'Option', i)
 
     return graql_insert_query
 
@@ -287,7 +290,7 @@ def Iteration_template(item):
 
     if item["relationship"]:
         for i in item["relationship"]:
-            write_relationship('Containment_relation', 'contains', 'Iteration',
+            write_relationship('Containment_relationship', 'contains', 'Iteration',
                                item["iid"],'isContained', 'Relationship', i)
 
     if item["externalIdentifierMap"]:
@@ -435,7 +438,7 @@ def ParameterGroup_template(item):
 
     if item["containingGroup"]:
         write_relationship('Reference_containingGroup', 'refersTo', 'ParameterGroup',
-                           item["iid"], 'isReferredBy', 'ParameterOrOverrideBase', item["containingGroup"])
+                           item["iid"], 'isReferredBy', 'ParameterGroup', item["containingGroup"])
 
     return graql_insert_query
 
@@ -487,7 +490,7 @@ def ParameterSubscription_template(item):
     if item["valueSet"]:
         for i in item["valueSet"]:
             write_relationship('Containment_valueSet', 'contains', 'ParameterSubscription', item["iid"],
-                               'isContained', 'ParameterValueSet', i)
+                               'isContained', 'ParameterSubscriptionValueSet', i)
     return graql_insert_query
 
 def ParameterSubscriptionValueSet_template(item):
@@ -533,8 +536,8 @@ def RequirementsSpecification_template(item):
 
     if item["group"]:
         for i in item["group"]:
-            write_relationship('Reference_group', 'refersTo', 'RequirementsSpecification', item["iid"],
-                               'isReferredBy', 'ParameterGroup', i)
+            write_relationship('Containment_group', 'contains', 'RequirementsSpecification', item["iid"],
+                               'isContained', 'RequirementsGroup', i)
 
     if item["owner"]:
         write_relationship('Reference_owner', 'refersTo', 'RequirementsSpecification', item["iid"],
@@ -545,16 +548,6 @@ def RequirementsSpecification_template(item):
             write_relationship('Containment_requirement', 'contains', 'RequirementsSpecification',
                                item["iid"], 'isContained', 'Requirement', i)
 
-    if item["category"]:
-        for i in item["category"]:
-            write_relationship('Reference_category', 'refersTo', 'RequirementsSpecification',
-                               item["iid"], 'isReferredBy', 'Category', i)
-
-    if item["parameterValue"]:
-        for i in item["parameterValue"]:
-            write_relationship('Containment_valueSet', 'contains', 'RequirementsSpecification', item["iid"],
-                               'isContained', 'ParameterValueSet', i)
-
     return graql_insert_query
 
 def HyperLink_template(item):
@@ -793,7 +786,7 @@ def DecompositionRule_template(item):
     graql_insert_query += ', has minContained "' + str(item["minContained"]) +'"'
 
     if item["maxContained"]:
-        graql_insert_query += ', has maxContained ' + str(item["maxContained"])
+        graql_insert_query += ', has maxContained "' + str(item["maxContained"]) + '"'
 
     graql_insert_query += ";"
 
@@ -1038,7 +1031,7 @@ def LogarithmicScale_template(item):
             write_relationship('Containment_mappingToReferenceScale', 'contains', 'LogarithmicScale',
                                item["iid"], 'isContained', 'MappingToReferenceScale', i)
 
-    write_relationship('Reference_unit', 'refersTo', 'RatioScale',
+    write_relationship('Reference_unit', 'refersTo', 'LogarithmicScale',
                        item["iid"], 'isReferredBy', 'MeasurementUnit', item["unit"])
 
     if item["referenceQuantityValue"]:
@@ -1838,7 +1831,7 @@ def EnumerationParameterType_template(item):
 
     for i in item["valueDefinition"]:
         write_relationship('Containment_valueDefinition', 'contains', 'EnumerationParameterType',
-                               item["iid"], 'isContained', 'ScaleValueDefinition', i["v"])
+                               item["iid"], 'isContained', 'EnumerationValueDefinition', i["v"])
 
     return graql_insert_query
 
@@ -2113,10 +2106,6 @@ def SiteReferenceDataLibrary_template(item):
         for i in item["parameterType"]:
             write_relationship('Containment_parameterType', 'contains', 'SiteReferenceDataLibrary',
                                item["iid"], 'isContained', 'ParameterType', i)
-    if item["parameterType"]:
-        for i in item["parameterType"]:
-            write_relationship('Containment_parameterType', 'contains', 'SiteReferenceDataLibrary',
-                               item["iid"], 'isContained', 'ParameterType', i)
 
     if item["scale"]:
         for i in item["scale"]:
@@ -2193,37 +2182,37 @@ def Person_template(item):
 
     if item["emailAddress"]:
         for i in item["emailAddress"]:
-            write_relationship('Containment_emailAddress', 'contains', 'SiteReferenceDataLibrary',
+            write_relationship('Containment_emailAddress', 'contains', 'Person',
                                item["iid"], 'isContained', 'EmailAddress', i)
 
     if item["telephoneNumber"]:
         for i in item["telephoneNumber"]:
-            write_relationship('Containment_telephoneNumber', 'contains', 'SiteReferenceDataLibrary',
+            write_relationship('Containment_telephoneNumber', 'contains', 'Person',
                                item["iid"], 'isContained', 'TelephoneNumber', i)
 
     if item["userPreference"]:
         for i in item["userPreference"]:
-            write_relationship('Containment_userPreference', 'contains', 'SiteReferenceDataLibrary',
+            write_relationship('Containment_userPreference', 'contains', 'Person',
                                item["iid"], 'isContained', 'UserPreference', i)
 
     if item["organization"]:
-        write_relationship('Reference_organization', 'refersTo', 'SiteReferenceDataLibrary',
+        write_relationship('Reference_organization', 'refersTo', 'Person',
                            item["iid"], 'isReferredBy', 'Organization', item["organization"])
 
     if item["defaultDomain"]:
-        write_relationship('Reference_defaultDomain', 'refersTo', 'SiteReferenceDataLibrary',
+        write_relationship('Reference_defaultDomain', 'refersTo', 'Person',
                            item["iid"], 'isReferredBy', 'DomainOfExpertise', item["defaultDomain"])
 
     if item["role"]:
-        write_relationship('Reference_role', 'refersTo', 'SiteReferenceDataLibrary',
+        write_relationship('Reference_role', 'refersTo', 'Person',
                            item["iid"], 'isReferredBy', 'PersonRole', item["role"])
 
     if item["defaultEmailAddress"]:
-        write_relationship('Reference_defaultEmailAddress', 'refersTo', 'SiteReferenceDataLibrary',
+        write_relationship('Reference_defaultEmailAddress', 'refersTo', 'Person',
                            item["iid"], 'isReferredBy', 'EmailAddress', item["defaultEmailAddress"])
 
     if item["defaultTelephoneNumber"]:
-        write_relationship('Reference_defaultTelephoneNumber', 'refersTo', 'SiteReferenceDataLibrary',
+        write_relationship('Reference_defaultTelephoneNumber', 'refersTo', 'Person',
                            item["iid"], 'isReferredBy', 'TelephoneNumber', item["defaultTelephoneNumber"])
 
     return graql_insert_query
@@ -2399,8 +2388,9 @@ def EngineeringModelSetup_template(item):
             write_relationship('Containment_participant', 'contains', 'EngineeringModelSetup',
                                item["iid"], 'isContained', 'Participant', i)
 
-    write_relationship('Containment_requiredRdl', 'contains', 'EngineeringModelSetup',
-                       item["iid"], 'isContained', 'ModelReferenceDataLibrary', i)
+    for i in item["requiredRdl"]:
+        write_relationship('Containment_requiredRdl', 'contains', 'EngineeringModelSetup',
+                           item["iid"], 'isContained', 'ModelReferenceDataLibrary', i)
 
     for i in item["iterationSetup"]:
         write_relationship('Containment_iterationSetup', 'contains', 'EngineeringModelSetup',
@@ -2443,7 +2433,7 @@ def Participant_template(item):
     graql_insert_query += ";"
 
     write_relationship('Reference_role', 'refersTo', 'Participant',
-                           item["iid"], 'isReferredBy', 'PersonRole', item["role"])
+                           item["iid"], 'isReferredBy', 'ParticipantRole', item["role"])
 
     write_relationship('Reference_person', 'refersTo', 'Participant',
                        item["iid"], 'isReferredBy', 'Person', item["person"])
@@ -3150,7 +3140,7 @@ def MultiRelationshipRule_template(item):
             write_relationship('Containment_hyperLink', 'contains', 'MultiRelationshipRule',
                                item["iid"], 'isContained', 'HyperLink', i)
 
-    write_relationship('Reference_relationCategory', 'refersTo', 'MultiRelationshipRule',
+    write_relationship('Reference_relationshipCategory', 'refersTo', 'MultiRelationshipRule',
                        item["iid"], 'isReferredBy', 'Category', item["relationshipCategory"])
 
     for i in item["relatedCategory"]:
@@ -3641,7 +3631,7 @@ def QuantityKind_template(item):
         combined = ''
         for i in item["quantityDimensionExponent"]:
             combined += clean(i) + ' ,'
-        graql_insert_query += ', hasq uantityDimensionExponent "' + combined + '"'
+        graql_insert_query += ', has quantityDimensionExponent "' + combined + '"'
 
     graql_insert_query += ";"
 
@@ -3670,7 +3660,7 @@ def QuantityKind_template(item):
             write_relationship('Reference_possibleScale', 'refersTo', 'QuantityKind',
                                item["iid"], 'isReferredBy', 'MeasurementScale', i)
 
-    write_relationship('Reference_defaultScale', 'refersTo', 'SpecializedQuantityKind',
+    write_relationship('Reference_defaultScale', 'refersTo', 'QuantityKind',
                        item["iid"], 'isReferredBy', 'MeasurementScale', item["defaultScale"])
 
     if item["allPossibleScale"]:
@@ -3871,7 +3861,7 @@ def Requirement_template(item):
 
     if item["group"]:
         write_relationship('Reference_group', 'refersTo', 'Requirement', item["iid"],
-                           'isReferredBy', 'ParameterGroup', item["group"])
+                           'isReferredBy', 'RequirementsGroup', item["group"])
 
     if item["category"]:
         for i in item["category"]:
@@ -4249,6 +4239,135 @@ def Thing_template(item):
     return graql_insert_query
 
 # -------------------------------------------------------------
-# END
+# Templates functions by classKind
 # -------------------------------------------------------------
+TEMPLATES = {"ElementDefinition": elementDefinition_template,
+             "ElementUsage": elementUsage_template,
+             "Parameter": Parameter_template,
+             "ParameterValueSet": ParameterValueSet_template,
+             "Iteration": Iteration_template,
+             "DomainFileStore": domainFileStore_template,
+             "Option": Option_template,
+             "Publication": Publication_template,
+             "ParameterGroup": ParameterGroup_template,
+             "Definition": Definition_template,
+             "ParameterSubscription": ParameterSubscription_template,
+             "ParameterSubscriptionValueSet": ParameterSubscriptionValueSet_template,
+             "RequirementsSpecification": RequirementsSpecification_template,
+             "HyperLink": HyperLink_template,
+             "Category": Category_template,
+             "TextParameterType": TextParameterType_template,
+             "ParameterTypeComponent": ParameterTypeComponent_template,
+             "ReferenceSource": ReferenceSource_template,
+             "BooleanParameterType": BooleanParameterType_template,
+             "BinaryRelationshipRule": BinaryRelationshipRule_template,
+             "Alias": Alias_template,
+             "RatioScale": RatioScale_template,
+             "ArrayParameterType": ArrayParameterType_template,
+             "LinearConversionUnit": LinearConversionUnit_template,
+             "PrefixedUnit": PrefixedUnit_template,
+             "Glossary": Glossary_template,
+             "LogarithmicScale": LogarithmicScale_template,
+             "DerivedUnit": DerivedUnit_template,
+             "ScaleReferenceQuantityValue": ScaleReferenceQuantityValue_template,
+             "UnitFactor": UnitFactor_template,
+             "OrdinalScale": OrdinalScale_template,
+             "DateTimeParameterType": DateTimeParameterType_template,
+             "Term": Term_template,
+             "TimeOfDayParameterType": TimeOfDayParameterType_template,
+             "QuantityKindFactor": QuantityKindFactor_template,
+             "ScaleValueDefinition": ScaleValueDefinition_template,
+             "FileType": FileType_template,
+             "EnumerationParameterType": EnumerationParameterType_template,
+             "UnitPrefix": UnitPrefix_template,
+             "Constant": Constant_template,
+             "DateParameterType": DateParameterType_template,
+             "IntervalScale": IntervalScale_template,
+             "CyclicRatioScale": CyclicRatioScale_template,
+             "EnumerationValueDefinition": EnumerationValueDefinition_template,
+             "Citation": Citation_template,
+             "DecompositionRule": DecompositionRule_template,
+             "CompoundParameterType": CompoundParameterType_template,
+             "MappingToReferenceScale": MappingToReferenceScale_template,
+             "DerivedQuantityKind": DerivedQuantityKind_template,
+             "ParameterizedCategoryRule": ParameterizedCategoryRule_template,
+             "SpecializedQuantityKind": SpecializedQuantityKind_template,
+             "SimpleUnit": SimpleUnit_template,
+             "SimpleQuantityKind": SimpleQuantityKind_template,
+             "SiteDirectory": SiteDirectory_template,
+             "SiteReferenceDataLibrary": SiteReferenceDataLibrary_template,
+             "Person": Person_template,
+             "ModelReferenceDataLibrary": ModelReferenceDataLibrary_template,
+             "EmailAddress": EmailAddress_template,
+             "DomainOfExpertise": DomainOfExpertise_template,
+             "EngineeringModelSetup": EngineeringModelSetup_template,
+             "IterationSetup": IterationSetup_template,
+             "Participant": Participant_template,
+             "EngineeringModel": EngineeringModel_template,
+             "ActualFiniteState": ActualFiniteState_template,
+             "ActualFiniteStateList": ActualFiniteStateList_template,
+             "AndExpression": AndExpression_template,
+             "BinaryRelationship": BinaryRelationship_template,
+             "BooleanExpression": BooleanExpression_template,
+             "BuiltInRuleVerification": BuiltInRuleVerification_template,
+             "CommonFileStore": CommonFileStore_template,
+             "ConversionBasedUnit": ConversionBasedUnit_template,
+             "DefinedThing": DefinedThing_template,
+             "DomainOfExpertiseGroup": DomainOfExpertiseGroup_template,
+             "ElementBase": ElementBase_template,
+             "ExclusiveOrExpression": ExclusiveOrExpression_template,
+             "ExternalIdentifierMap": ExternalIdentifierMap_template,
+             "File": File_template,
+             "FileRevision": FileRevision_template,
+             "FileStore": FileStore_template,
+             "Folder": Folder_template,
+             "IdCorrespondence": IdCorrespondence_template,
+             "MeasurementScale": MeasurementScale_template,
+             "MeasurementUnit": MeasurementUnit_template,
+             "ModelLogEntry": ModelLogEntry_template,
+             "MultiRelationship": MultiRelationship_template,
+             "MultiRelationshipRule": MultiRelationshipRule_template,
+             "NaturalLanguage": NaturalLanguage_template,
+             "NestedElement": NestedElement_template,
+             "NestedParameter": NestedParameter_template,
+             "NotExpression": NotExpression_template,
+             "OrExpression": OrExpression_template,
+             "Organization": Organization_template,
+             "ParameterBase": ParameterBase_template,
+             "ParameterOrOverrideBase": ParameterOrOverrideBase_template,
+             "ParameterOverride": ParameterOverride_template,
+             "ParameterOverrideValueSet": ParameterOverrideValueSet_template,
+             "ParameterType": ParameterType_template,
+             "ParameterValueSetBase": ParameterValueSetBase_template,
+             "ParametricConstraint": ParametricConstraint_template,
+             "ParticipantPermission": ParticipantPermission_template,
+             "ParticipantRole": ParticipantRole_template,
+             "PersonPermission": PersonPermission_template,
+             "PersonRole": PersonRole_template,
+             "PossibleFiniteState": PossibleFiniteState_template,
+             "PossibleFiniteStateList": PossibleFiniteStateList_template,
+             "QuantityKind": QuantityKind_template,
+             "ReferenceDataLibrary": ReferenceDataLibrary_template,
+             "ReferencerRule": ReferencerRule_template,
+             "RelationalExpression": RelationalExpression_template,
+             "Relationship": Relationship_template,
+             "Requirement": Requirement_template,
+             "RequirementsContainer": RequirementsContainer_template,
+             "RequirementsGroup": RequirementsGroup_template,
+             "Rule": Rule_template,
+             "RuleVerification": RuleVerification_template,
+             "RuleVerificationList": RuleVerificationList_template,
+             "RuleViolation": RuleViolation_template,
+             "ScalarParameterType": ScalarParameterType_template,
+             "SimpleParameterValue": SimpleParameterValue_template,
+             "SimpleParameterizableThing": SimpleParameterizableThing_template,
+             "SiteLogEntry": SiteLogEntry_template,
+             "TelephoneNumber": TelephoneNumber_template,
+             "TopContainer": TopContainer_template,
+             "UserPreference": UserPreference_template,
+             "UserRuleVerification": UserRuleVerification_template,
+             "Thing": Thing_template}
 
+# -------------------------------------------------------------
+# END
+# -------------------------------------------------------------
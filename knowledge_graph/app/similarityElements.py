@@ -9,28 +9,50 @@
 from typedb.client import *
 from tqdm import tqdm
 import json
-from util.utils import (load_Acronyms, replace_Acronyms, typeql_batch_insertion)
+from util.utils import typeql_batch_insertion
+from util.normalization import get_normalizer
+from util.embedding_cache import encode_cached
+from util.embedding_codec import encode_embedding, decode_embedding
+from util.batching import AdaptiveBatchSize, commit_batch
+from util.connection import core_client
 import pandas as pd
 import collections
 import os
 import re
 from sentence_transformers import SentenceTransformer, util
 
-def remove_underscore(text):
-    return text.replace("_", ' ')
+# Number of names encoded per forward pass of the sentence transformer
+ENCODE_BATCH_SIZE = 64
+# Sentence transformer embedding the names, also the key of its vectors in the embedding cache
+MODEL_NAME = 'all-mpnet-base-v2'
 
-
-def embed_elements(mappings, acronyms, expansions):
+def embed_elements(mappings, normalizer=None, batch_size=ENCODE_BATCH_SIZE):
+    """
+    Embeds the names of the ElementDefinitions: the names are normalized, each distinct normalized name is encoded
+    once, in batches of names of similar length (less padding), and its vector is given to every iid with that name.
+    Names encoded by a previous run are read from the embedding cache (util/embedding_cache.py)
+    :param mappings: list of (name, iid), see get_element_names_ids
+    :param normalizer: optional TextNormalizer of the names, see util/normalization.py
+    :param batch_size: number of names per forward pass of the model
+    :return: list of {'iid', 'embed'}, in the order of mappings
+    """
     #script_dir = os.path.dirname(os.path.abspath(__file__))
     #model_dir = os.path.join(script_dir, 'util/all-mpnet-base-v2_local')
-    model = SentenceTransformer('all-mpnet-base-v2')
+    model = SentenceTransformer(MODEL_NAME)
 
     names = [mapping[0] for mapping in mappings]
     iids = [mapping[1] for mapping in mappings]
-    embeds = [model.encode(replace_Acronyms(remove_underscore(name),acronyms,expansions)) for name in tqdm(names)]
-    embeds = [str(list(embed)) for embed in embeds]
-
-    return [{'iid': iid, 'embed': embed} for iid, embed in zip(iids, embeds)]
+    # underscores and acronyms of the names, normalized once per distinct name
+    normalizer = normalizer or get_normalizer(underscores=True)
+    texts = [normalizer.normalize(name) for name in names]
+    normalizer.record()
+    # longest first, so each batch holds names of about the same number of tokens
+    unique_texts = sorted(set(texts), key=lambda text: (-len(text), text))
+    print(f"Encoding {len(unique_texts)} distinct names of {len(texts)} ElementDefinitions...")
+    vectors = encode_cached(model, MODEL_NAME, unique_texts, batch_size=batch_size, show_progress_bar=True)
+    embeds = {text: encode_embedding(vector) for text, vector in zip(unique_texts, vectors)}
+
+    return [{'iid': iid, 'embed': embeds[text]} for iid, text in zip(iids, texts)]
 
 def get_element_names_ids(session):
 
@@ -60,7 +82,7 @@ def get_element_ids_embeds(session):
         answers = [ans for ans in iterator]
         iids = [ans.get('ed').get_iid() for ans in answers]
         elements = [ans.get('nameed').get_value() for ans in answers]
-        embeds = [json.loads(ans.get('sbe').get_value()) for ans in answers]
+        embeds = [decode_embedding(ans.get('sbe').get_value()) for ans in answers]
 
         return {iid:embed for iid, embed in zip(iids, embeds)}
 
@@ -91,15 +113,16 @@ def embeddings_insertion(embeding_dic, session):
     insertion_query = '''match $ED iid {iid};      
                            insert $ED has s_bert_embedding "{embed}";'''
 
-    typeql_batch_insertion(insertion_query, embeding_dic, session, batch_size=128)
+    typeql_batch_insertion(insertion_query, embeding_dic, session, batch_size=128, kind='Embedding')
 
 
 def calculate_element_sims_name(iids_dicts,session):
 
 
-    counter = 0
     batch_query = []
-    batch = 1024
+    batch_bytes = 0
+    ## transactions start at 1024 queries, resized by their commit latency
+    adaptive_size = AdaptiveBatchSize(1024)
 
     #iids = [result[0] for result in results]
     iids = list(iids_dicts.keys())
@@ -125,27 +148,15 @@ def calculate_element_sims_name(iids_dicts,session):
                 if sim < 0.3:
                     continue
 
-                counter += 1
-                if counter < batch:
-
-                    batch_query.append(typeql_insert_query)
-
-                else:
+                batch_query.append(typeql_insert_query)
+                batch_bytes += len(typeql_insert_query)
+                if adaptive_size.full(len(batch_query), batch_bytes):
                     print('inserting...')
-                    batch_query.append(typeql_insert_query)
-                    with session.transaction(TransactionType.WRITE) as transaction:
-
-                        for query in batch_query:
-                            transaction.query().insert(query)
-                        transaction.commit()
-                        counter = 0
-                        batch_query = []
+                    commit_batch(session, batch_query, 'Similarity', adaptive_size=adaptive_size)
+                    batch_query = []
+                    batch_bytes = 0
 
-    with session.transaction(TransactionType.WRITE) as transaction:
-        for query in batch_query:
-            transaction.query().insert(query)
-        transaction.commit()
-        counter = 0
+    commit_batch(session, batch_query, 'Similarity', adaptive_size=adaptive_size)
 
 
 def _del_elements_sims_high_number(session):
@@ -328,27 +339,24 @@ def insert_jaccard_sims(scores, session):
                 write_transaction.query().insert(typeql_insert_query)
                 write_transaction.commit()
 
-def main(dbName):
+def main(dbName, batch_size=ENCODE_BATCH_SIZE):
 
-    with TypeDB.core_client('localhost:1729') as client:
+    with core_client('localhost:1729') as client:
         with client.session(dbName, SessionType.DATA) as session:
 
             ## get all Element definitions from database
             name_iid_mapping = get_element_names_ids(session)
             print(f"{len(name_iid_mapping)} ElementDefinitions found in database.")
 
-            # ## Load Acronym expansion
-            script_dir = os.path.dirname(os.path.abspath(__file__))
-            #print(script_dir)
-            # acronyms_path = pathlib.Path(script_dir,'/util/ecss_acronyms.txt')
-            acronyms_path = os.path.join(script_dir, 'util/ecss_acronyms.txt')
-            acronyms, expansions = load_Acronyms(acronyms_path)
+            # ## Names normalized with the acronym expansion shared by all embeddings (util/normalization.py)
+            normalizer = get_normalizer(underscores=True)
 
             # ## Delete old embeddings
             _del_elements_embeds(session)
 
             # ## Create embeddings for elements names
-            embeding_dic = embed_elements(name_iid_mapping,acronyms, expansions)
+            embeding_dic = embed_elements(name_iid_mapping, normalizer, batch_size)
+            print(f"Name normalization cache: {normalizer.stats()}")
             assert len(embeding_dic) == len(name_iid_mapping)
 
             # ## Insert embeddings into database
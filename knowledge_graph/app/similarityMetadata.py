@@ -10,7 +10,8 @@ from tqdm import tqdm
 import json
 import itertools
 
-from util.utils import (load_Acronyms, replace_Acronyms)
+from util.connection import core_client
+from util.embedding_codec import decode_embedding
 
 import re
 from sentence_transformers import SentenceTransformer, util
@@ -46,7 +47,7 @@ def get_metadata_from_KG(mission, session):
         parameters = [ans.get('parameter').get_iid() for ans in answers]
 
         values = [ans.get('value').get_value() for ans in answers]
-        embeds = [json.loads(ans.get('embed').get_value()) for ans in answers]
+        embeds = [decode_embedding(ans.get('embed').get_value()) for ans in answers]
 
         # for parameter, value, embed in zip(parameters, values, embeds):
         for parameterstype, parameter, value, embed in zip(parameterstypes, parameters, values, embeds):
@@ -92,8 +93,8 @@ def get_metadata_from_KG(mission, session):
 
         iids = [ans.get("reqspec").get_iid() for ans in answers1] + [ans.get("req").get_iid() for ans in answers2]
 
-        embeds = [json.loads(ans.get("embed").get_value()) for ans in answers1] + [json.loads(ans.get("embed").get_value())
-                                                                                   for ans in answers2]
+        embeds = [decode_embedding(ans.get("embed").get_value()) for ans in answers1] + [decode_embedding(
+            ans.get("embed").get_value()) for ans in answers2]
 
         # temp_metadata['requirements']=  temp_metadata.get('requirements', []) +[(iids, embeds)]
         temp_metadata['requirements'] = [{'iid': iid, 'encoding': embed} for iid, embed in zip(iids, embeds)]
@@ -317,7 +318,7 @@ def delete_previous_sims(session):
 
 
 def main(dbName):
-    with TypeDB.core_client("localhost:1729") as client:
+    with core_client("localhost:1729") as client:
         with client.session(dbName, SessionType.DATA) as session:
 
             delete_previous_sims(session)
@@ -0,0 +1,307 @@
+# This Source Code Form is subject to the terms of the Mozilla Public ---------------------
+# License, v. 2.0. If a copy of the MPL was not distributed with this ---------------------
+# file, You can obtain one at http://mozilla.org/MPL/2.0/. */ -----------------------------
+# ---------------- Copyright (C) 2022 University of Strathclyde and Author ----------------
+# -------------------------------- Author: Paul Darm / Audrey Berquand --------------------------------
+# ------------------------- e-mail: paul.darm@strath.ac.uk --------------------------
+
+'''
+Schema-driven migration templates.
+Instead of one hand-written function per class (migrationTemplates.py), the TypeDB schema layer is read once and one
+CompiledTemplate is built per entity type:
+- the attributes it owns (inherited ones included) are read from the JSON keys of the same name,
+- each "plays Containment_x:contains" / "plays Reference_x:refersTo" becomes a relationship emitter reading the
+  ids of the other players from the JSON key x, the class of the other player is taken from the schema.
+Compiled templates are called like the hand-written ones: template(item) returns the insert query and writes the
+relationships of the item into the relationship sink of migrationTemplates.py.
+What the schema does not tell is listed in the tables below (properties CDP4 derives, optional attributes, classes of
+the other players), so that the compiled templates give the same output as the hand-written ones, which is checked
+by benchmarks/check_templates.py.
+'''
+
+import re
+from collections import defaultdict
+
+import migrationTemplates
+from migrationTemplates import clean
+
+# JSON keys of the attributes which are not named after the attribute
+ATTRIBUTE_KEYS = {'id': 'iid',
+                  'lastModifiedOn': 'modifiedOn'}
+
+# role played by the item whose JSON lists the other players, and role of the other players
+EMITTING_ROLES = {'contains': 'isContained',
+                  'refersTo': 'isReferredBy'}
+
+# Properties of the schema which are not read from the EM exports, per entity type and inherited by its subtypes:
+# properties CDP4 derives from other items, which the exports do not hold (e.g. the parameter type of a
+# ParameterOverride is the one of its Parameter). The templates of abstract types keep all their properties
+SKIPPED_KEYS = {
+    'ActualFiniteState': {'name', 'shortName', 'owner'},
+    'ActualFiniteStateList': {'name', 'shortName'},
+    'ArrayParameterType': {'hasSingleComponentType', 'rank'},
+    'ParameterType': {'numberOfValues'},
+    'QuantityKind': {'quantityDimensionExponent', 'quantityDimensionExpression', 'allPossibleScale'},
+    'ParameterOverride': {'isOptionDependent', 'group', 'parameterType', 'scale', 'stateDependence'},
+    'ParameterSubscription': {'isOptionDependent', 'group', 'parameterType', 'scale', 'stateDependence'},
+    'ParameterValueSetBase': {'actualValue', 'owner'},
+    'ParameterOverrideValueSet': {'actualOption', 'actualState'},
+    'ParameterSubscriptionValueSet': {'actualValue', 'computed', 'reference', 'actualOption', 'actualState',
+                                      'owner', 'subscribedValueSet'},
+    'Person': {'name'},
+    'PossibleFiniteState': {'owner'},
+    'PrefixedUnit': {'conversionFactor', 'name', 'shortName'},
+}
+
+# Attributes only written when set (not empty, false or 0), per entity type and inherited by its subtypes
+OPTIONAL_ATTRIBUTES = {
+    'Thing': {'author', 'executedOn', 'externalToolVersion', 'frozenOn', 'isAbstract', 'language', 'location',
+              'maxContained', 'maximumPermissibleValue', 'minimumPermissibleValue', 'negativeValueConnotation',
+              'organizationalUnit', 'password', 'positiveValueConnotation', 'publicationYear',
+              'quantityDimensionSymbol', 'remark', 'sourceEngineeringModelSetupIid', 'sourceIterationIid',
+              'versionDate', 'versionIdentifier'},
+    'Category': {'isDeprecated'},
+    'QuantityKindFactor': {'exponent'},
+}
+
+# List attributes of which only the first value is written, per entity type
+FIRST_VALUE_ATTRIBUTES = {
+    'TelephoneNumber': {'vcardType'},
+}
+
+# Class of the other players of a relationship, per entity type (inherited by its subtypes) and JSON key, where the
+# schema allows several classes: their common supertype would not tell the players apart
+PLAYER_CLASSES = {
+    ('Citation', 'source'): 'ReferenceSource',
+    ('EngineeringModel', 'logEntry'): 'ModelLogEntry',
+    ('SiteDirectory', 'logEntry'): 'SiteLogEntry',
+    ('EnumerationParameterType', 'valueDefinition'): 'EnumerationValueDefinition',
+    ('MeasurementScale', 'valueDefinition'): 'ScaleValueDefinition',
+    ('ParameterBase', 'group'): 'ParameterGroup',
+    ('Requirement', 'group'): 'RequirementsGroup',
+    ('Parameter', 'valueSet'): 'ParameterValueSet',
+    ('ParameterOverride', 'valueSet'): 'ParameterOverrideValueSet',
+    ('ParameterSubscription', 'valueSet'): 'ParameterSubscriptionValueSet',
+    ('Participant', 'role'): 'ParticipantRole',
+    ('Person', 'role'): 'PersonRole',
+}
+
+
+def parse_schema(schema_file):
+    '''
+    Read the type definitions of a TypeDB schema
+    :param schema_file: .tql schema file
+    :return: dict type -> {'sub': parent type, 'abstract': bool, 'owns': [attributes], 'plays': [(relation, role)],
+             'relates': [roles]}
+    '''
+    with open(schema_file, 'r', encoding='utf-8') as file:
+        schema = re.sub(r'#.*', '', file.read())
+    schema = re.sub(r'^\s*define\s', '', schema)
+
+    types = {}
+    for statement in schema.split(';'):
+        match = re.match(r'\s*([\w-]+)\s+sub\s+([\w-]+)(.*)', statement, re.S)
+        if match is None:
+            continue
+        name, parent, properties = match.groups()
+        types[name] = {'sub': parent,
+                       'abstract': re.search(r'\babstract\b', properties) is not None,
+                       'owns': re.findall(r'\bowns\s+([\w-]+)', properties),
+                       'plays': re.findall(r'\bplays\s+([\w-]+):([\w-]+)', properties),
+                       'relates': re.findall(r'\brelates\s+([\w-]+)', properties)}
+    return types
+
+
+def supertypes(types, name):
+    '''
+    :return: list of the types name inherits from, from the root type down to name itself
+    '''
+    chain = []
+    while name in types:
+        chain.append(name)
+        name = types[name]['sub']
+    return chain[::-1]
+
+
+def common_supertype(types, names):
+    '''
+    :return: most specific type all names inherit from
+    '''
+    chains = [supertypes(types, name) for name in names]
+    common = None
+    for level in zip(*chains):
+        if len(set(level)) > 1:
+            break
+        common = level[0]
+    return common
+
+
+def inherited(table, types, name, key):
+    '''
+    :param table: dict entity type -> set of JSON keys, see SKIPPED_KEYS
+    :return: whether the key is listed for the entity type or one of its supertypes
+    '''
+    return any(key in table.get(parent, ()) for parent in supertypes(types, name))
+
+
+def skipped(types, name, key):
+    '''
+    :return: whether the JSON key is not read by the template of the entity type, see SKIPPED_KEYS
+    '''
+    return not types[name]['abstract'] and inherited(SKIPPED_KEYS, types, name, key)
+
+
+def player_class(types, name, key, players):
+    '''
+    :param players: entity types which can be the other player according to the schema
+    :return: class of the other players of the relationship read from the JSON key, see PLAYER_CLASSES
+    '''
+    for parent in reversed(supertypes(types, name)):
+        if (parent, key) in PLAYER_CLASSES:
+            return PLAYER_CLASSES[(parent, key)]
+    return common_supertype(types, players)
+
+
+def format_value(value):
+    '''
+    Format one JSON value as the content of a TypeDB string attribute
+    - lists (e.g. notes, ordered items {"k", "v"}) are combined into one value, as an entity only owns one instance
+      of each attribute
+    - value arrays such as '["-"]' are cleaned
+    - double quotes would end the TypeQL string, they are replaced by single quotes
+    '''
+    if type(value) is str:
+        if value.startswith('['):
+            return clean(value)
+        return value.replace('"', "'")
+    if type(value) in (bool, int, float):
+        return str(value)
+    if type(value) is list:
+        combined = ''
+        for i in value:
+            if type(i) is dict:
+                i = i.get('v')
+            combined += clean(str(i)) + ' ,'
+        return combined
+    return clean(str(value))
+
+
+class CompiledTemplate:
+    '''
+    Insert query and relationship emitters of one entity type, precomputed from the schema.
+    The renderer is generated as the source of one Python function, with the attribute prefixes and relationship
+    names as constants, and compiled once. Only the schema-derived description is pickled, the function is compiled
+    again when a template is sent to the worker processes rendering EM files.
+    '''
+
+    __slots__ = ('entity', 'attributes', 'relationships', 'source', '_render')
+
+    def __init__(self, entity, attributes, relationships):
+        '''
+        :param entity: entity type
+        :param attributes: list of (attribute, JSON key, how the value is written: None, 'optional' only when set
+                           or 'first' only the first value of the list)
+        :param relationships: list of (JSON key, relationship, role of the item, role of the other player,
+                              class of the other player)
+        '''
+        self.entity = entity
+        self.attributes = tuple(attributes)
+        self.relationships = tuple(relationships)
+        self.source = self.generate()
+        namespace = {'format_value': format_value, 'migrationTemplates': migrationTemplates}
+        exec(compile(self.source, f'<template {entity}>', 'exec'), namespace)
+        self._render = namespace['render']
+
+    def generate(self):
+        '''
+        :return: source of the render(item) function
+        '''
+        lines = ['def render(item):',
+                 '    get = item.get',
+                 f'    query = {"insert $x isa " + self.entity!r}']
+        for attribute, key, written in self.attributes:
+            prefix = repr(', has ' + attribute + ' "')
+            lines.append(f'    value = get({key!r})')
+            if written == 'first':
+                lines += ['    if value:',
+                          f'        query += {prefix} + format_value(value[0]) + \'"\'']
+                continue
+            present = 'value' if written == 'optional' else 'value is not None and value != []'
+            lines += [f'    if {"value and " if written == "optional" else ""}type(value) is str and value[:1] != "[":',
+                      f'        query += {prefix} + value.replace(\'"\', "\'") + \'"\'',
+                      f'    elif {present}:',
+                      f'        query += {prefix} + format_value(value) + \'"\'']
+        lines.append("    query += ';'")
+
+        if self.relationships:
+            lines += ['    append = migrationTemplates.relationship_sink.append',
+                      "    iid = item['iid']"]
+        for key, relation, role1, role2, class2 in self.relationships:
+            lines += [f'    players = get({key!r})',
+                      '    if players:',
+                      '        for player in (players if type(players) is list else (players,)):',
+                      f'            append({relation!r}, {role1!r}, {self.entity!r}, iid, {role2!r}, {class2!r},',
+                      "                   player['v'] if type(player) is dict else player)"]
+        lines.append('    return query')
+        return '\n'.join(lines) + '\n'
+
+    def __reduce__(self):
+        return CompiledTemplate, (self.entity, self.attributes, self.relationships)
+
+    def __call__(self, item):
+        '''
+        :param item: class element from engineering model
+        :return: insert query
+        '''
+        return self._render(item)
+
+    def __repr__(self):
+        return f'CompiledTemplate({self.entity})'
+
+
+def compile_templates(schema_file):
+    '''
+    Build one CompiledTemplate per entity type of the schema
+    :param schema_file: .tql schema file
+    :return: dict classKind -> template, used like the Templates dict of hand-written functions
+    '''
+    types = parse_schema(schema_file)
+    entities = [name for name in types if types[supertypes(types, name)[0]]['sub'] == 'entity']
+
+    # entity types declaring each (relationship, role)
+    players = defaultdict(list)
+    for name in entities:
+        for relation, role in types[name]['plays']:
+            players[(relation, role)].append(name)
+
+    templates = {}
+    for name in entities:
+        attributes = []
+        relationships = []
+        for parent in supertypes(types, name):
+            for attribute in types[parent]['owns']:
+                key = ATTRIBUTE_KEYS.get(attribute, attribute)
+                if skipped(types, name, key):
+                    continue
+                if key in FIRST_VALUE_ATTRIBUTES.get(name, ()):
+                    written = 'first'
+                elif inherited(OPTIONAL_ATTRIBUTES, types, name, key):
+                    written = 'optional'
+                else:
+                    written = None
+                attributes.append((attribute, key, written))
+            for relation, role in types[parent]['plays']:
+                if role not in EMITTING_ROLES:
+                    continue
+                key = relation.split('_', 1)[1]
+                if skipped(types, name, key):
+                    continue
+                other_role = EMITTING_ROLES[role]
+                if not players[(relation, other_role)]:
+                    # no entity can be the other player, such a relationship could not be inserted
+                    continue
+                relationships.append((key, relation, role, other_role,
+                                      player_class(types, name, key, players[(relation, other_role)])))
+        templates[name] = CompiledTemplate(name, attributes, relationships)
+
+    return templates
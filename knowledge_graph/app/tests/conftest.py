@@ -0,0 +1,65 @@
+import os
+import sys
+
+import pytest
+
+APP_DIR = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+# the modules of the app import each other from the app directory, as when run from it
+sys.path.insert(0, APP_DIR)
+# synthetic Engineering Models of the benchmarks, see benchmarks/synthetic.py
+sys.path.insert(1, os.path.join(APP_DIR, 'benchmarks'))
+
+SCHEMA_FILE = os.path.join(APP_DIR, 'TypeDB', 'schema', 'TypeDBSchemaECSS_relunique.tql')
+
+
+@pytest.fixture
+def fake(tmp_path, monkeypatch):
+    '''
+    In-process fake TypeDB with a "testdb" database, run from tmp_path (rejected queries report and spill files)
+    '''
+    from util.batching import start_rejected_report
+    from util.fake_typedb import FakeTypeDB
+    from util.telemetry import telemetry
+
+    monkeypatch.chdir(tmp_path)
+    telemetry.reset()
+    start_rejected_report('testdb')
+    return FakeTypeDB(reject=['isa Rejected'], databases=['testdb'])
+
+
+@pytest.fixture
+def session(fake):
+    with fake.core_client() as client, client.session('testdb', None) as session:
+        yield session
+
+
+@pytest.fixture(scope='session')
+def synthetic_files():
+    '''
+    :return: function (nb_elements, seed) -> files of a synthetic EM, see synthetic_engineering_model
+    '''
+    from migrationTemplates import TEMPLATES
+    from synthetic import synthetic_engineering_model
+    from templateCompiler import compile_templates, parse_schema
+
+    compiled, schema_types = compile_templates(SCHEMA_FILE), parse_schema(SCHEMA_FILE)
+
+    def files(nb_elements=3, seed=0):
+        return synthetic_engineering_model(compiled, TEMPLATES, schema_types, nb_elements, seed=seed)
+    return files
+
+
+@pytest.fixture
+def synthetic_missions(tmp_path, synthetic_files):
+    '''
+    :return: function writing synthetic missions (dict mission -> nb_elements) into tmp_path/datasets and returning
+             their EM files, see migrate_em_json.load_em_files
+    '''
+    from migrate_em_json import load_em_files
+    from synthetic import write_engineering_model
+
+    def write(missions):
+        for seed, (mission, nb_elements) in enumerate(sorted(missions.items())):
+            write_engineering_model(str(tmp_path / 'datasets' / mission), synthetic_files(nb_elements, seed))
+        return load_em_files(str(tmp_path / 'datasets'))
+    return write
@@ -0,0 +1,170 @@
+import json
+
+import pytest
+from typedb.client import TypeDBClientException
+
+from util.batching import AdaptiveBatchSize, commit_batch, start_rejected_report
+from util.fake_typedb import FakeTypeDB
+from util.idmap import IidMap
+from util.telemetry import telemetry
+from util.writers import BatchWriterPool
+
+
+def item_query(id, rejected=False):
+    return f'insert $x isa {"Rejected" if rejected else "ElementDefinition"}, has id "{id}";'
+
+
+def committed_queries(fake):
+    return [query for database, operation, query in fake.queries if operation == 'insert']
+
+
+def rejected_report(tmp_path):
+    with open(tmp_path / 'rejectedQueries_testdb.jsonl', 'r', encoding='utf-8') as file:
+        return [json.loads(line) for line in file]
+
+
+def test_batch_committed_in_one_transaction(fake, session, tmp_path):
+    batch = [item_query(i) for i in range(16)]
+    assert commit_batch(session, batch) == 16
+    assert fake.nb_commits == 1
+    assert committed_queries(fake) == batch
+    assert rejected_report(tmp_path) == []
+
+
+def test_bisection_isolates_the_rejected_query(fake, session, tmp_path):
+    batch = [item_query(i, rejected=i == 11) for i in range(16)]
+    assert commit_batch(session, batch, 'Entity') == 15
+    assert committed_queries(fake) == [query for query in batch if 'Rejected' not in query]
+    # halves of 8, 4, 2 and 1 queries beside the rejected one
+    assert fake.nb_commits == 4
+    report = rejected_report(tmp_path)
+    assert [entry['query'] for entry in report] == [batch[11]]
+    assert report[0]['kind'] == 'Entity' and 'rejected' in report[0]['error']
+    assert telemetry.counter('queries_rejected', kind='Entity') == 1
+    assert telemetry.counter('queries_committed', kind='Entity') == 15
+
+
+def test_several_rejected_queries(fake, session, tmp_path):
+    batch = [item_query(i, rejected=i in (0, 5, 9)) for i in range(10)]
+    assert commit_batch(session, batch, 'Relationship') == 7
+    assert sorted(entry['query'] for entry in rejected_report(tmp_path)) == sorted([batch[0], batch[5], batch[9]])
+    assert telemetry.counter('queries_rejected', kind='Relationship') == 3
+
+
+def test_iids_recorded_only_for_committed_items(fake, session, tmp_path):
+    iid_map = IidMap(str(tmp_path / 'iidMap_testdb.tsv'))
+    ids = [f'id{i}' for i in range(8)]
+    batch = [item_query(id, rejected=id == 'id3') for id in ids]
+    assert commit_batch(session, batch, 'Entity', ids, iid_map) == 7
+    assert [id for id in ids if id not in iid_map] == ['id3']
+    assert len({iid_map.get(id) for id in ids if id in iid_map}) == 7
+
+
+def test_rejections_are_not_overloads(fake, session):
+    adaptive_size = AdaptiveBatchSize(size=64)
+    commit_batch(session, [item_query(i, rejected=i == 2) for i in range(4)], adaptive_size=adaptive_size)
+    assert adaptive_size.size == 64
+
+
+def test_report_emptied_at_the_start_of_a_run(fake, session, tmp_path):
+    commit_batch(session, [item_query(1, rejected=True)])
+    # worker processes of the same run append to the report
+    start_rejected_report('testdb', truncate=False)
+    commit_batch(session, [item_query(2, rejected=True)])
+    assert len(rejected_report(tmp_path)) == 2
+    start_rejected_report('testdb')
+    assert rejected_report(tmp_path) == []
+
+
+@pytest.mark.parametrize('message', ['[CLI05] Unable to connect to TypeDB server.',
+                                     '[CLI02] The session has been closed and no further operation is allowed.'])
+def test_lost_connection_is_raised_without_bisection(fake, session, tmp_path, monkeypatch, message):
+    transactions = []
+
+    def lost(transaction_type, options=None):
+        transactions.append(transaction_type)
+        raise TypeDBClientException(message)
+
+    monkeypatch.setattr(session, 'transaction', lost)
+    with pytest.raises(TypeDBClientException):
+        commit_batch(session, [item_query(i) for i in range(16)], 'Entity')
+    assert len(transactions) == 1
+    assert rejected_report(tmp_path) == []
+    assert telemetry.counter('failed_commits', kind='Entity', reason='connection') == 1
+    assert telemetry.counter('retried_batches', kind='Entity') == 0
+
+
+def test_overload_is_bisected_without_rejection(fake, session, tmp_path, monkeypatch):
+    # transactions of more than 4 queries time out
+    transaction = session.transaction
+
+    def limited(transaction_type, options=None):
+        opened = transaction(transaction_type, options)
+        commit = opened.commit
+
+        def commit_or_timeout():
+            if len(opened._queries) > 4:
+                raise TypeDBClientException('[FAKE] Transaction timed out')
+            commit()
+        opened.commit = commit_or_timeout
+        return opened
+
+    monkeypatch.setattr(session, 'transaction', limited)
+    adaptive_size = AdaptiveBatchSize(size=16)
+    assert commit_batch(session, [item_query(i) for i in range(16)], 'Entity', adaptive_size=adaptive_size) == 16
+    assert fake.nb_commits == 4
+    assert adaptive_size.size < 16
+    assert rejected_report(tmp_path) == []
+    assert telemetry.counter('failed_commits', kind='Entity', reason='overload') == 3
+
+
+def test_size_grows_only_after_fast_full_batches():
+    adaptive_size = AdaptiveBatchSize(size=100, max_size=200, target_latency=1.0)
+    adaptive_size.committed(50, 1000, 0.1)
+    assert adaptive_size.size == 100
+    # full by their characters, not by their number of queries
+    adaptive_size.committed(100, adaptive_size.max_bytes, 0.1)
+    assert adaptive_size.size == 100
+    adaptive_size.committed(100, 1000, 0.1)
+    assert adaptive_size.size == 150
+    adaptive_size.committed(150, 1000, 0.1)
+    assert adaptive_size.size == 200
+    # neither fast nor slow
+    adaptive_size.committed(200, 1000, 0.8)
+    assert adaptive_size.size == 200
+    # scaled down to the target latency
+    adaptive_size.committed(200, 1000, 4.0)
+    assert adaptive_size.size == 50
+
+
+def test_batch_full_by_queries_or_characters():
+    adaptive_size = AdaptiveBatchSize(size=10, max_bytes=1000)
+    assert not adaptive_size.full(9, 999)
+    assert adaptive_size.full(10, 10)
+    assert adaptive_size.full(1, 1000)
+
+
+def test_size_shared_by_concurrent_writers(tmp_path, monkeypatch):
+    monkeypatch.chdir(tmp_path)
+    start_rejected_report('testdb')
+    # commits take 5 ms per query: batches of 20 queries reach the target latency of 0.1 s
+    fake = FakeTypeDB(latency={'commit_per_query': 0.005}, databases=['testdb'])
+    adaptive_size = AdaptiveBatchSize(size=64, target_latency=0.1)
+    sizes = []
+    with fake.core_client() as client, client.session('testdb', None) as session:
+        pool = BatchWriterPool(lambda batch: commit_batch(session, batch, adaptive_size=adaptive_size), writers=4)
+        batch = []
+        for i in range(1000):
+            batch.append(item_query(i))
+            if adaptive_size.full(len(batch), 0):
+                sizes.append(len(batch))
+                pool.submit(batch)
+                batch = []
+        pool.submit(batch)
+        assert pool.close() == []
+    assert len(committed_queries(fake)) == 1000
+    # the first slow commits of any writer shrink the batches of all writers, once the 2 * 4 batches submitted
+    # before any commit finished are done
+    assert sizes[0] == 64
+    assert len(sizes) > 12 and all(10 <= size <= 30 for size in sizes[8:])
+    assert 10 <= adaptive_size.size <= 30
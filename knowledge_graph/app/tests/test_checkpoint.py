@@ -0,0 +1,79 @@
+import multiprocessing
+
+from util.checkpoint import Checkpoint
+from util.relationships import RelationshipSink
+
+
+def relationship(i):
+    return ('Containment_parameter', 'contains', 'ElementDefinition', f'ed{i}', 'isContained', 'Parameter', f'p{i}')
+
+
+def start_run(tmp_path, resume, spill_threshold=3):
+    checkpoint = Checkpoint(str(tmp_path / 'checkpoint_testdb.json'), resume, interval=0)
+    sink = RelationshipSink(str(tmp_path / 'tempRelationships_testdb.jsonl'), spill_threshold)
+    sink.restore(checkpoint.mission('mission')['relationships'])
+    checkpoint.sink = sink
+    return checkpoint, sink
+
+
+def test_resume_after_crash_between_saves(tmp_path):
+    checkpoint, sink = start_run(tmp_path, resume=False)
+    for i in range(5):
+        sink.append(*relationship(i))
+    checkpoint.file_done('mission', 'Iteration1.json', len(sink))
+    for i in range(5, 12):
+        sink.append(*relationship(i))
+    checkpoint.batch_committed('mission', 'Iteration2.json', 40, len(sink))
+    # relationships of batches rendered after the last save, partly spilled to disk before the crash
+    for i in range(12, 20):
+        sink.append(*relationship(i))
+    del checkpoint, sink
+
+    checkpoint, sink = start_run(tmp_path, resume=True)
+    assert checkpoint.is_file_done('mission', 'Iteration1.json')
+    assert not checkpoint.is_file_done('mission', 'Iteration2.json')
+    assert checkpoint.file_offset('mission', 'Iteration2.json') == 40
+    assert checkpoint.file_offset('mission', 'Iteration3.json') == 0
+    assert list(sink) == [relationship(i) for i in range(12)]
+    assert sink.counts['Containment_parameter'] == 12
+
+    # the resumed run appends the relationships of the items after the offset
+    for i in range(12, 15):
+        sink.append(*relationship(i))
+    checkpoint.file_done('mission', 'Iteration2.json', len(sink))
+    assert list(sink) == [relationship(i) for i in range(15)]
+
+
+def test_resume_before_first_save(tmp_path):
+    checkpoint, sink = start_run(tmp_path, resume=False)
+    for i in range(10):
+        sink.append(*relationship(i))
+    del checkpoint, sink
+
+    checkpoint, sink = start_run(tmp_path, resume=True)
+    assert checkpoint.file_offset('mission', 'Iteration1.json') == 0
+    assert len(sink) == 0 and list(sink) == []
+
+
+def test_resume_of_a_finished_mission(tmp_path):
+    checkpoint, sink = start_run(tmp_path, resume=False)
+    sink.append(*relationship(0))
+    checkpoint.file_done('mission', 'Iteration1.json', len(sink))
+    checkpoint.relationships_done('mission')
+
+    assert Checkpoint(checkpoint.path, resume=True).is_mission_done('mission')
+    assert not Checkpoint(checkpoint.path, resume=False).is_mission_done('mission')
+
+
+def test_missions_saved_by_several_processes(tmp_path):
+    path = str(tmp_path / 'checkpoint_testdb.json')
+    lock = multiprocessing.Lock()
+    first, second = Checkpoint(path, lock=lock), Checkpoint(path, lock=lock)
+    first.file_done('mission1', 'a.json', 3)
+    second.file_done('mission2', 'b.json', 4)
+    first.relationships_done('mission1')
+
+    resumed = Checkpoint(path)
+    assert resumed.is_mission_done('mission1')
+    assert resumed.is_file_done('mission2', 'b.json')
+    assert resumed.mission('mission2')['relationships'] == 4
@@ -0,0 +1,145 @@
+import hashlib
+import multiprocessing
+import os
+
+import numpy as np
+import pytest
+
+from util import embedding_cache
+from util.embedding_cache import EmbeddingCache, encode_cached, get_embedding_cache, use_embedding_cache
+
+DIM = 8
+
+
+def vector_of(text):
+    '''
+    Deterministic stand-in for the embedding of a text
+    '''
+    seed = int(hashlib.sha1(text.encode('utf-8')).hexdigest()[:8], 16)
+    return np.random.default_rng(seed).standard_normal(DIM).astype(np.float32)
+
+
+class CountingEncoder:
+
+    def __init__(self):
+        self.calls = []
+
+    def __call__(self, texts):
+        self.calls.append(list(texts))
+        return np.array([vector_of(text) for text in texts])
+
+    def encode(self, texts, **kwargs):
+        return self(texts)
+
+
+def assert_vectors(vectors, texts):
+    assert len(vectors) == len(texts)
+    for vector, text in zip(vectors, texts):
+        np.testing.assert_array_equal(vector, vector_of(text))
+
+
+def test_hits_and_misses(tmp_path):
+    cache = EmbeddingCache(str(tmp_path), 'all-mpnet-base-v2')
+    encoder = CountingEncoder()
+    texts = ['solar array', 'on board computer', 'solar array', 'battery']
+    assert_vectors(cache.encode(texts, encoder), texts)
+    assert encoder.calls == [['solar array', 'on board computer', 'battery']]
+    assert (cache.hits, cache.misses, len(cache)) == (1, 3, 3)
+
+    assert_vectors(cache.encode(['battery', 'thruster'], encoder), ['battery', 'thruster'])
+    assert encoder.calls[-1] == ['thruster']
+    assert (cache.hits, cache.misses, len(cache)) == (2, 4, 4)
+    assert 'thruster' in cache and 'reaction wheel' not in cache
+
+
+def test_reopen_after_restart(tmp_path):
+    texts = [f'element {i}' for i in range(2000)]
+    EmbeddingCache(str(tmp_path), 'all-mpnet-base-v2').encode(texts, CountingEncoder())
+
+    encoder = CountingEncoder()
+    reopened = EmbeddingCache(str(tmp_path), 'all-mpnet-base-v2')
+    assert len(reopened) == 2000
+    assert_vectors(reopened.encode(texts[::-1], encoder), texts[::-1])
+    assert encoder.calls == []
+    # the vectors of another model are not shared
+    other = EmbeddingCache(str(tmp_path), 'other-model')
+    assert len(other) == 0
+
+
+def test_eviction_of_least_recently_used(tmp_path):
+    cache = EmbeddingCache(str(tmp_path), 'model', max_entries=10)
+    old = [f'old {i}' for i in range(8)]
+    cache.encode(old, CountingEncoder())
+
+    # next run: uses 4 of the old texts and adds 4 new ones, beyond max_entries
+    cache = EmbeddingCache(str(tmp_path), 'model', max_entries=10)
+    used, new = old[:4], [f'new {i}' for i in range(4)]
+    cache.encode(used + new, CountingEncoder())
+    kept = set(used + new)
+    assert len(cache) == int(10 * embedding_cache.EVICTION_KEEP)
+    assert all(text in kept for text in old + new if text in cache)
+    assert all(text not in cache for text in old[4:])
+
+    reopened = EmbeddingCache(str(tmp_path), 'model', max_entries=10)
+    texts = [text for text in used + new if text in reopened]
+    assert len(texts) == len(cache)
+    assert_vectors(reopened.encode(texts, CountingEncoder()), texts)
+
+
+def test_two_writers_share_the_directory(tmp_path):
+    first = EmbeddingCache(str(tmp_path), 'model')
+    second = EmbeddingCache(str(tmp_path), 'model')
+    first.encode(['a', 'b'], CountingEncoder())
+    second.encode(['c', 'a'], CountingEncoder())
+    first.encode(['d'], CountingEncoder())
+
+    encoder = CountingEncoder()
+    assert_vectors(second.encode(['a', 'b', 'c', 'd'], encoder), ['a', 'b', 'c', 'd'])
+    assert encoder.calls == []
+    reopened = EmbeddingCache(str(tmp_path), 'model')
+    assert len(reopened) == 4
+    assert_vectors(reopened.encode(['a', 'b', 'c', 'd'], encoder), ['a', 'b', 'c', 'd'])
+
+
+def write_texts(directory, worker):
+    cache = EmbeddingCache(directory, 'model')
+    for start in range(0, 200, 20):
+        # texts shared by all workers and texts of this worker only
+        texts = [f'shared {i}' for i in range(start, start + 10)] + \
+                [f'worker {worker} {i}' for i in range(start, start + 10)]
+        cache.encode(texts, CountingEncoder())
+
+
+@pytest.mark.skipif('fork' not in multiprocessing.get_all_start_methods(), reason='needs fork')
+def test_concurrent_processes(tmp_path):
+    context = multiprocessing.get_context('fork')
+    workers = [context.Process(target=write_texts, args=(str(tmp_path), worker)) for worker in range(4)]
+    for worker in workers:
+        worker.start()
+    for worker in workers:
+        worker.join()
+    assert all(worker.exitcode == 0 for worker in workers)
+
+    cache = EmbeddingCache(str(tmp_path), 'model')
+    texts = [f'shared {i}' for i in range(0, 200, 20) for i in range(i, i + 10)] + \
+            [f'worker {worker} {i}' for worker in range(4) for i in range(0, 200, 20) for i in range(i, i + 10)]
+    assert len(cache) == len(set(texts))
+    encoder = CountingEncoder()
+    assert_vectors(cache.encode(texts, encoder), texts)
+    assert encoder.calls == []
+    assert len({row for row, used in cache._index.values()}) == len(cache)
+
+
+def test_nothing_to_encode_creates_no_directory(tmp_path, monkeypatch):
+    directory = tmp_path / 'embeddingCache'
+    monkeypatch.setenv(embedding_cache.EMBEDDING_CACHE_ENV, str(directory))
+    get_embedding_cache.cache_clear()
+    try:
+        assert encode_cached(CountingEncoder(), 'model', []) == []
+        assert get_embedding_cache('model') is not None and not os.path.exists(directory)
+        assert_vectors(encode_cached(CountingEncoder(), 'model', ['a']), ['a'])
+        assert os.path.isdir(directory)
+        use_embedding_cache('')
+        assert get_embedding_cache('model') is None
+    finally:
+        get_embedding_cache.cache_clear()
@@ -0,0 +1,63 @@
+import numpy as np
+import pytest
+
+from util.embedding_codec import (FORMATS, decode_embedding, encode_embedding, is_legacy, legacy_text,
+                                  use_embedding_format, EMBEDDING_FORMAT_ENV)
+
+
+@pytest.fixture
+def vector():
+    rng = np.random.default_rng(0)
+    vector = rng.uniform(-1, 1, 768).astype(np.float32)
+    vector[:4] = [0, 1e-7, -3.5e-5, 1]
+    return vector
+
+
+def test_float32_round_trip(vector):
+    value = encode_embedding(vector, 'float32')
+    assert value.startswith('e1f32:') and not is_legacy(value)
+    assert decode_embedding(value) == vector.tolist()
+    assert len(value) < len(legacy_text(vector)) / 2
+
+
+def test_float16_round_trip(vector):
+    value = encode_embedding(vector, 'float16')
+    assert value.startswith('e1f16:') and not is_legacy(value)
+    decoded = decode_embedding(value)
+    assert decoded == vector.astype(np.float16).astype(np.float32).tolist()
+    assert np.allclose(decoded, vector, atol=1e-3)
+    assert len(value) < len(encode_embedding(vector, 'float32')) / 1.9
+
+
+def test_legacy_text_round_trip(vector):
+    value = encode_embedding(vector, 'text')
+    assert is_legacy(value)
+    assert decode_embedding(value) == vector.tolist()
+    assert decode_embedding(value) == decode_embedding(encode_embedding(vector, 'float32'))
+
+
+def test_legacy_text_is_the_former_attribute_value(vector):
+    # str(list(vector)) of the model output with numpy 1.x, the values already in a KG
+    expected = '[' + ', '.join(str(value) for value in vector) + ']'
+    assert legacy_text(vector) == expected
+    assert legacy_text(vector.tolist()) == expected
+    assert legacy_text(vector).startswith('[0.0, 1e-07, -3.5e-05, 1.0, ')
+
+
+def test_legacy_text_with_numpy_scalar_repr(vector):
+    # str(list(vector)) written with numpy >= 2
+    value = '[' + ', '.join(f'np.float32({value})' for value in vector) + ']'
+    assert decode_embedding(value) == vector.tolist()
+
+
+def test_default_format(vector, monkeypatch):
+    # restored after the test, use_embedding_format sets it for the processes started by this one
+    monkeypatch.setenv(EMBEDDING_FORMAT_ENV, 'float32')
+    monkeypatch.delenv(EMBEDDING_FORMAT_ENV)
+    assert encode_embedding(vector).startswith(FORMATS['float32'][0])
+    use_embedding_format('float16')
+    assert encode_embedding(vector).startswith(FORMATS['float16'][0])
+    use_embedding_format('text')
+    assert encode_embedding(vector) == legacy_text(vector)
+    with pytest.raises(ValueError):
+        use_embedding_format('float64')
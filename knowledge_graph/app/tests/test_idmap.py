@@ -0,0 +1,70 @@
+import migrate_em_json
+from util.fake_typedb import FakeTypeDB
+from util.idmap import IidMap
+from util.telemetry import telemetry
+
+
+def test_tsv_round_trip(tmp_path):
+    path = str(tmp_path / 'iidMap_testdb.tsv')
+    iid_map = IidMap(path)
+    iid_map.update({'id1': '0x01', 'id2': '0x02'})
+    iid_map.update({'id2': '0x22', 'id3': '0x03'})
+    with open(path, 'r', encoding='utf-8') as file:
+        assert file.read() == 'id1\t0x01\nid2\t0x02\nid2\t0x22\nid3\t0x03\n'
+
+    # the last entry of an id wins when the file is read back
+    reopened = IidMap(path)
+    assert len(reopened) == 3
+    assert [reopened.get(id) for id in ('id1', 'id2', 'id3')] == ['0x01', '0x22', '0x03']
+    assert 'id4' not in reopened and reopened.get('id4') is None
+
+    reopened.reset()
+    assert len(reopened) == 0 and len(IidMap(path)) == 0
+
+
+def test_resolve_records_only_the_missing_ids(tmp_path):
+    fake = FakeTypeDB(answers=[{'pattern': r'has id \$id', 'answers': [
+        {'x': {'iid': f'0x{i:02}', 'entity': True}, 'id': f'id{i}'} for i in range(5)]}], databases=['testdb'])
+    iid_map = IidMap(str(tmp_path / 'iidMap_testdb.tsv'))
+    iid_map.update({'id0': '0xaa'})
+    with fake.core_client() as client, client.session('testdb', None) as session:
+        assert iid_map.resolve(session, {'id0', 'id2', 'id3', 'unknown'}) == 2
+        # nothing left to resolve, the database is not read again
+        nb_queries = len(fake.queries)
+        assert iid_map.resolve(session, {'id0', 'id2'}) == 0
+        assert len(fake.queries) == nb_queries
+    assert [iid_map.get(id) for id in ('id0', 'id1', 'id2', 'id3')] == ['0xaa', None, '0x02', '0x03']
+    assert IidMap(iid_map.path).get('id3') == '0x03'
+
+
+def relationship_queries(fake):
+    return [query for database, operation, query in fake.queries
+            if operation == 'insert' and query.startswith('match')]
+
+
+def test_relationships_matched_by_iid(fake, session, synthetic_missions, tmp_path):
+    em_files = synthetic_missions({'mission': 2})['mission']
+    iid_map = IidMap(str(tmp_path / 'iidMap_testdb.tsv'))
+    sink, failed = migrate_em_json.load_mission_entities(em_files, session, migrate_em_json.TEMPLATES,
+                                                         iid_map=iid_map, mission='mission')
+    assert failed == 0 and len(iid_map) > 0
+    nb_relationships = migrate_em_json.load_mission_relationships(session, sink, iid_map, mission='mission')
+
+    queries = relationship_queries(fake)
+    assert len(queries) == nb_relationships > 0
+    assert all(query.startswith('match $player1 iid 0x') and ' $player2 iid 0x' in query for query in queries)
+    assert telemetry.counter('players_matched', match='iid') == 2 * nb_relationships
+    assert telemetry.counter('players_matched', match='attribute') == 0
+
+
+def test_players_missing_from_the_map_matched_by_attribute(fake, session, synthetic_missions, tmp_path):
+    em_files = synthetic_missions({'mission': 2})['mission']
+    sink, failed = migrate_em_json.load_mission_entities(em_files, session, migrate_em_json.TEMPLATES,
+                                                         mission='mission')
+    # entities inserted without a map, which the fake database cannot resolve
+    iid_map = IidMap(str(tmp_path / 'iidMap_testdb.tsv'))
+    migrate_em_json.load_mission_relationships(session, sink, iid_map, mission='mission')
+
+    queries = relationship_queries(fake)
+    assert queries and all(query.startswith('match $player1 isa ') for query in queries)
+    assert telemetry.counter('players_matched', match='iid') == 0
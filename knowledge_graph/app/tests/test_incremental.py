@@ -0,0 +1,83 @@
+import re
+
+import ujson as json
+
+import migrate_em_json
+from util.fake_typedb import FakeTypeDB
+from util.telemetry import telemetry
+
+
+def ingest(session, em_files, existing_ids=None, existing_rel_ids=None):
+    sink, failed = migrate_em_json.load_mission_entities(em_files, session, migrate_em_json.TEMPLATES,
+                                                         existing_ids=existing_ids, mission='mission',
+                                                         existing_rel_ids=existing_rel_ids)
+    assert failed == 0
+    migrate_em_json.load_mission_relationships(session, sink, existing_rel_ids=existing_rel_ids, mission='mission')
+
+
+def queries(fake, operation):
+    return [query for database, recorded, query in fake.queries if recorded == operation]
+
+
+def rel_id(query):
+    return re.search(r'has rel-id "([^"]+)";$', query)[1]
+
+
+def change_revision(path, classKind):
+    '''
+    Bumps the revisionNumber of the first item of a class in an EM file
+    :return: (id, new revisionNumber) of the item
+    '''
+    with open(path, 'r', encoding='utf-8') as file:
+        items = json.load(file)
+    item = next(item for item in items if item['classKind'] == classKind)
+    item['revisionNumber'] += 1
+    with open(path, 'w', encoding='utf-8') as file:
+        json.dump(items, file)
+    return item['iid'], item['revisionNumber']
+
+
+def test_only_the_changed_item_is_reinserted(fake, session, synthetic_missions, tmp_path):
+    em_files = synthetic_missions({'mission': 2})['mission']
+    ingest(session, em_files)
+    entities = [query for query in queries(fake, 'insert') if not query.startswith('match')]
+    relationships = [rel_id(query) for query in queries(fake, 'insert') if query.startswith('match')]
+    # revisions as fetch_existing_revisions reads them back from the database
+    existing_ids = {re.search(r'has id "([^"]+)"', query)[1]: re.search(r'has revisionNumber "([^"]+)"', query)[1]
+                    for query in entities}
+
+    iteration = next(path for path in em_files if 'Iterations' in str(path))
+    id, revision = change_revision(iteration, 'ElementDefinition')
+    # relationships listed twice by an item are inserted twice (the second one is rejected by TypeDB)
+    played = sorted(rel for rel in relationships if id in rel)
+    assert played
+
+    # the database answers the relations played by the changed item
+    fake = FakeTypeDB(answers=[{'pattern': f'has id "{id}"; \\$r \\(\\$x\\) isa relation, has rel-id',
+                                'answers': [{'rel': rel} for rel in set(played)]}], databases=['testdb'])
+    telemetry.reset()
+    with fake.core_client() as client, client.session('testdb', None) as session:
+        ingest(session, em_files, existing_ids, set(relationships))
+
+    deletes = queries(fake, 'delete')
+    assert deletes and all(f'has id "{id}";' in query for query in deletes)
+    inserted = queries(fake, 'insert')
+    reinserted = [query for query in inserted if not query.startswith('match')]
+    assert len(reinserted) == 1 and f'has id "{id}"' in reinserted[0]
+    assert f'has revisionNumber "{revision}"' in reinserted[0]
+    # the relationships of the item are inserted again, the other ones are still in the database
+    assert sorted(rel_id(query) for query in inserted if query.startswith('match')) == played
+    assert telemetry.counter('incremental_items', status='changed') == 1
+    assert telemetry.counter('incremental_items', status='unchanged') == len(entities) - 1
+    assert telemetry.counter('incremental_items', status='new') == 0
+    assert telemetry.counter('deleted_relationships') == len(set(played))
+
+
+def test_fetch_existing_revisions():
+    fake = FakeTypeDB(answers=[{'pattern': r'has revisionNumber \$revision', 'answers': [
+        {'id': 'id1', 'revision': '3'}, {'id': 'id2', 'revision': '7'}]},
+                               {'pattern': r'has id \$value', 'answers': [{'value': f'id{i}'} for i in range(4)]}],
+                      databases=['testdb'])
+    with fake.core_client() as client, client.session('testdb', None) as session:
+        assert migrate_em_json.fetch_existing_revisions(session) == {'id0': None, 'id1': '3', 'id2': '7',
+                                                                     'id3': None}
@@ -0,0 +1,30 @@
+import os
+import subprocess
+import sys
+import uuid
+
+from migrate_em_json import METADATA_NAMESPACE, metadata_id
+
+APP_DIR = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+
+
+def test_metadata_id_is_a_uuid5_of_the_key():
+    id = metadata_id('Solar Orbiter', 'requirements', 0, 'reqspec')
+    assert id == str(uuid.uuid5(METADATA_NAMESPACE, 'Solar Orbiter/requirements/0/reqspec'))
+    assert uuid.UUID(id).version == 5
+
+
+def test_metadata_id_is_stable_across_runs():
+    # ids of metadata inserted by previous runs, they must not change with the code or the interpreter
+    assert metadata_id('Solar Orbiter', 'requirements', 0, 'reqspec') == 'eca3fc0f-909e-52ea-8ef7-219c02d1538b'
+    script = "from migrate_em_json import metadata_id; print(metadata_id('Solar Orbiter', 'payload', 2, 'parameter'))"
+    ids = {subprocess.run([sys.executable, '-c', script], cwd=APP_DIR, capture_output=True, text=True, check=True,
+                          env=dict(os.environ, PYTHONHASHSEED=str(seed))).stdout.strip() for seed in (1, 2)}
+    assert ids == {metadata_id('Solar Orbiter', 'payload', 2, 'parameter')}
+
+
+def test_metadata_ids_differ_per_entity():
+    keys = [('Solar Orbiter', 'payload', 0, 'parameter'), ('Solar Orbiter', 'payload', 1, 'parameter'),
+            ('Solar Orbiter', 'payload', 0, 'relation'), ('Solar Orbiter', 'orbit', 0, 'parameter'),
+            ('Euclid', 'payload', 0, 'parameter')]
+    assert len({metadata_id(*key) for key in keys}) == len(keys)
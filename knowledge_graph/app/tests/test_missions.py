@@ -0,0 +1,63 @@
+import ujson as json
+
+import migrate_em_json
+from util.checkpoint import Checkpoint
+from util.connection import use_fake_typedb
+from util.idmap import IidMap
+
+
+def recorded_queries(path):
+    '''
+    :return: list of {"database", "operation", "query", "pid"} recorded by the fake databases of all processes
+    '''
+    with open(path, 'r', encoding='utf-8') as file:
+        return [json.loads(line) for line in file]
+
+
+def inserts(queries):
+    '''
+    :return: (sorted entity queries, sorted rel-ids of the relationship queries)
+    '''
+    queries = [entry['query'] for entry in queries if entry['operation'] == 'insert']
+    return (sorted(query for query in queries if not query.startswith('match')),
+            sorted(query.rsplit('has rel-id ', 1)[1] for query in queries if query.startswith('match')))
+
+
+def parallel_settings(tmp_path):
+    return {'dbName': 'testdb', 'address': 'localhost:1729', 'Templates': migrate_em_json.TEMPLATES,
+            'spill_threshold': 500_000, 'writers': 2, 'iid_map_path': str(tmp_path / 'iidMap_testdb.tsv'),
+            'existing_ids': None, 'existing_rel_ids': None,
+            'checkpoint_path': str(tmp_path / 'checkpoint_testdb.json'), 'generator_processes': 0}
+
+
+def test_parallel_missions_insert_the_same_queries(fake, session, synthetic_missions, tmp_path, monkeypatch):
+    em_list = synthetic_missions({'alpha': 3, 'beta': 2, 'gamma': 1})
+    for mission, em_files in em_list.items():
+        migrate_em_json.build_engineering_model_graph(em_files, session, migrate_em_json.TEMPLATES, mission=mission)
+    sequential = inserts({'operation': operation, 'query': query} for database, operation, query in fake.queries)
+
+    # the worker processes each open their own fake database, which records to a shared file
+    config = tmp_path / 'fakeTypeDB.json'
+    config.write_text(json.dumps({'databases': ['testdb'], 'record': str(tmp_path / 'queries.jsonl'),
+                                  'keep_queries': False}))
+    monkeypatch.setenv('KG_FAKE_TYPEDB', '')
+    use_fake_typedb(str(config))
+    summary = migrate_em_json.build_missions_in_parallel(em_list, 2, parallel_settings(tmp_path))
+
+    assert sorted(summary) == ['alpha', 'beta', 'gamma']
+    assert all('error' not in result and result['failed_batches'] == 0 for result in summary.values())
+    queries = recorded_queries(tmp_path / 'queries.jsonl')
+    assert inserts(queries) == sequential
+    assert len({entry['pid'] for entry in queries}) > 1
+    # relationships are matched by the iids the entity phases of all processes recorded
+    relationships = [entry['query'] for entry in queries if entry['query'].startswith('match')]
+    assert relationships and all(' iid 0x' in query for query in relationships)
+    assert len(IidMap(str(tmp_path / 'iidMap_testdb.tsv'))) == len(sequential[0])
+
+    # all missions are done according to the shared checkpoint, a second run inserts nothing
+    checkpoint = Checkpoint(str(tmp_path / 'checkpoint_testdb.json'))
+    assert all(checkpoint.is_mission_done(mission) for mission in em_list)
+    (tmp_path / 'queries.jsonl').unlink()
+    summary = migrate_em_json.build_missions_in_parallel(em_list, 2, parallel_settings(tmp_path))
+    assert all(result['done'] for result in summary.values())
+    assert not (tmp_path / 'queries.jsonl').exists()
@@ -0,0 +1,52 @@
+from util.normalization import ACRONYMS_FILE, TextNormalizer, get_normalizer, remove_underscore
+from util.telemetry import telemetry
+from util.utils import AcronymExpander, load_Acronyms, replace_Acronyms
+
+NAMES = ['Solar_Array_Drive', 'OBC', 'AOCS_Unit', 'I/O_board', 'EEE parts', 'Star Tracker', 'OBC', 'AIT_plan']
+
+
+def test_same_output_as_previous_pipeline():
+    acronyms, expansions = load_Acronyms(ACRONYMS_FILE)
+    for underscores in (False, True):
+        normalizer = get_normalizer(underscores)
+        for name in NAMES:
+            expected = replace_Acronyms(remove_underscore(name) if underscores else name, acronyms, expansions)
+            # the first call computes the text, the second one reads it from the cache
+            assert normalizer(name) == expected
+            assert normalizer(name) == expected
+
+
+def test_cache_hits_and_eviction():
+    calls = []
+
+    class Expander(AcronymExpander):
+        def expand(self, sentence):
+            calls.append(sentence)
+            return super().expand(sentence)
+
+    normalizer = TextNormalizer(Expander(['OBC'], ['on board computer']), underscores=True, cache_size=2)
+    assert normalizer('OBC_A') == 'on board computer a'
+    assert normalizer('OBC_B') == 'on board computer b'
+    assert normalizer('OBC_A') == 'on board computer a'
+    assert calls == ['OBC A', 'OBC B']
+    assert normalizer.stats() == {'hits': 1, 'misses': 2, 'hit_rate': 1 / 3, 'size': 2}
+
+    # OBC_B is the least recently used text, evicted by a third one
+    normalizer('OBC_C')
+    assert normalizer.stats()['size'] == 2
+    normalizer('OBC_A')
+    normalizer('OBC_B')
+    assert calls == ['OBC A', 'OBC B', 'OBC C', 'OBC B']
+    assert normalizer.stats()['hits'] == 2
+
+
+def test_record_counts_since_last_call():
+    telemetry.reset()
+    normalizer = TextNormalizer(AcronymExpander([], []), name='element_names')
+    for name in ('a', 'b', 'a'):
+        normalizer(name)
+    normalizer.record()
+    normalizer('a')
+    normalizer.record()
+    assert telemetry.counter('normalization_cache', normalizer='element_names', result='hit') == 2
+    assert telemetry.counter('normalization_cache', normalizer='element_names', result='miss') == 2
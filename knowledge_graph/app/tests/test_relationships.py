@@ -0,0 +1,61 @@
+import os
+
+import migrate_em_json
+from util.relationships import RelationshipBuffer, RelationshipSink
+
+
+def relationship(i):
+    return ('Containment_parameter', 'contains', 'ElementDefinition', f'ed{i}', 'isContained', 'Parameter', f'p{i}')
+
+
+def inserted_relationships(fake):
+    return sorted(query for database, operation, query in fake.queries
+                  if operation == 'insert' and query.startswith('match'))
+
+
+def test_sink_spills_beyond_threshold(tmp_path):
+    sink = RelationshipSink(str(tmp_path / 'tempRelationships_testdb.jsonl'), spill_threshold=4)
+    for i in range(10):
+        sink.append(*relationship(i))
+    # spilled each time a fifth row was held in memory
+    assert sink._spilled == 10 - len(sink._columns['relationship'])
+    assert len(sink._columns['relationship']) <= 4
+    assert os.path.exists(sink.spill_path)
+    assert len(sink) == 10
+    assert list(sink) == [relationship(i) for i in range(10)]
+    assert sink.counts['Containment_parameter'] == 10
+
+    sink.clear()
+    assert len(sink) == 0 and list(sink) == []
+    assert not os.path.exists(sink.spill_path)
+
+
+def test_sink_in_memory_below_threshold(tmp_path):
+    sink = RelationshipSink(str(tmp_path / 'tempRelationships_testdb.jsonl'), spill_threshold=100)
+    for i in range(10):
+        sink.append(*relationship(i))
+    assert not os.path.exists(sink.spill_path)
+    assert list(sink) == [relationship(i) for i in range(10)]
+
+
+def test_buffer_drains_rows_of_each_item():
+    buffer = RelationshipBuffer()
+    buffer.append(*relationship(1))
+    buffer.append(*relationship(2))
+    assert buffer.drain() == [relationship(1), relationship(2)]
+    assert buffer.drain() == []
+
+
+def test_spilled_mission_inserts_the_same_relationships(fake, session, synthetic_missions):
+    em_files = synthetic_missions({'mission': 2})['mission']
+    inserted = {}
+    for spill_threshold in (1_000_000, 7):
+        fake.queries.clear()
+        sink, failed = migrate_em_json.load_mission_entities(em_files, session, migrate_em_json.TEMPLATES,
+                                                             spill_threshold, mission='mission')
+        assert failed == 0
+        assert os.path.exists(sink.spill_path) == (spill_threshold == 7)
+        nb_relationships = migrate_em_json.load_mission_relationships(session, sink, mission='mission')
+        inserted[spill_threshold] = inserted_relationships(fake)
+        assert nb_relationships == len(inserted[spill_threshold]) > 0
+    assert inserted[7] == inserted[1_000_000]
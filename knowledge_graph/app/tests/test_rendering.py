@@ -0,0 +1,46 @@
+import pytest
+
+import migrate_em_json
+from util.telemetry import telemetry
+
+
+def mission_queries(fake):
+    '''
+    :return: (entity queries, relationship queries) committed to the fake database, sorted
+    '''
+    inserted = [query for database, operation, query in fake.queries if operation == 'insert']
+    return (sorted(query for query in inserted if not query.startswith('match')),
+            sorted(query for query in inserted if query.startswith('match')))
+
+
+def test_process_pool_renders_the_same_queries(fake, session, synthetic_missions):
+    em_files = synthetic_missions({'mission': 3})['mission']
+    queries, relationships = {}, {}
+    for generator_processes in (0, 2):
+        fake.queries.clear()
+        telemetry.reset()
+        sink, failed = migrate_em_json.load_mission_entities(em_files, session, migrate_em_json.TEMPLATES,
+                                                             mission='mission',
+                                                             generator_processes=generator_processes)
+        assert failed == 0
+        relationships[generator_processes] = list(sink)
+        migrate_em_json.load_mission_relationships(session, sink, mission='mission')
+        queries[generator_processes] = mission_queries(fake)
+        # rendering counters of the worker processes are merged into the telemetry of the run
+        assert sum(value for (name, labels), value in telemetry.state()['counters'].items()
+                   if name == 'items_rendered') == len(queries[generator_processes][0])
+    # relationships reach the sink in the order of the items, whichever process rendered them
+    assert relationships[2] == relationships[0]
+    assert queries[2] == queries[0]
+
+
+def name_template(item):
+    return f'insert $x isa ElementDefinition, has name "{item["name"]}";'
+
+
+def test_rendering_error_raised_in_committing_process(fake, session, tmp_path):
+    path = tmp_path / 'Iteration.json'
+    path.write_text('[{"classKind": "ElementDefinition", "iid": "id0"}]')
+    with pytest.raises(RuntimeError, match="KeyError: 'name'"):
+        migrate_em_json.load_mission_entities([path], session, {'ElementDefinition': name_template},
+                                              mission='mission', generator_processes=1)
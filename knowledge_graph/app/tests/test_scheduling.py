@@ -0,0 +1,52 @@
+import ujson as json
+
+from util.scheduling import discover_em_files, estimate_items, lpt_schedule, print_schedule
+
+
+def write_items(path, nb_items, name_length=8):
+    path.parent.mkdir(parents=True, exist_ok=True)
+    path.write_text(json.dumps([{'classKind': 'ElementDefinition', 'iid': f'id{i}', 'name': 'x' * name_length}
+                                for i in range(nb_items)]))
+    return path
+
+
+def test_lpt_schedule_balances_largest_first():
+    schedule = lpt_schedule({'a': 7, 'b': 5, 'c': 4, 'd': 3, 'e': 2, 'f': 2}, 2)
+    assert schedule == [(12, ['a', 'd', 'f']), (11, ['b', 'c', 'e'])]
+    # every job once, whatever the number of workers
+    for workers in (1, 3, 10):
+        schedule = lpt_schedule({'a': 7, 'b': 5, 'c': 4}, workers)
+        assert sorted(job for total, jobs in schedule for job in jobs) == ['a', 'b', 'c']
+        assert sum(total for total, jobs in schedule) == 16
+    assert lpt_schedule({'a': 1}, 0) == [(1, ['a'])]
+
+
+def test_lpt_schedule_ties_broken_by_name():
+    assert lpt_schedule({'b': 1, 'a': 1, 'c': 1}, 2) == [(2, ['a', 'c']), (1, ['b'])]
+
+
+def test_estimate_items_extrapolates_the_sample(tmp_path):
+    path = write_items(tmp_path / 'Iteration.json', 1000)
+    assert estimate_items(path) == 1000
+    # counted in the first tenth of the file
+    estimate = estimate_items(path, sample_bytes=path.stat().st_size // 10)
+    assert 900 <= estimate <= 1100
+
+
+def test_discovery_orders_missions_and_files_by_items(tmp_path, capsys):
+    write_items(tmp_path / 'small' / 'SiteDirectory.json', 10)
+    write_items(tmp_path / 'large' / 'SiteDirectory.json', 20)
+    write_items(tmp_path / 'large' / 'Iterations' / 'it1.json', 300)
+    write_items(tmp_path / 'large' / 'Header.json', 1000)
+    write_items(tmp_path / 'medium' / 'SiteDirectory.json', 100)
+    write_items(tmp_path / 'medium' / 'Iterations' / 'it1.json', 100, name_length=64)
+
+    discovered = discover_em_files(str(tmp_path))
+    assert list(discovered) == ['large', 'medium', 'small']
+    assert [file['items'] for file in discovered['large']] == [300, 20]
+    # the same number of items, the largest file first
+    assert discovered['medium'][0]['path'].endswith('it1.json')
+
+    assert print_schedule(discovered, 2) is None
+    assert print_schedule(discovered, 2, items_per_second=10) == 32.0
+    assert 'worker 1 | ~320 items | large' in capsys.readouterr().out
@@ -0,0 +1,71 @@
+import hashlib
+
+import numpy as np
+import pytest
+
+import similarityElements
+from util import embedding_cache
+from util.embedding_cache import get_embedding_cache
+from util.embedding_codec import EMBEDDING_FORMAT_ENV, decode_embedding
+from util.normalization import TextNormalizer
+from util.utils import AcronymExpander
+
+DIM = 8
+MAPPINGS = [('OBC', '0x01'), ('Solar_Array', '0x02'), ('OBC', '0x03'), ('Solar Array', '0x04'),
+            ('Reaction_Wheel_Assembly', '0x05'), ('on board computer', '0x06'), ('Battery', '0x07')]
+
+
+def vector_of(text):
+    '''
+    Deterministic stand-in for the embedding of a text
+    '''
+    seed = int(hashlib.sha1(text.encode('utf-8')).hexdigest()[:8], 16)
+    return np.random.default_rng(seed).standard_normal(DIM).astype(np.float32)
+
+
+class FakeModel:
+    '''
+    Sentence transformer recording the texts of each forward pass
+    '''
+    batches = []
+
+    def __init__(self, model_name):
+        self.model_name = model_name
+
+    def encode(self, texts, batch_size=32, show_progress_bar=False):
+        for start in range(0, len(texts), batch_size):
+            FakeModel.batches.append(list(texts[start:start + batch_size]))
+        return np.array([vector_of(text) for text in texts])
+
+
+@pytest.fixture
+def model(monkeypatch, tmp_path):
+    FakeModel.batches = []
+    monkeypatch.setattr(similarityElements, 'SentenceTransformer', FakeModel)
+    monkeypatch.setenv(EMBEDDING_FORMAT_ENV, 'float32')
+    monkeypatch.setenv(embedding_cache.EMBEDDING_CACHE_ENV, str(tmp_path / 'embeddingCache'))
+    get_embedding_cache.cache_clear()
+    yield FakeModel
+    get_embedding_cache.cache_clear()
+
+
+def normalizer():
+    return TextNormalizer(AcronymExpander(['OBC'], ['on board computer']), underscores=True)
+
+
+def test_distinct_names_encoded_once_longest_first(model):
+    embeds = similarityElements.embed_elements(MAPPINGS, normalizer(), batch_size=2)
+    assert model.batches == [['Reaction Wheel Assembly', 'on board computer'], ['Solar Array', 'Battery']]
+    assert [embed['iid'] for embed in embeds] == [iid for name, iid in MAPPINGS]
+    texts = ['on board computer', 'Solar Array', 'on board computer', 'Solar Array', 'Reaction Wheel Assembly',
+             'on board computer', 'Battery']
+    for embed, text in zip(embeds, texts):
+        assert decode_embedding(embed['embed']) == vector_of(text).tolist()
+
+
+def test_names_of_a_previous_run_read_from_the_cache(model):
+    first = similarityElements.embed_elements(MAPPINGS, normalizer(), batch_size=2)
+    model.batches = []
+    again = similarityElements.embed_elements(MAPPINGS + [('Star_Tracker', '0x08')], normalizer(), batch_size=2)
+    assert model.batches == [['Star Tracker']]
+    assert again[:len(first)] == first
@@ -0,0 +1,25 @@
+import pytest
+
+from util.telemetry import Telemetry, percentile
+
+
+@pytest.mark.parametrize('q, expected', [(0, 1), (10, 1), (50, 5), (90, 9), (95, 10), (99, 10), (100, 10)])
+def test_nearest_rank_percentile(q, expected):
+    assert percentile(list(range(1, 11)), q) == expected
+
+
+def test_percentile_of_few_samples():
+    assert percentile([], 50) is None
+    assert percentile([0.2], 99) == 0.2
+    assert [percentile([1, 2, 3, 4], q) for q in (25, 50, 75, 76)] == [1, 2, 3, 4]
+    samples = list(range(1, 101))
+    assert [percentile(samples, q) for q in (50, 90, 95, 99)] == [50, 90, 95, 99]
+
+
+def test_report_percentiles():
+    telemetry = Telemetry()
+    for seconds in range(1, 11):
+        telemetry.observe('commit_seconds', seconds, kind='Entity')
+    timing, = telemetry.report()['timings']['commit_seconds']
+    assert (timing['p50'], timing['p90'], timing['p99']) == (5, 9, 10)
+    assert (timing['count'], timing['min'], timing['max']) == (10, 1, 10)
@@ -0,0 +1,47 @@
+import os
+import pickle
+import subprocess
+import sys
+
+import check_templates
+from conftest import APP_DIR, SCHEMA_FILE
+from synthetic import write_engineering_model
+from templateCompiler import compile_templates
+
+
+def test_compiled_templates_match_hand_written_on_synthetic_items(capsys):
+    assert check_templates.main(SCHEMA_FILE, None, 5000, verbose=True), capsys.readouterr().out
+
+
+def test_compiled_templates_match_hand_written_on_synthetic_em(tmp_path, synthetic_files, capsys):
+    write_engineering_model(str(tmp_path / 'mission'), synthetic_files(nb_elements=20))
+    assert check_templates.main(SCHEMA_FILE, str(tmp_path), 0, verbose=True), capsys.readouterr().out
+
+
+SYNTHETIC_ITEMS = f'''
+import sys, ujson
+sys.path[:0] = [{APP_DIR!r}, {os.path.join(APP_DIR, 'benchmarks')!r}]
+from migrationTemplates import TEMPLATES
+from synthetic import synthetic_items
+from templateCompiler import compile_templates
+print(ujson.dumps(synthetic_items(500, compile_templates({SCHEMA_FILE!r}), TEMPLATES), sort_keys=True))
+'''
+
+
+def test_synthetic_items_do_not_depend_on_the_hash_seed():
+    outputs = set()
+    for seed in ('0', '1'):
+        env = dict(os.environ, PYTHONHASHSEED=seed)
+        outputs.add(subprocess.run([sys.executable, '-c', SYNTHETIC_ITEMS], env=env, capture_output=True, text=True,
+                                   check=True).stdout)
+    assert len(outputs) == 1
+
+
+def test_compiled_template_pickles_as_its_description():
+    template = compile_templates(SCHEMA_FILE)['ParameterSubscription']
+    assert ('valueSet', 'Containment_valueSet', 'contains', 'isContained', 'ParameterSubscriptionValueSet') \
+        in template.relationships
+    # derived from the Parameter, not read from the item
+    assert 'parameterType' not in [relationship[0] for relationship in template.relationships]
+    copy = pickle.loads(pickle.dumps(template))
+    assert copy.source == template.source
@@ -0,0 +1,50 @@
+import migrate_em_json
+from util.tqlshards import ShardWriter, decode_query, encode_query, iter_shard, read_manifest
+
+
+def inserted(fake):
+    return [query for database, operation, query in fake.queries if operation == 'insert']
+
+
+def test_query_with_line_breaks_round_trip(tmp_path):
+    queries = ['insert $x isa Definition, has content "first line\nsecond line\r\n";', 'insert $y isa Thing;']
+    assert all('\n' not in encode_query(query) for query in queries)
+    assert [decode_query(encode_query(query) + '\n') for query in queries] == queries
+
+    writer = ShardWriter(str(tmp_path), 'entities-mission', 'Entity', shard_size=1, mission='mission')
+    for query in queries:
+        writer.write(query)
+    shards = writer.close()
+    assert [shard['file'] for shard in shards] == ['entities-mission-00000.tql.gz', 'entities-mission-00001.tql.gz']
+    assert [query for shard in shards for query in iter_shard(str(tmp_path / shard['file']))] == queries
+
+
+def test_emitted_shards_load_the_same_queries(fake, session, synthetic_missions, tmp_path):
+    em_list = synthetic_missions({'alpha': 2, 'beta': 1})
+    for mission, em_files in em_list.items():
+        migrate_em_json.build_engineering_model_graph(em_files, session, migrate_em_json.TEMPLATES, mission=mission)
+    direct = sorted(inserted(fake))
+
+    directory = tmp_path / 'shards'
+    shards = migrate_em_json.emit_typeql(em_list, migrate_em_json.TEMPLATES, str(directory), shard_size=50,
+                                         templates='hand-written')
+    manifest = read_manifest(str(directory))
+    assert manifest['templates'] == 'hand-written' and manifest['shards'] == shards
+    kinds = [shard['kind'] for shard in shards]
+    assert kinds == sorted(kinds, key=['Entity', 'Relationship'].index) and 'Relationship' in kinds
+    assert all(0 < shard['queries'] <= 50 for shard in shards)
+
+    # rendering the same EMs again gives identical files
+    first = {shard['file']: (directory / shard['file']).read_bytes() for shard in shards}
+    migrate_em_json.emit_typeql(em_list, migrate_em_json.TEMPLATES, str(directory), shard_size=50,
+                                templates='hand-written')
+    assert {name: (directory / name).read_bytes() for name in first} == first
+
+    fake.queries.clear()
+    assert migrate_em_json.load_typeql_shards(session, str(directory), writers=2) == len(direct)
+    loaded = inserted(fake)
+    assert sorted(loaded) == direct
+    # all entities are committed before the first relationship
+    nb_entities = sum(shard['queries'] for shard in shards if shard['kind'] == 'Entity')
+    assert not any(query.startswith('match') for query in loaded[:nb_entities])
+    assert all(query.startswith('match') for query in loaded[nb_entities:])
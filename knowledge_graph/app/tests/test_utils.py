@@ -0,0 +1,98 @@
+import json
+
+import pytest
+
+from util.normalization import ACRONYMS_FILE
+from util.utils import AcronymExpander, iter_json_array, load_Acronyms, replace_Acronyms
+
+ITEMS = [
+    {'classKind': 'ElementDefinition', 'iid': 'a1', 'name': 'Solar Array', 'parameter': ['p1', 'p2']},
+    {'classKind': 'Parameter', 'iid': 'p1', 'valueSet': [{'k': 0, 'v': 'vs1'}], 'scale': None},
+    {'classKind': 'ParameterValueSet', 'iid': 'vs1', 'manual': '["-", "1.5e3"]', 'published': [1, [2, [3]]]},
+    {'classKind': 'Definition', 'iid': 'd1', 'content': 'Brackets ] and [ and commas, in a string, é'},
+]
+
+
+def write_array(tmp_path, items, indent=None):
+    path = tmp_path / 'EngineeringModel.json'
+    path.write_text(json.dumps(items, indent=indent, ensure_ascii=False), encoding='utf-8')
+    return path
+
+
+@pytest.mark.parametrize('chunk_size', [1, 2, 3, 7, 16, 64, 1 << 20])
+def test_items_split_across_chunks(tmp_path, chunk_size):
+    path = write_array(tmp_path, ITEMS, indent=2)
+    assert list(iter_json_array(path, chunk_size=chunk_size)) == ITEMS
+
+
+@pytest.mark.parametrize('chunk_size', [1, 5, 1 << 20])
+def test_nested_arrays_and_scalars(tmp_path, chunk_size):
+    items = [[1, [2, [3, []]]], {'a': [[], [{}]]}, 12345678, -0.25, 'text', True, None, []]
+    path = write_array(tmp_path, items)
+    assert list(iter_json_array(path, chunk_size=chunk_size)) == items
+
+
+def test_empty_array(tmp_path):
+    path = write_array(tmp_path, [], indent=2)
+    assert list(iter_json_array(path, chunk_size=1)) == []
+
+
+@pytest.mark.parametrize('chunk_size', [1, 8, 1 << 20])
+def test_truncated_item(tmp_path, chunk_size):
+    path = tmp_path / 'truncated.json'
+    path.write_text(json.dumps(ITEMS)[:-40], encoding='utf-8')
+    items = iter_json_array(path, chunk_size=chunk_size)
+    assert next(items) == ITEMS[0]
+    with pytest.raises(ValueError):
+        list(items)
+
+
+@pytest.mark.parametrize('chunk_size', [1, 1 << 20])
+def test_unclosed_array(tmp_path, chunk_size):
+    path = tmp_path / 'unclosed.json'
+    path.write_text(json.dumps(ITEMS)[:-1], encoding='utf-8')
+    items = iter_json_array(path, chunk_size=chunk_size)
+    assert [next(items) for _ in ITEMS] == ITEMS
+    with pytest.raises(ValueError, match='not closed'):
+        next(items)
+
+
+def test_not_an_array(tmp_path):
+    path = tmp_path / 'object.json'
+    path.write_text(json.dumps({'items': ITEMS}), encoding='utf-8')
+    with pytest.raises(ValueError, match='top-level JSON array'):
+        list(iter_json_array(path))
+
+
+# acronyms applied in this order, see replace_Acronyms
+ACRONYMS = ['SA', 'AOCS', 'OBC', 'I/O', 'A.B', 'X']
+EXPANSIONS = ['solar array', 'attitude control with obc and sa', 'on board computer', 'input output', 'dotted',
+              'single']
+SENTENCES = ['Solar SA deployment', 'Two OBCs and one SA', 'AOCS_Unit', 'I/O board of the OBC', 'A.B and X',
+             'aocs mode', 'OBCS', 'no acronym here', 'SAs', 'I/Os', 'sa sa SA', '']
+
+
+@pytest.mark.parametrize('sentence', SENTENCES)
+def test_acronym_expander_same_as_replace_acronyms(sentence):
+    expander = AcronymExpander(ACRONYMS, EXPANSIONS)
+    assert expander.expand(sentence) == replace_Acronyms(sentence, ACRONYMS, EXPANSIONS)
+
+
+def test_acronym_expansions():
+    expander = AcronymExpander(ACRONYMS, EXPANSIONS)
+    # plural of an acronym
+    assert expander('Two OBCs') == 'two on board computers'
+    # acronyms of the expansion further down the list are expanded, the ones before it are not
+    assert expander('AOCS') == 'attitude control with on board computer and sa'
+    # acronym which is not a word
+    assert expander('I/O board') == 'input output board'
+    # one-letter acronyms and acronyms with a dot are never expanded, a sentence without acronym keeps its case
+    assert expander('A.B and X') == 'A.B and X'
+
+
+def test_acronym_expander_with_ecss_acronyms():
+    acronyms, expansions = load_Acronyms(ACRONYMS_FILE)
+    expander = AcronymExpander.from_file(ACRONYMS_FILE)
+    for sentence in ('AIT of the EEE parts', 'H/W and S/W I/F', 'Star_Tracker_AOCS', 'AOCS modes of the OBCs',
+                     'Solar Array Drive Mechanism', 'C/N of the E/S link'):
+        assert expander(sentence) == replace_Acronyms(sentence, acronyms, expansions)
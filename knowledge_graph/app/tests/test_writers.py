@@ -0,0 +1,90 @@
+import re
+import time
+
+import ujson as json
+from typedb.client import TypeDBClientException
+
+import migrate_em_json
+from util.batching import commit_batch
+from util.checkpoint import Checkpoint
+from util.relationships import RelationshipSink
+from util.writers import BatchWriterPool
+
+# Template of the items of the test EM files
+TEMPLATES = {'ElementDefinition': lambda item: f'insert $x isa ElementDefinition, has id "{item["iid"]}";'}
+
+
+def delay_commits(session, monkeypatch, delay, fail=None):
+    '''
+    Commits of the session wait delay(first query) seconds, the ones of a transaction with a query matching fail
+    raise a lost connection
+    :return: list of the first query of each commit, in the order the commits finished
+    '''
+    finished = []
+    transaction = session.transaction
+
+    def delayed(transaction_type, options=None):
+        opened = transaction(transaction_type, options)
+        commit = opened.commit
+
+        def delayed_commit():
+            first = opened._queries[0][1]
+            time.sleep(delay(first))
+            if fail is not None and any(re.search(fail, query) for operation, query in opened._queries):
+                raise TypeDBClientException('[CLI05] Unable to connect to TypeDB server.')
+            commit()
+            finished.append(first)
+        opened.commit = delayed_commit
+        return opened
+
+    monkeypatch.setattr(session, 'transaction', delayed)
+    return finished
+
+
+def write_em_file(tmp_path, nb_items):
+    path = tmp_path / 'Iteration.json'
+    path.write_text(json.dumps([{'classKind': 'ElementDefinition', 'iid': f'id{i}', 'revisionNumber': 1}
+                                for i in range(nb_items)]))
+    return path
+
+
+def test_batches_reported_in_submission_order(fake, session, monkeypatch):
+    # the first batches take the longest, so the last ones finish first
+    finished = delay_commits(session, monkeypatch, lambda query: 0.05 * (8 - int(re.search(r'b(\d+)', query)[1])))
+    reported = []
+    pool = BatchWriterPool(lambda batch: commit_batch(session, batch), writers=4, max_pending=8,
+                           on_committed=lambda index, batch, committed: reported.append((index, committed)))
+    batches = [[f'insert $x isa ElementDefinition, has id "b{b}-{i}";' for i in range(4)] for b in range(8)]
+    for batch in batches:
+        pool.submit(batch)
+    assert pool.close() == []
+    assert finished != [batch[0] for batch in batches]
+    assert reported == [(index, 4) for index in range(8)]
+
+
+def test_checkpoint_held_back_after_failed_batch(fake, session, monkeypatch, tmp_path):
+    path = write_em_file(tmp_path, 1000)
+    # the first batch finishes after the ones after it, the batch of item 300 loses the connection
+    delay_commits(session, monkeypatch, lambda query: 0.2 if '"id0"' in query else 0.01, fail='"id300"')
+    checkpoint = Checkpoint(str(tmp_path / 'checkpoint_testdb.json'), interval=0)
+    checkpoint.sink = RelationshipSink(str(tmp_path / 'tempRelationships_testdb.jsonl'))
+    offsets = []
+    batch_committed = checkpoint.batch_committed
+
+    def record(mission, path, offset, relationships):
+        offsets.append(offset)
+        batch_committed(mission, path, offset, relationships)
+    monkeypatch.setattr(checkpoint, 'batch_committed', record)
+
+    failed = migrate_em_json.load_data_into_typedb(path, session, TEMPLATES, writers=3, mission='mission',
+                                                   checkpoint=checkpoint)
+    assert len(failed) == 1
+    index, batch, error = failed[0]
+    first_failed = min(int(id[2:]) for id, query in batch)
+    # offsets advance batch by batch up to the failed batch, and stop there
+    assert offsets and offsets == sorted(set(offsets))
+    assert offsets[-1] == first_failed
+    assert Checkpoint(checkpoint.path).file_offset('mission', path) == first_failed
+    # the batches after the failed one were still committed
+    committed = {query for database, operation, query in fake.queries if operation == 'insert'}
+    assert TEMPLATES['ElementDefinition']({'iid': 'id999'}) in committed
@@ -0,0 +1,201 @@
+import logging
+import threading
+import time
+
+import ujson as json
+from typedb.client import TransactionType, TypeDBClientException
+
+from util.telemetry import telemetry
+
+# Report of the insert queries rejected by TypeDB, written by commit_batch, {} is replaced by the database name
+REJECTED_QUERIES_FILE = 'rejectedQueries_{}.jsonl'
+rejected_lock = threading.Lock()
+# Report of the rejected queries of this run, see start_rejected_report
+rejected_queries_path = REJECTED_QUERIES_FILE.format('run')
+
+# Fragments of the error messages of transactions which failed because they were too large for the server
+OVERLOAD_MESSAGES = ('timeout', 'timed out', 'deadline', 'memory', 'resource exhausted', 'resource_exhausted',
+                     'too large')
+# Fragments of the error messages of a lost server, client or session (typedb-client CLI01, CLI02, CLI05 and gRPC
+# UNAVAILABLE), which no query of the batch can be blamed for
+CONNECTION_MESSAGES = ('unable to connect', 'failed to connect', 'client has been closed', 'session has been closed',
+                       'connection refused', 'connection reset', 'socket closed', 'unavailable')
+
+
+def is_overload(error):
+    '''
+    :return: whether an error means that the transaction was too large (timeout or memory error), as opposed to
+             errors of the queries themselves (e.g. an id already in the database)
+    '''
+    if isinstance(error, (MemoryError, TimeoutError)):
+        return True
+    message = str(error).lower()
+    return any(fragment in message for fragment in OVERLOAD_MESSAGES)
+
+
+def is_connection_error(error):
+    '''
+    :return: whether an error means that the server or the session was lost, as opposed to errors of the transaction
+             (too large) or of its queries
+    '''
+    if isinstance(error, ConnectionError):
+        return True
+    message = str(error).lower()
+    return any(fragment in message for fragment in CONNECTION_MESSAGES)
+
+
+class AdaptiveBatchSize:
+    '''
+    Sizes the batches of queries committed in one transaction by the measured commit latency and by the total size
+    of the queries: a batch is full once it holds `size` queries or `max_bytes` characters of queries, whichever
+    comes first, so batches of large queries (e.g. with s_bert_embedding strings) stay small while batches of short
+    relationship inserts get long.
+    `size` grows while full batches commit in less than half the target latency, is scaled down to the target when
+    commits are slower, and drops to half of the failed batch on timeouts and memory errors.
+    Commits may be reported from several writer threads.
+    '''
+
+    def __init__(self, size=128, min_size=1, max_size=8192, max_bytes=4 << 20, target_latency=2.0, growth=1.5):
+        '''
+        :param size: initial number of queries per batch
+        :param min_size: smallest number of queries per batch
+        :param max_size: largest number of queries per batch
+        :param max_bytes: largest total number of characters of the queries of one batch
+        :param target_latency: seconds a commit should take
+        :param growth: factor applied to size after a fast commit
+        '''
+        self.size = size
+        self.min_size = min_size
+        self.max_size = max_size
+        self.max_bytes = max_bytes
+        self.target_latency = target_latency
+        self.growth = growth
+        self._lock = threading.Lock()
+
+    def full(self, nb_queries, nb_bytes):
+        '''
+        :param nb_queries: number of queries in the batch being built
+        :param nb_bytes: total number of characters of these queries
+        :return: whether the batch should be committed
+        '''
+        return nb_queries >= self.size or nb_bytes >= self.max_bytes
+
+    def committed(self, nb_queries, nb_bytes, seconds):
+        '''
+        Record the latency of a successful commit
+        :param nb_queries: number of queries of the batch
+        :param nb_bytes: total number of characters of these queries
+        :param seconds: duration of the transaction
+        '''
+        with self._lock:
+            if seconds > self.target_latency:
+                self.size = max(self.min_size, min(self.size, int(nb_queries * self.target_latency / seconds)))
+            elif seconds < self.target_latency / 2 and nb_queries >= self.size and nb_bytes < self.max_bytes:
+                # only full batches limited by their number of queries say something about a larger size
+                self.size = min(self.max_size, max(self.size + 1, int(self.size * self.growth)))
+
+    def failed(self, nb_queries, error):
+        '''
+        Record a failed commit, the size drops to half of the batch if the transaction was too large
+        :param nb_queries: number of queries of the batch
+        :param error: exception raised by the commit
+        :return: whether the error is a timeout or memory error
+        '''
+        if not is_overload(error):
+            return False
+        with self._lock:
+            self.size = max(self.min_size, min(self.size, nb_queries // 2))
+        return True
+
+
+def inserted_iids(answers, batch_ids):
+    '''
+    Collects the iids of the entities inserted by a batch of queries
+    :param answers: answer iterators of the insert queries
+    :param batch_ids: CDP4 id of the item inserted by each query
+    :return: dict CDP4 id -> TypeDB iid
+    '''
+    return {id: concept.get_iid() for id, answer in zip(batch_ids, answers)
+            for concept_map in answer for concept in concept_map.concepts() if concept.is_entity()}
+
+
+def start_rejected_report(dbName, truncate=True):
+    '''
+    Selects the report of the rejected queries of the run, emptied at the start of the run so that it only lists the
+    queries counted in the run report
+    :param dbName: TypeDB database, the report is REJECTED_QUERIES_FILE of the database
+    :param truncate: If yes, empty the report, not done by the worker processes of a run
+    '''
+    global rejected_queries_path
+    rejected_queries_path = REJECTED_QUERIES_FILE.format(dbName)
+    if truncate:
+        with rejected_lock:
+            open(rejected_queries_path, 'w', encoding='utf-8').close()
+    telemetry.run.update(rejected_queries_file=rejected_queries_path)
+
+
+def report_rejected(kind, query, error):
+    '''
+    Appends a query rejected by TypeDB to the report of rejected queries (one JSON object per line)
+    :param kind: type of inserted data
+    :param query: rejected insert query
+    :param error: exception thrown by TypeDB
+    '''
+    with rejected_lock:
+        with open(rejected_queries_path, 'a', encoding='utf-8') as file:
+            file.write(json.dumps({'kind': kind, 'error': str(error), 'query': query}) + '\n')
+
+
+def commit_batch(session, batch_query, kind='Entity', batch_ids=None, iid_map=None, adaptive_size=None):
+    '''
+    Commits a batch of insert queries in a single WRITE transaction.
+    If the commit fails (throws error if items are already in the KG, checks unique id for each item, or if the
+    transaction was too large), the batch is split in halves which are retried recursively, so the k rejected
+    queries of a batch of n are isolated in O(k log n) transactions. Rejected queries are written to the report of
+    the run, see start_rejected_report. Errors of a lost server or session are raised, without retry
+    :param session: running TypeDB session where data is being migrated
+    :param batch_query: list of insert queries
+    :param kind: type of inserted data, used for logging
+    :param batch_ids: CDP4 id of the item inserted by each query, needed with iid_map
+    :param iid_map: optional IidMap, records the iid of the inserted entities once committed
+    :param adaptive_size: optional AdaptiveBatchSize, told the latency of the commits and their timeouts
+    :return: number of committed queries
+    '''
+    if not batch_query:
+        return 0
+
+    start = time.perf_counter()
+    try:
+        with session.transaction(TransactionType.WRITE) as transaction:
+            answers = [transaction.query().insert(query) for query in batch_query]
+            iids = inserted_iids(answers, batch_ids) if iid_map is not None else None
+            transaction.commit()
+        if iid_map is not None:
+            iid_map.update(iids)
+        seconds = time.perf_counter() - start
+        if adaptive_size is not None:
+            adaptive_size.committed(len(batch_query), sum(len(query) for query in batch_query), seconds)
+        telemetry.observe('commit_seconds', seconds, kind=kind)
+        telemetry.count('queries_committed', len(batch_query), kind=kind)
+        return len(batch_query)
+    except (TypeDBClientException, MemoryError) as error:
+        telemetry.observe('failed_commit_seconds', time.perf_counter() - start, kind=kind)
+        if is_connection_error(error):
+            telemetry.count('failed_commits', kind=kind, reason='connection')
+            raise
+        reason = 'overload' if is_overload(error) else 'rejected'
+        telemetry.count('failed_commits', kind=kind, reason=reason)
+        if adaptive_size is not None:
+            adaptive_size.failed(len(batch_query), error)
+        if len(batch_query) == 1:
+            logging.info(f'{kind} query {reason}: {error}\n{batch_query[0]}')
+            report_rejected(kind, batch_query[0], error)
+            telemetry.count('queries_rejected', kind=kind)
+            return 0
+
+    # each half is a retry of part of the failed batch
+    telemetry.count('retried_batches', 2, kind=kind)
+    half = len(batch_query) // 2
+    batch_ids = batch_ids if batch_ids is not None else [None] * len(batch_query)
+    return commit_batch(session, batch_query[:half], kind, batch_ids[:half], iid_map, adaptive_size) + \
+           commit_batch(session, batch_query[half:], kind, batch_ids[half:], iid_map, adaptive_size)
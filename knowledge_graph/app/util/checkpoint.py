@@ -0,0 +1,106 @@
+import os
+import time
+
+import ujson as json
+
+
+class Checkpoint:
+    '''
+    Manifest recording the progress of the migration of Engineering Models into one database, so an interrupted run
+    can be resumed. For each mission it stores the EM files which finished, the number of items of the current file
+    whose batches are committed, the number of relationships collected up to that point and whether the relationship
+    phase completed.
+    The relationship sink of the mission is flushed before each save, so its spill file always holds at least the
+    relationships of the committed items.
+    Missions inserted by different processes share the manifest through a lock: each process then only writes the
+    missions it worked on over the manifest found on disk.
+    '''
+
+    def __init__(self, path, resume=True, interval=30, lock=None):
+        '''
+        :param path: .json file of the manifest
+        :param resume: If yes, continue from the manifest found at path, otherwise start a new one
+        :param interval: minimum number of seconds between two saves of the batch offset
+        :param lock: optional multiprocessing lock shared by the processes saving the manifest
+        '''
+        self.path = path
+        self.interval = interval
+        self.lock = lock
+        self.sink = None
+        self._last_save = 0
+        self._used = set()
+        self.missions = self._read() if resume else {}
+
+    def _read(self):
+        if not os.path.exists(self.path):
+            return {}
+        with open(self.path, 'r', encoding='utf-8') as file:
+            return json.load(file)['missions']
+
+    def mission(self, mission):
+        '''
+        :return: progress of one mission, created if the mission was not started yet
+        '''
+        self._used.add(mission)
+        return self.missions.setdefault(mission, {'files_done': [], 'current_file': None, 'offset': 0,
+                                                  'relationships': 0, 'relationships_done': False})
+
+    def is_file_done(self, mission, path):
+        return str(path) in self.mission(mission)['files_done']
+
+    def file_offset(self, mission, path):
+        '''
+        :return: number of items of the file whose batches are committed
+        '''
+        progress = self.mission(mission)
+        return progress['offset'] if progress['current_file'] == str(path) else 0
+
+    def batch_committed(self, mission, path, offset, relationships):
+        '''
+        Record that the first `offset` items of a file are committed, saved at most every `interval` seconds
+        :param relationships: number of relationships collected when rendering these items
+        '''
+        progress = self.mission(mission)
+        progress['current_file'] = str(path)
+        progress['offset'] = offset
+        progress['relationships'] = relationships
+        if time.time() - self._last_save > self.interval:
+            self.save()
+
+    def file_done(self, mission, path, relationships):
+        progress = self.mission(mission)
+        progress['files_done'].append(str(path))
+        progress['current_file'] = None
+        progress['offset'] = 0
+        progress['relationships'] = relationships
+        self.save()
+
+    def relationships_done(self, mission):
+        self.mission(mission)['relationships_done'] = True
+        self.save()
+
+    def is_mission_done(self, mission):
+        return self.mission(mission)['relationships_done']
+
+    def reset(self):
+        self.missions = {}
+        self._used = set()
+        self._write(self.missions)
+
+    def save(self):
+        if self.sink is not None:
+            self.sink.flush()
+        if self.lock is None:
+            self._write(self.missions)
+        else:
+            with self.lock:
+                missions = self._read()
+                missions.update({mission: self.missions[mission] for mission in self._used})
+                self._write(missions)
+        self._last_save = time.time()
+
+    def _write(self, missions):
+        # write to a temporary file first, so a crash while saving does not corrupt the manifest
+        with open(self.path + '.tmp', 'w', encoding='utf-8') as file:
+            json.dump({'missions': missions}, file)
+        os.replace(self.path + '.tmp', self.path)
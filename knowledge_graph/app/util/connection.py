@@ -0,0 +1,42 @@
+import os
+
+from typedb.client import TypeDB
+
+# Environment variable selecting the in-process FakeTypeDB instead of a TypeDB server, "true" or the path of its
+# .json configuration (see util/fake_typedb.py). Set by main.py --fakeTypeDB, inherited by the worker processes
+FAKE_TYPEDB_ENV = 'KG_FAKE_TYPEDB'
+
+# FakeTypeDB of this process, created on the first connection
+_fake = None
+
+
+def use_fake_typedb(config):
+    '''
+    Select the FakeTypeDB for all following connections of this process and of the processes it starts
+    :param config: "true" for the defaults, or path of a .json file with the arguments of FakeTypeDB
+    '''
+    global _fake
+    os.environ[FAKE_TYPEDB_ENV] = str(config)
+    _fake = None
+
+
+def fake_typedb():
+    '''
+    :return: FakeTypeDB of this process (e.g. to read the recorded queries), None if no fake client was opened
+    '''
+    return _fake
+
+
+def core_client(address="localhost:1729"):
+    '''
+    Client used by all pipelines: a TypeDB core client, or the FakeTypeDB if selected by use_fake_typedb
+    :param address: address of the TypeDB server
+    '''
+    global _fake
+    config = os.environ.get(FAKE_TYPEDB_ENV)
+    if not config:
+        return TypeDB.core_client(address)
+    if _fake is None:
+        from util.fake_typedb import FakeTypeDB
+        _fake = FakeTypeDB.from_config(config)
+    return _fake.core_client(address)
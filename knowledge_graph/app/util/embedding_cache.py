@@ -0,0 +1,331 @@
+import functools
+import hashlib
+import os
+import re
+import threading
+from contextlib import contextmanager
+
+import numpy as np
+
+try:
+    import fcntl
+except ImportError:
+    # Windows
+    fcntl = None
+    import msvcrt
+
+# Environment variable with the directory of the cache, "" disables it. Set by main.py --embeddingCache
+EMBEDDING_CACHE_ENV = 'KG_EMBEDDING_CACHE'
+# Default directory, next to the util package (app/ of the data insertion, app/ of the recommendation notebook)
+DEFAULT_DIRECTORY = os.path.join(os.path.dirname(os.path.dirname(os.path.abspath(__file__))), 'embeddingCache')
+# Largest number of vectors kept per model, the least recently used are evicted beyond it
+MAX_ENTRIES = 2_000_000
+# Fraction of MAX_ENTRIES kept by an eviction, so that evictions are not run on every new vector
+EVICTION_KEEP = 0.75
+VECTORS_FILE = 'vectors.f32'
+INDEX_FILE = 'index.tsv'
+# File locked by the process reading or writing the cache, see EmbeddingCache._locked
+LOCK_FILE = 'lock'
+
+
+def text_key(model_name, text):
+    '''
+    :return: digest of the text embedded by the model
+    '''
+    return hashlib.sha1(f'{model_name}\n{text}'.encode('utf-8')).hexdigest()
+
+
+def _lock_file(file):
+    if fcntl is not None:
+        fcntl.flock(file.fileno(), fcntl.LOCK_EX)
+    else:
+        file.seek(0)
+        msvcrt.locking(file.fileno(), msvcrt.LK_LOCK, 1)
+
+
+def _unlock_file(file):
+    if fcntl is not None:
+        fcntl.flock(file.fileno(), fcntl.LOCK_UN)
+    else:
+        file.seek(0)
+        msvcrt.locking(file.fileno(), msvcrt.LK_UNLCK, 1)
+
+
+class EmbeddingCache:
+    '''
+    Persistent cache of the embeddings of one model: the vectors are rows of a memory-mapped float32 matrix, found by
+    the digest of (model name, normalized text). New vectors are appended to the matrix and to the index file
+    ("<digest>\t<row>\t<stamp>" lines, row -1 only updates the stamp), so a run only encodes the texts no previous
+    run has encoded. The stamp is the number of the run which last used the vector; once the cache holds more than
+    max_entries vectors, the least recently used are evicted by rewriting both files.
+    Several processes can share a cache directory (e.g. the data insertion and the recommendation notebook): the files
+    are only read and written under an exclusive lock on LOCK_FILE, after reading the index lines appended by the
+    other processes, so rows are never given twice.
+    '''
+
+    def __init__(self, directory, model_name, max_entries=MAX_ENTRIES):
+        '''
+        :param directory: directory of the caches, the cache of the model is in a sub-directory, created with the
+                          first vector
+        :param model_name: name of the model, e.g. "all-mpnet-base-v2"
+        :param max_entries: largest number of vectors kept
+        '''
+        self.model_name = model_name
+        self.directory = os.path.join(directory, re.sub(r'[^\w.-]', '_', model_name))
+        self.max_entries = max_entries
+        self.hits = 0
+        self.misses = 0
+        self._lock = threading.RLock()
+        self._depth = 0
+        self._lock_file = None
+        # digest -> [row, stamp]
+        self._index = {}
+        self._touched = set()
+        self._vectors = None
+        self._dim = None
+        self._size = 0
+        # bytes of the index file read so far, and identity of the file (replaced by evictions)
+        self._index_offset = 0
+        self._index_id = None
+        self.stamp = None
+        with self._locked():
+            self._sync()
+        # this run
+        self.stamp = max((used for row, used in self._index.values()), default=0) + 1
+
+    @property
+    def vectors_path(self):
+        return os.path.join(self.directory, VECTORS_FILE)
+
+    @property
+    def index_path(self):
+        return os.path.join(self.directory, INDEX_FILE)
+
+    @contextmanager
+    def _locked(self):
+        '''
+        Exclusive access to the files of the cache, for the threads of this process and for the other processes
+        '''
+        with self._lock:
+            self._depth += 1
+            try:
+                if self._depth == 1 and os.path.isdir(self.directory):
+                    self._lock_file = open(os.path.join(self.directory, LOCK_FILE), 'a+b')
+                    _lock_file(self._lock_file)
+                yield
+            finally:
+                if self._depth == 1 and self._lock_file is not None:
+                    _unlock_file(self._lock_file)
+                    self._lock_file.close()
+                    self._lock_file = None
+                self._depth -= 1
+
+    def _sync(self):
+        '''
+        Reads the index lines appended since the last call (by this or other processes), or the whole index if it
+        was rewritten by an eviction, and maps the rows they refer to. Called under _locked
+        '''
+        try:
+            status = os.stat(self.index_path)
+        except FileNotFoundError:
+            return
+        if (status.st_dev, status.st_ino) != self._index_id or status.st_size < self._index_offset:
+            self._index = {}
+            self._size = 0
+            self._index_offset = 0
+            self._index_id = (status.st_dev, status.st_ino)
+            self._vectors = None
+        if status.st_size == self._index_offset:
+            return
+        with open(self.index_path, 'rb') as file:
+            file.seek(self._index_offset)
+            data = file.read()
+        # a line is only complete with its newline
+        data = data[:data.rfind(b'\n') + 1]
+        self._index_offset += len(data)
+        for line in data.decode('utf-8').splitlines():
+            entry = line.split('\t')
+            if len(entry) == 2 and entry[0] == 'dim':
+                self._dim = int(entry[1])
+            elif len(entry) == 3:
+                digest, row, used = entry[0], int(entry[1]), int(entry[2])
+                if row >= 0:
+                    self._index[digest] = [row, used]
+                    self._size = max(self._size, row + 1)
+                elif digest in self._index:
+                    self._index[digest][1] = max(self._index[digest][1], used)
+        if self._dim is not None and (self._vectors is None or self._size > len(self._vectors)):
+            self._open(self._size)
+
+    def _open(self, capacity):
+        '''
+        (Re)maps the matrix file with room for at least `capacity` vectors, growing the file if needed
+        '''
+        if self._vectors is not None:
+            self._vectors.flush()
+            self._vectors = None
+        nb_bytes = capacity * self._dim * 4
+        with open(self.vectors_path, 'ab') as file:
+            if file.tell() < nb_bytes:
+                file.truncate(nb_bytes)
+            capacity = max(capacity, file.tell() // (4 * self._dim))
+        if capacity:
+            self._vectors = np.memmap(self.vectors_path, dtype=np.float32, mode='r+', shape=(capacity, self._dim))
+
+    def _append_index(self, lines):
+        '''
+        Appends lines to the index, under _locked after _sync so that they follow the lines already read
+        '''
+        with open(self.index_path, 'ab') as file:
+            file.write(''.join(lines).encode('utf-8'))
+            self._index_offset = file.tell()
+        status = os.stat(self.index_path)
+        self._index_id = (status.st_dev, status.st_ino)
+
+    def __len__(self):
+        return len(self._index)
+
+    def __contains__(self, text):
+        return text_key(self.model_name, text) in self._index
+
+    def get(self, texts):
+        '''
+        :param texts: normalized texts
+        :return: dict text -> vector (float32 array) of the texts in the cache
+        '''
+        found = {}
+        with self._locked():
+            self._sync()
+            for text in texts:
+                digest = text_key(self.model_name, text)
+                entry = self._index.get(digest)
+                if entry is None:
+                    continue
+                found[text] = np.array(self._vectors[entry[0]])
+                if entry[1] != self.stamp:
+                    entry[1] = self.stamp
+                    self._touched.add(digest)
+        return found
+
+    def put(self, texts, vectors):
+        '''
+        Appends the vectors of texts not in the cache yet, written to the matrix and to the index at once
+        '''
+        os.makedirs(self.directory, exist_ok=True)
+        with self._locked():
+            self._sync()
+            new = {}
+            for text, vector in zip(texts, vectors):
+                digest = text_key(self.model_name, text)
+                if digest not in self._index:
+                    new[digest] = np.asarray(vector, dtype=np.float32)
+            if not new:
+                return
+            lines = []
+            if self._dim is None:
+                self._dim = len(next(iter(new.values())))
+                lines.append(f'dim\t{self._dim}\n')
+            if self._vectors is None or self._size + len(new) > len(self._vectors):
+                self._open(max(1024, 2 * (self._size + len(new))))
+            for digest, vector in new.items():
+                self._vectors[self._size] = vector
+                self._index[digest] = [self._size, self.stamp]
+                lines.append(f'{digest}\t{self._size}\t{self.stamp}\n')
+                self._size += 1
+            # vectors are on disk before the index entries pointing at them
+            self._vectors.flush()
+            self._append_index(lines)
+
+    def encode(self, texts, encoder):
+        '''
+        Vectors of the texts, from the cache or encoded by `encoder` and added to the cache, which is then flushed
+        :param texts: list of normalized texts
+        :param encoder: function list of texts -> array of vectors, only called with the texts not in the cache
+        :return: list of vectors, in the order of texts
+        '''
+        found = self.get(texts)
+        missing = list(dict.fromkeys(text for text in texts if text not in found))
+        with self._lock:
+            self.hits += len(texts) - len(missing)
+            self.misses += len(missing)
+        if missing:
+            vectors = encoder(missing)
+            self.put(missing, vectors)
+            found.update(zip(missing, (np.asarray(vector, dtype=np.float32) for vector in vectors)))
+        self.flush()
+        return [found[text] for text in texts]
+
+    def flush(self):
+        '''
+        Writes the stamps of the vectors used by this run, and evicts the least recently used vectors beyond
+        max_entries
+        '''
+        with self._locked():
+            if self._touched:
+                self._sync()
+                touched = [digest for digest in self._touched if digest in self._index]
+                for digest in touched:
+                    self._index[digest][1] = self.stamp
+                self._append_index([f'{digest}\t-1\t{self.stamp}\n' for digest in touched])
+                self._touched = set()
+            if len(self._index) > self.max_entries:
+                self.evict(int(self.max_entries * EVICTION_KEEP))
+
+    def evict(self, keep):
+        '''
+        Keeps the `keep` most recently used vectors, rewriting the matrix and index files
+        '''
+        with self._locked():
+            self._sync()
+            kept = sorted(self._index.items(), key=lambda entry: -entry[1][1])[:keep]
+            kept.sort(key=lambda entry: entry[1][0])
+            vectors_tmp, index_tmp = self.vectors_path + '.tmp', self.index_path + '.tmp'
+            matrix = np.memmap(vectors_tmp, dtype=np.float32, mode='w+', shape=(max(1, len(kept)), self._dim))
+            with open(index_tmp, 'w', encoding='utf-8') as file:
+                file.write(f'dim\t{self._dim}\n')
+                for row, (digest, (old_row, used)) in enumerate(kept):
+                    matrix[row] = self._vectors[old_row]
+                    file.write(f'{digest}\t{row}\t{used}\n')
+            matrix.flush()
+            del matrix
+            self._vectors = None
+            os.replace(vectors_tmp, self.vectors_path)
+            os.replace(index_tmp, self.index_path)
+            # read back as the other processes will
+            self._index_id = None
+            self._sync()
+
+    def stats(self):
+        return {'hits': self.hits, 'misses': self.misses, 'entries': len(self._index), 'directory': self.directory}
+
+
+def use_embedding_cache(directory):
+    '''
+    Select the cache directory of this process and of the processes it starts, "" disables the cache
+    '''
+    os.environ[EMBEDDING_CACHE_ENV] = directory
+    get_embedding_cache.cache_clear()
+
+
+@functools.lru_cache(maxsize=None)
+def get_embedding_cache(model_name):
+    '''
+    :return: EmbeddingCache of the model shared by the call sites of this process, None if the cache is disabled
+    '''
+    directory = os.environ.get(EMBEDDING_CACHE_ENV, DEFAULT_DIRECTORY)
+    if not directory:
+        return None
+    return EmbeddingCache(directory, model_name)
+
+
+def encode_cached(model, model_name, texts, **kwargs):
+    '''
+    model.encode(texts, **kwargs) of a list of texts, through the embedding cache of the model if enabled
+    :return: list of vectors, in the order of texts
+    '''
+    if not texts:
+        return []
+    cache = get_embedding_cache(model_name)
+    if cache is None:
+        return list(model.encode(texts, **kwargs))
+    return cache.encode(texts, lambda missing: model.encode(missing, **kwargs))
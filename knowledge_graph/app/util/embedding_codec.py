@@ -0,0 +1,73 @@
+import base64
+import json
+import os
+import re
+
+import numpy as np
+
+# Environment variable with the format of the s_bert_embedding attributes written, see FORMATS. Set by main.py
+# --embeddingFormat
+EMBEDDING_FORMAT_ENV = 'KG_EMBEDDING_FORMAT'
+# Version prefix of each format -> dtype of the base64-encoded little-endian vector. "text" is the legacy format,
+# str(list(vector)) of the float32 vector of the model, see legacy_text
+FORMATS = {'float32': ('e1f32:', '<f4'), 'float16': ('e1f16:', '<f2')}
+DEFAULT_FORMAT = 'float32'
+_PREFIXES = {prefix: dtype for prefix, dtype in FORMATS.values()}
+# numpy scalars in the legacy text of numpy >= 2, e.g. "np.float32(0.1)"
+_NUMPY_SCALAR = re.compile(r'np\.float\d+\(([^)]*)\)')
+
+
+def embedding_format():
+    return os.environ.get(EMBEDDING_FORMAT_ENV, DEFAULT_FORMAT)
+
+
+def use_embedding_format(format):
+    '''
+    Select the format of the embeddings written by this process and by the processes it starts
+    :param format: "float32", "float16" or "text" (legacy str(list(float)))
+    '''
+    if format not in FORMATS and format != 'text':
+        raise ValueError(f'Unknown embedding format {format}, expected one of {list(FORMATS) + ["text"]}')
+    os.environ[EMBEDDING_FORMAT_ENV] = format
+
+
+def encode_embedding(vector, format=None):
+    '''
+    Value of an s_bert_embedding attribute: the version prefix of the format and the base64 of the vector, 4 (float32)
+    or 2 (float16) bytes per dimension instead of about 20 characters of decimal text
+    :param vector: embedding, array or list of floats
+    :param format: "float32", "float16" or "text", the format selected by use_embedding_format if not given
+    '''
+    format = format or embedding_format()
+    if format == 'text':
+        return legacy_text(vector)
+    prefix, dtype = FORMATS[format]
+    return prefix + base64.b64encode(np.asarray(vector, dtype=dtype).tobytes()).decode('ascii')
+
+
+def legacy_text(vector):
+    '''
+    Legacy value of an embedding, str(list(vector)) of the float32 vector as written with numpy 1.x (requirements.txt):
+    the shortest repr of each float32, so that a value written again is the same attribute as the one in the KG.
+    Built from str() of the float32 scalars, which numpy >= 2 still gives without the "np.float32(...)" of their repr
+    '''
+    return '[' + ', '.join(str(value) for value in np.asarray(vector, dtype=np.float32)) + ']'
+
+
+def is_legacy(value):
+    '''
+    :return: whether an s_bert_embedding value is in the legacy text format
+    '''
+    return value[:6] not in _PREFIXES
+
+
+def decode_embedding(value):
+    '''
+    Embedding of an s_bert_embedding value, in any format of FORMATS or in the legacy text format
+    :return: list of floats, of the float32 values so that the formats give the same list
+    '''
+    dtype = _PREFIXES.get(value[:6])
+    if dtype is None:
+        values = json.loads(_NUMPY_SCALAR.sub(r'\1', value) if 'np.' in value else value)
+        return np.asarray(values, dtype=np.float32).tolist()
+    return np.frombuffer(base64.b64decode(value[6:]), dtype=dtype).astype(np.float32).tolist()
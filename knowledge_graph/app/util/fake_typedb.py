@@ -0,0 +1,282 @@
+import itertools
+import os
+import re
+import threading
+import time
+
+import ujson as json
+
+from typedb.client import TypeDBClientException
+
+# Answers of the schema check of migrate_em_json.main ("match $x sub thing; ..."), so a run passes it without schema
+DEFAULT_ANSWERS = [{'pattern': r'\$x sub thing', 'answers': [{'x': {'label': label}} for label in
+                                                              ('thing', 'entity', 'relation', 'attribute', 'id',
+                                                               'rel-id', 'revisionNumber', 'classKind')]}]
+
+_iids = itertools.count(1)
+
+
+def new_iid():
+    return '0x%024x' % next(_iids)
+
+
+class FakeConcept:
+    '''
+    Concept of an answer: an entity (iid only), an attribute (iid and value) or a type (label)
+    '''
+
+    def __init__(self, value=None, iid=None, label=None, entity=False):
+        self._value = value
+        self._iid = iid if iid is not None or label is not None else new_iid()
+        self._label = label
+        self._entity = entity
+
+    @classmethod
+    def of(cls, answer):
+        '''
+        :param answer: canned answer of a variable, a plain value (attribute) or a dict with "iid", "value", "label"
+                       and/or "entity"
+        '''
+        if isinstance(answer, FakeConcept):
+            return answer
+        if isinstance(answer, dict):
+            return cls(answer.get('value'), answer.get('iid'), answer.get('label'),
+                       answer.get('entity', 'value' not in answer and 'label' not in answer))
+        return cls(answer)
+
+    def get_iid(self):
+        return self._iid
+
+    def get_value(self):
+        return self._value
+
+    def get_label(self):
+        return self._label
+
+    def is_entity(self):
+        return self._entity
+
+    def is_attribute(self):
+        return self._value is not None
+
+    def is_type(self):
+        return self._label is not None
+
+
+class FakeConceptMap:
+
+    def __init__(self, concepts):
+        self._concepts = concepts
+
+    def get(self, variable):
+        return self._concepts[variable]
+
+    def concepts(self):
+        return list(self._concepts.values())
+
+    def map(self):
+        return dict(self._concepts)
+
+
+class FakeTypeDB:
+    '''
+    In-process stand-in for a TypeDB server, implementing the subset of the client API used by the pipelines
+    (databases, sessions, transactions, insert/match/delete/define queries, commit and answer concepts), to profile
+    the Python side of the ingest and similarity stages without a server.
+    Queries are recorded (in memory, and optionally appended to a .jsonl file), match queries get canned answers and
+    each operation can be given a simulated latency. Insert queries answer one entity with a new iid per inserted
+    variable ("insert $x isa ...").
+    '''
+
+    def __init__(self, answers=None, latency=None, databases=(), record=None, reject=None, keep_queries=True):
+        '''
+        :param answers: list of {"pattern": regex, "answers": [{variable: answer}]}, the answers of the first pattern
+                        found in a match query, see FakeConcept.of. Match queries without pattern get no answer
+        :param latency: dict of simulated seconds per operation: "session", "transaction", "insert", "match",
+                        "delete", "define", "commit" and "commit_per_query" (added per query of the transaction)
+        :param databases: names of the databases which already exist
+        :param record: optional .jsonl file the queries are appended to, one {"database", "operation", "query"} each
+        :param reject: list of regex, insert queries matching one of them raise a TypeDBClientException (e.g. to
+                       simulate ids already in the database)
+        :param keep_queries: If yes, record the queries in memory in `queries`
+        '''
+        self.answers = [(re.compile(rule['pattern']), rule['answers']) for rule in (answers or []) + DEFAULT_ANSWERS]
+        self.latency = latency or {}
+        self.databases = set(databases)
+        self.record = record
+        self.reject = [re.compile(pattern) for pattern in (reject or [])]
+        self.keep_queries = keep_queries
+        self.queries = []
+        self.nb_commits = 0
+        self._lock = threading.Lock()
+
+    @classmethod
+    def from_config(cls, config):
+        '''
+        :param config: "true" for the defaults, or path of a .json file with the arguments of FakeTypeDB
+        '''
+        if str(config).lower() == 'true':
+            return cls()
+        with open(config, 'r', encoding='utf-8') as file:
+            return cls(**json.load(file))
+
+    def core_client(self, address=None):
+        return FakeClient(self)
+
+    def wait(self, operation, nb_queries=0):
+        seconds = self.latency.get(operation, 0)
+        if operation == 'commit':
+            seconds += self.latency.get('commit_per_query', 0) * nb_queries
+        if seconds:
+            time.sleep(seconds)
+
+    def log(self, database, operation, query):
+        if not self.keep_queries and self.record is None:
+            return
+        with self._lock:
+            if self.keep_queries:
+                self.queries.append((database, operation, query))
+            if self.record is not None:
+                with open(self.record, 'a', encoding='utf-8') as file:
+                    file.write(json.dumps({'database': database, 'operation': operation, 'query': query,
+                                           'pid': os.getpid()}) + '\n')
+
+    def match_answers(self, query):
+        for pattern, answers in self.answers:
+            if pattern.search(query):
+                return [FakeConceptMap({variable: FakeConcept.of(answer) for variable, answer in row.items()})
+                        for row in answers]
+        return []
+
+
+class FakeClient:
+
+    def __init__(self, server):
+        self.server = server
+
+    def databases(self):
+        return FakeDatabaseManager(self.server)
+
+    def session(self, database, session_type, options=None):
+        self.server.wait('session')
+        return FakeSession(self.server, database)
+
+    def close(self):
+        pass
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exc_type, exc_value, traceback):
+        self.close()
+
+
+class FakeDatabaseManager:
+
+    def __init__(self, server):
+        self.server = server
+
+    def contains(self, name):
+        return name in self.server.databases
+
+    def create(self, name):
+        self.server.databases.add(name)
+
+    def all(self):
+        return sorted(self.server.databases)
+
+
+class FakeSession:
+
+    def __init__(self, server, database):
+        self.server = server
+        self.database = database
+
+    def transaction(self, transaction_type, options=None):
+        self.server.wait('transaction')
+        return FakeTransaction(self.server, self.database)
+
+    def is_open(self):
+        return True
+
+    def close(self):
+        pass
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exc_type, exc_value, traceback):
+        self.close()
+
+
+class FakeTransaction:
+
+    def __init__(self, server, database):
+        self.server = server
+        self.database = database
+        self._queries = []
+
+    def query(self):
+        return FakeQueryManager(self)
+
+    def concepts(self):
+        return None
+
+    def commit(self):
+        self.server.wait('commit', len(self._queries))
+        for operation, query in self._queries:
+            self.server.log(self.database, operation, query)
+        with self.server._lock:
+            self.server.nb_commits += 1
+        self._queries = []
+
+    def rollback(self):
+        self._queries = []
+
+    def is_open(self):
+        return True
+
+    def close(self):
+        pass
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exc_type, exc_value, traceback):
+        self.close()
+
+
+class FakeQueryManager:
+
+    def __init__(self, transaction):
+        self.transaction = transaction
+        self.server = transaction.server
+
+    def _write(self, operation, query):
+        self.server.wait(operation)
+        self.transaction._queries.append((operation, query))
+
+    def insert(self, query, options=None):
+        if any(pattern.search(query) for pattern in self.server.reject):
+            raise TypeDBClientException('[FAKE] Insert query rejected: ' + query[:200])
+        self._write('insert', query)
+        inserted = re.findall(r'(?:^|;|insert)\s*\$(\w+)\s+isa\b', query.split('insert', 1)[-1])
+        return iter([FakeConceptMap({variable: FakeConcept(entity=True) for variable in inserted})])
+
+    def match(self, query, options=None):
+        self.server.wait('match')
+        self.server.log(self.transaction.database, 'match', query)
+        return iter(self.server.match_answers(query))
+
+    def delete(self, query, options=None):
+        self._write('delete', query)
+
+    def update(self, query, options=None):
+        self._write('update', query)
+        return iter([])
+
+    def define(self, query, options=None):
+        self._write('define', query)
+
+    def undefine(self, query, options=None):
+        self._write('undefine', query)
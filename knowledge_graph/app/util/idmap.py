@@ -0,0 +1,83 @@
+import os
+import threading
+
+from typedb.client import TransactionType
+
+
+class IidMap:
+    '''
+    Persistent map from CDP4 ids (the "iid" of each item of an Engineering Model, stored as attribute id) to the
+    iid TypeDB assigned to the inserted entity. Entries are appended to a tab separated file, so the map survives
+    restarts of the migration and relationships can be matched by iid instead of by attribute lookups.
+    TypeDB iids are only valid in the database they were created in, the file must be reset with the database.
+    '''
+
+    def __init__(self, path, lock=None):
+        '''
+        :param path: file storing the map, one "<CDP4 id>\t<TypeDB iid>" entry per line
+        :param lock: optional multiprocessing lock, when several processes append to the same file
+        '''
+        self.path = path
+        self._iids = {}
+        self._lock = lock if lock is not None else threading.Lock()
+        if os.path.exists(path):
+            with open(path, 'r', encoding='utf-8') as file:
+                for line in file:
+                    entry = line.rstrip('\n').split('\t')
+                    if len(entry) == 2:
+                        self._iids[entry[0]] = entry[1]
+
+    def get(self, id):
+        return self._iids.get(id)
+
+    def __contains__(self, id):
+        return id in self._iids
+
+    def __len__(self):
+        return len(self._iids)
+
+    def update(self, iids):
+        '''
+        Add entries to the map and append them to the file, can be called from several writer threads (or processes
+        sharing a lock)
+        :param iids: dict CDP4 id -> TypeDB iid
+        '''
+        if not iids:
+            return
+        with self._lock:
+            new = {id: iid for id, iid in iids.items() if self._iids.get(id) != iid}
+            self._iids.update(new)
+            with open(self.path, 'a', encoding='utf-8') as file:
+                file.writelines(f'{id}\t{iid}\n' for id, iid in new.items())
+
+    def reset(self):
+        '''
+        Empty the map, e.g. when the database it refers to has been (re)created
+        '''
+        with self._lock:
+            self._iids = {}
+            if os.path.exists(self.path):
+                os.remove(self.path)
+
+    def resolve(self, session, ids):
+        '''
+        Bulk pre-resolution of ids missing from the map: streams all (iid, id) pairs out of the database
+        in one read transaction and records the requested ones
+        :param session: running TypeDB session
+        :param ids: set of CDP4 ids to resolve
+        :return: number of resolved ids
+        '''
+        missing = set(ids) - self._iids.keys()
+        if not missing:
+            return 0
+
+        resolved = {}
+        with session.transaction(TransactionType.READ) as transaction:
+            iterator = transaction.query().match('match $x isa entity, has id $id; get $x, $id;')
+            for ans in iterator:
+                id = ans.get('id').get_value()
+                if id in missing:
+                    resolved[id] = ans.get('x').get_iid()
+
+        self.update(resolved)
+        return len(resolved)
@@ -0,0 +1,90 @@
+import functools
+import os
+import threading
+from collections import OrderedDict
+
+from util.utils import AcronymExpander
+from util.telemetry import telemetry
+
+# Acronyms expanded in the texts embedded by the sentence transformer
+ACRONYMS_FILE = os.path.join(os.path.dirname(os.path.abspath(__file__)), 'ecss_acronyms.txt')
+# Number of distinct raw texts whose normalized text is kept, per normalizer
+CACHE_SIZE = 100_000
+
+
+def remove_underscore(text):
+    return text.replace("_", ' ')
+
+
+class TextNormalizer:
+    '''
+    Normalization of the texts embedded by the sentence transformer (element names, metadata values): underscores
+    replaced by spaces if asked, then acronyms expanded. The same names come back in every iteration and mission
+    ("Solar Array", "OBC", ...), so the normalized texts are kept in a bounded LRU cache keyed on the raw text.
+    Safe to use from several threads.
+    '''
+
+    def __init__(self, expander, underscores=False, cache_size=CACHE_SIZE, name='text'):
+        '''
+        :param expander: AcronymExpander
+        :param underscores: If yes, replace the underscores by spaces before expanding the acronyms
+        :param cache_size: maximum number of raw texts in the cache, the least recently used are evicted
+        :param name: name of the normalizer in the telemetry
+        '''
+        self.expander = expander
+        self.underscores = underscores
+        self.cache_size = cache_size
+        self.name = name
+        self.hits = 0
+        self.misses = 0
+        self._recorded = (0, 0)
+        self._cache = OrderedDict()
+        self._lock = threading.Lock()
+
+    def normalize(self, text):
+        with self._lock:
+            normalized = self._cache.get(text)
+            if normalized is not None:
+                self._cache.move_to_end(text)
+                self.hits += 1
+                return normalized
+            self.misses += 1
+        normalized = self.expander.expand(remove_underscore(text) if self.underscores else text)
+        with self._lock:
+            self._cache[text] = normalized
+            if len(self._cache) > self.cache_size:
+                self._cache.popitem(last=False)
+        return normalized
+
+    __call__ = normalize
+
+    def stats(self):
+        '''
+        :return: dict with the hits, misses, hit rate and size of the cache
+        '''
+        with self._lock:
+            calls = self.hits + self.misses
+            return {'hits': self.hits, 'misses': self.misses, 'hit_rate': self.hits / calls if calls else None,
+                    'size': len(self._cache)}
+
+    def record(self):
+        '''
+        Counts the hits and misses since the last call in the telemetry of the run (counter normalization_cache)
+        '''
+        with self._lock:
+            hits, misses = self.hits - self._recorded[0], self.misses - self._recorded[1]
+            self._recorded = (self.hits, self.misses)
+        if hits:
+            telemetry.count('normalization_cache', hits, normalizer=self.name, result='hit')
+        if misses:
+            telemetry.count('normalization_cache', misses, normalizer=self.name, result='miss')
+
+
+@functools.lru_cache(maxsize=None)
+def get_normalizer(underscores=False):
+    '''
+    Normalizer shared by all embedding call sites of this process, with the ECSS acronyms
+    :param underscores: If yes, the normalizer of the element names, which replaces underscores by spaces first
+    '''
+    return TextNormalizer(AcronymExpander.from_file(ACRONYMS_FILE), underscores,
+                          name='element_names' if underscores else 'metadata')
@@ -0,0 +1,133 @@
+import os
+import sys
+from collections import Counter
+
+import ujson as json
+
+COLUMNS = ('relationship', 'role1', 'class1', 'player1', 'role2', 'class2', 'player2')
+
+
+class RelationshipSink:
+    '''
+    Collects the relationships detected by the migration templates until they are committed to TypeDB.
+    Relationships are kept in memory column by column (relationship, role and class names are interned, as they
+    repeat for every row). Once more than spill_threshold rows are held in memory, they are appended to spill_path,
+    one JSON list per line, so memory stays bounded for large Engineering Models.
+    '''
+
+    def __init__(self, spill_path='tempRelationships.jsonl', spill_threshold=500_000):
+        '''
+        :param spill_path: file the relationships are appended to once spill_threshold is exceeded
+        :param spill_threshold: maximum number of relationships kept in memory
+        '''
+        self.spill_path = spill_path
+        self.spill_threshold = spill_threshold
+        self.counts = Counter()
+        self._columns = {column: [] for column in COLUMNS}
+        self._spilled = 0
+        self._spill_initialised = False
+
+    def append(self, relation, r1, c1, p1, r2, c2, p2):
+        '''
+        Add one relationship to the sink
+        '''
+        columns = self._columns
+        columns['relationship'].append(sys.intern(relation))
+        columns['role1'].append(sys.intern(r1))
+        columns['class1'].append(sys.intern(c1))
+        columns['player1'].append(p1)
+        columns['role2'].append(sys.intern(r2))
+        columns['class2'].append(sys.intern(c2))
+        columns['player2'].append(p2)
+        self.counts[relation] += 1
+
+        if len(columns['relationship']) > self.spill_threshold:
+            self.flush()
+
+    def flush(self):
+        '''
+        Append all relationships held in memory to the spill file
+        '''
+        columns = self._columns
+        if not columns['relationship']:
+            return
+
+        mode = 'a' if self._spill_initialised else 'w'
+        with open(self.spill_path, mode, encoding='utf-8') as file:
+            for row in zip(*[columns[column] for column in COLUMNS]):
+                file.write(json.dumps(row))
+                file.write('\n')
+        self._spill_initialised = True
+        self._spilled += len(columns['relationship'])
+        self._columns = {column: [] for column in COLUMNS}
+
+    def restore(self, nb_relationships):
+        '''
+        Reopen the spill file of an interrupted run, keeping its first nb_relationships relationships
+        (the ones recorded by the checkpoint) and dropping the rest
+        :param nb_relationships: number of relationships to keep
+        '''
+        self._columns = {column: [] for column in COLUMNS}
+        self.counts = Counter()
+        self._spilled = 0
+        if not nb_relationships or not os.path.exists(self.spill_path):
+            self._spill_initialised = False
+            return
+
+        with open(self.spill_path, 'r', encoding='utf-8') as infile, \
+                open(self.spill_path + '.tmp', 'w', encoding='utf-8') as outfile:
+            for line in infile:
+                if self._spilled == nb_relationships:
+                    break
+                outfile.write(line)
+                self.counts[json.loads(line)[0]] += 1
+                self._spilled += 1
+        os.replace(self.spill_path + '.tmp', self.spill_path)
+        self._spill_initialised = True
+
+    def clear(self):
+        '''
+        Drop all relationships, in memory and on disk
+        '''
+        self._columns = {column: [] for column in COLUMNS}
+        self.counts = Counter()
+        self._spilled = 0
+        if self._spill_initialised and os.path.exists(self.spill_path):
+            os.remove(self.spill_path)
+        self._spill_initialised = False
+
+    def __len__(self):
+        return self._spilled + len(self._columns['relationship'])
+
+    def __iter__(self):
+        '''
+        Stream all relationships as (relationship, role1, class1, player1, role2, class2, player2) tuples,
+        first the spilled ones, then the ones still in memory
+        '''
+        if self._spilled:
+            with open(self.spill_path, 'r', encoding='utf-8') as file:
+                for line in file:
+                    yield tuple(json.loads(line))
+
+        columns = self._columns
+        yield from zip(*[columns[column] for column in COLUMNS])
+
+
+class RelationshipBuffer:
+    '''
+    Plain list of relationships, used as relationship sink by worker processes rendering templates,
+    which send the relationships of each item back to the committing process
+    '''
+
+    def __init__(self):
+        self.rows = []
+
+    def append(self, relation, r1, c1, p1, r2, c2, p2):
+        self.rows.append((relation, r1, c1, p1, r2, c2, p2))
+
+    def drain(self):
+        '''
+        :return: relationships appended since the last call
+        '''
+        rows, self.rows = self.rows, []
+        return rows
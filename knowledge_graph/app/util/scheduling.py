@@ -0,0 +1,112 @@
+import heapq
+import os
+from concurrent.futures import ThreadPoolExecutor
+from fnmatch import fnmatch
+
+# Files of a mission directory which are not EM files
+IGNORED_FILES = ('Header.json', 'Metadata.json')
+# Bytes read at the start of a file to estimate its number of items
+SAMPLE_BYTES = 1 << 20
+# Key present once in each item of an EM file
+ITEM_MARKER = b'"classKind"'
+
+
+def estimate_items(path, size=None, sample_bytes=SAMPLE_BYTES):
+    '''
+    Number of items of an EM file, counted in the first sample_bytes of the file and extrapolated to its size
+    (exact for files smaller than the sample)
+    :param path: EM file
+    :param size: size of the file in bytes, read from the file system if not given
+    '''
+    size = os.path.getsize(path) if size is None else size
+    with open(path, 'rb') as file:
+        sample = file.read(sample_bytes)
+    nb_items = sample.count(ITEM_MARKER)
+    if not sample or len(sample) >= size:
+        return nb_items
+    return round(nb_items * size / len(sample))
+
+
+def discover_mission(mission_dir):
+    '''
+    :param mission_dir: directory of one mission
+    :return: list of {"path", "bytes", "items"} of the EM files of the mission, largest first
+    '''
+    files = []
+    for path, subdirs, names in os.walk(mission_dir):
+        for name in names:
+            if fnmatch(name, '*.json') and name not in IGNORED_FILES:
+                file = os.path.join(path, name)
+                size = os.path.getsize(file)
+                files.append({'path': file, 'bytes': size, 'items': estimate_items(file, size)})
+    files.sort(key=lambda file: (-file['items'], -file['bytes'], file['path']))
+    return files
+
+
+def discover_em_files(em_dir_path, threads=8):
+    '''
+    Lists the EM files of all missions of a directory with their size and estimated number of items, the missions
+    are walked by parallel threads
+    :param em_dir_path: directory with one sub-directory per mission
+    :param threads: number of missions walked at once
+    :return: dict mission -> list of files (see discover_mission), the missions with the most items first
+    '''
+    missions = {os.path.splitext(entry.name)[0]: entry.path for entry in os.scandir(em_dir_path)}
+    with ThreadPoolExecutor(max_workers=max(1, min(threads, len(missions)))) as executor:
+        discovered = dict(zip(missions, executor.map(discover_mission, missions.values())))
+    return dict(sorted(discovered.items(), key=lambda mission: (-mission_items(mission[1]), mission[0])))
+
+
+def mission_items(files):
+    return sum(file['items'] for file in files)
+
+
+def lpt_schedule(costs, workers):
+    '''
+    Longest-processing-time-first schedule: jobs are taken from the largest to the smallest and each one is given to
+    the worker with the least work so far, which is how a pool of workers picks them when submitted in that order
+    :param costs: dict job -> cost (e.g. number of items)
+    :param workers: number of workers
+    :return: list of (total cost, list of jobs) of each worker
+    '''
+    loads = [(0, worker) for worker in range(max(1, workers))]
+    jobs = [[] for _ in loads]
+    totals = [0] * len(loads)
+    for job, cost in sorted(costs.items(), key=lambda job: (-job[1], str(job[0]))):
+        load, worker = heapq.heappop(loads)
+        jobs[worker].append(job)
+        totals[worker] = load + cost
+        heapq.heappush(loads, (load + cost, worker))
+    return list(zip(totals, jobs))
+
+
+def print_schedule(discovered, mission_workers=1, items_per_second=None):
+    '''
+    Dry-run listing of the insertion: EM files of each mission in the order they are inserted, missions assigned
+    to the mission workers and the predicted wall time of the entity phase
+    :param discovered: dict mission -> list of files, see discover_em_files
+    :param mission_workers: number of processes inserting missions in parallel
+    :param items_per_second: optional insertion throughput of one mission worker (e.g. of a previous run report),
+                             without it the schedule is only given in items
+    :return: predicted seconds, None without items_per_second
+    '''
+    for mission, files in discovered.items():
+        print(f'\n{mission}: {len(files)} files, ~{mission_items(files):,} items, '
+              f'{sum(file["bytes"] for file in files) / 2 ** 20:.1f} MB')
+        for file in files:
+            print(f'   ~{file["items"]:>10,} items {file["bytes"] / 2 ** 20:10.1f} MB  {file["path"]}')
+
+    schedule = lpt_schedule({mission: mission_items(files) for mission, files in discovered.items()}, mission_workers)
+    makespan = max(load for load, missions in schedule)
+    print(f'\nSchedule on {len(schedule)} mission workers (largest missions first):')
+    for worker, (load, missions) in enumerate(schedule):
+        print(f' | worker {worker + 1} | ~{load:,} items | {", ".join(missions) or "-"}')
+    total = sum(load for load, missions in schedule)
+    print(f'Total: ~{total:,} items, ~{makespan:,} items on the busiest worker')
+    if not items_per_second:
+        print('No throughput known, the wall time cannot be predicted')
+        return None
+    seconds = makespan / items_per_second
+    print(f'Predicted wall time of the entity phase: {seconds / 60:.1f} minutes at {items_per_second:,.0f} items/s '
+          f'per worker')
+    return seconds
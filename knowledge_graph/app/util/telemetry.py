@@ -0,0 +1,207 @@
+import math
+import threading
+import time
+from collections import defaultdict
+from contextlib import contextmanager
+
+import ujson as json
+
+# Upper bounds (seconds) of the buckets of the latency histograms in the Prometheus file
+LATENCY_BUCKETS = (0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1, 2.5, 5, 10, 30, 60, 300)
+PERCENTILES = (50, 90, 95, 99)
+
+
+def percentile(sorted_samples, q):
+    '''
+    :param sorted_samples: sorted list of values
+    :param q: percentile, between 0 and 100
+    :return: value of the q-th percentile (nearest rank)
+    '''
+    if not sorted_samples:
+        return None
+    rank = max(0, min(len(sorted_samples) - 1, math.ceil(q / 100 * len(sorted_samples)) - 1))
+    return sorted_samples[rank]
+
+
+class Telemetry:
+    '''
+    Counters and timings of a migration run, e.g. the number of items rendered per classKind, the latency of each
+    commit or the number of retried batches. Each series is identified by a name and labels (keyword arguments).
+    Other stages add their own series through count(), observe() and timer(), or the module functions of the same
+    name recording into the telemetry of the run.
+    The state of a worker process (state()) can be merged into the telemetry of the main process (merge()).
+    '''
+
+    def __init__(self):
+        self._counters = defaultdict(float)
+        self._samples = defaultdict(list)
+        self._lock = threading.Lock()
+        self.started = time.time()
+        # information on the run added to the report (database, options...)
+        self.run = {}
+
+    def count(self, name, value=1, **labels):
+        '''
+        Add value to a counter
+        '''
+        key = (name, tuple(sorted(labels.items())))
+        with self._lock:
+            self._counters[key] += value
+
+    def observe(self, name, seconds, **labels):
+        '''
+        Record one duration of a timing (e.g. the latency of one commit)
+        '''
+        key = (name, tuple(sorted(labels.items())))
+        with self._lock:
+            self._samples[key].append(seconds)
+
+    @contextmanager
+    def timer(self, name, **labels):
+        '''
+        Context manager recording the duration of its block as one sample of a timing
+        '''
+        start = time.perf_counter()
+        try:
+            yield
+        finally:
+            self.observe(name, time.perf_counter() - start, **labels)
+
+    def state(self):
+        '''
+        :return: picklable copy of all counters and samples, see merge
+        '''
+        with self._lock:
+            return {'counters': dict(self._counters), 'samples': {key: list(samples)
+                                                                  for key, samples in self._samples.items()}}
+
+    def merge(self, state):
+        '''
+        Add the counters and samples of another Telemetry, e.g. of a worker process
+        :param state: result of Telemetry.state()
+        '''
+        with self._lock:
+            for key, value in state['counters'].items():
+                self._counters[key] += value
+            for key, samples in state['samples'].items():
+                self._samples[key].extend(samples)
+
+    def reset(self):
+        with self._lock:
+            self._counters.clear()
+            self._samples.clear()
+        self.started = time.time()
+        self.run = {}
+
+    def counter(self, name, **labels):
+        return self._counters.get((name, tuple(sorted(labels.items()))), 0)
+
+    def report(self):
+        '''
+        Machine-readable report of the run
+        :return: dict with the counters, the statistics of each timing (count, total, percentiles) and the
+                 throughput of the rendering per classKind and of the commits per kind of data
+        '''
+        with self._lock:
+            counters = dict(self._counters)
+            samples = {key: sorted(values) for key, values in self._samples.items()}
+
+        report = {'run': dict(self.run, started=self.started, finished=time.time(),
+                              minutes=round((time.time() - self.started) / 60, 2)),
+                  'counters': defaultdict(list), 'timings': defaultdict(list)}
+        for (name, labels), value in sorted(counters.items()):
+            report['counters'][name].append({'labels': dict(labels), 'value': value})
+        for (name, labels), values in sorted(samples.items()):
+            timing = {'labels': dict(labels), 'count': len(values), 'total': sum(values),
+                      'min': values[0] if values else None, 'max': values[-1] if values else None}
+            timing.update({f'p{q}': percentile(values, q) for q in PERCENTILES})
+            report['timings'][name].append(timing)
+
+        # items rendered per second of template time, for each classKind
+        report['rendering'] = {
+            dict(labels)['classKind']: {
+                'items': value,
+                'seconds': counters.get(('render_seconds', labels), 0),
+                'items_per_second': value / counters[('render_seconds', labels)]
+                if counters.get(('render_seconds', labels)) else None}
+            for (name, labels), value in counters.items() if name == 'items_rendered'}
+        # committed queries per second of the phases inserting them (summed over the missions), and per second of
+        # commit time (summed over the writers), for each kind of data
+        report['commits'] = {}
+        for (name, labels), values in samples.items():
+            if name != 'commit_seconds':
+                continue
+            kind = dict(labels)['kind']
+            committed = counters.get(('queries_committed', labels), 0)
+            phase_seconds = sum(sum(phase) for (series, phase_labels), phase in samples.items()
+                                if series == 'phase_seconds' and dict(phase_labels).get('kind') == kind)
+            report['commits'][kind] = {
+                'queries': committed, 'transactions': len(values), 'commit_seconds': sum(values),
+                'phase_seconds': phase_seconds,
+                'queries_per_second': committed / phase_seconds if phase_seconds else None,
+                'queries_per_commit_second': committed / sum(values) if sum(values) else None}
+        return report
+
+    def write_json(self, path):
+        '''
+        Write the report of the run to a .json file
+        '''
+        with open(path, 'w', encoding='utf-8') as file:
+            json.dump(self.report(), file, indent=2)
+
+    def write_prometheus(self, path, prefix='kg_migration_'):
+        '''
+        Write the counters and timings in the Prometheus text format (e.g. for the textfile collector of the node
+        exporter), counters as <prefix><name>_total and timings as histograms <prefix><name>
+        '''
+        with self._lock:
+            counters = dict(self._counters)
+            samples = {key: sorted(values) for key, values in self._samples.items()}
+
+        lines = []
+        for name in sorted({name for name, labels in counters}):
+            lines.append(f'# TYPE {prefix}{name}_total counter')
+            for (series, labels), value in sorted(counters.items()):
+                if series == name:
+                    lines.append(f'{prefix}{name}_total{prometheus_labels(labels)} {value}')
+        for name in sorted({name for name, labels in samples}):
+            lines.append(f'# TYPE {prefix}{name} histogram')
+            for (series, labels), values in sorted(samples.items()):
+                if series != name:
+                    continue
+                nb_below, index = 0, 0
+                for bucket in LATENCY_BUCKETS:
+                    while index < len(values) and values[index] <= bucket:
+                        index += 1
+                    nb_below = index
+                    lines.append(f'{prefix}{name}_bucket{prometheus_labels(labels + (("le", str(bucket)),))} '
+                                 f'{nb_below}')
+                lines.append(f'{prefix}{name}_bucket{prometheus_labels(labels + (("le", "+Inf"),))} {len(values)}')
+                lines.append(f'{prefix}{name}_sum{prometheus_labels(labels)} {sum(values)}')
+                lines.append(f'{prefix}{name}_count{prometheus_labels(labels)} {len(values)}')
+
+        with open(path, 'w', encoding='utf-8') as file:
+            file.write('\n'.join(lines) + '\n')
+
+
+def prometheus_labels(labels):
+    if not labels:
+        return ''
+    escaped = (str(value).replace('\\', '\\\\').replace('"', '\\"').replace('\n', '\\n') for key, value in labels)
+    return '{' + ','.join(f'{key}="{value}"' for (key, _), value in zip(labels, escaped)) + '}'
+
+
+# Telemetry of the current run
+telemetry = Telemetry()
+
+
+def count(name, value=1, **labels):
+    telemetry.count(name, value, **labels)
+
+
+def observe(name, seconds, **labels):
+    telemetry.observe(name, seconds, **labels)
+
+
+def timer(name, **labels):
+    return telemetry.timer(name, **labels)
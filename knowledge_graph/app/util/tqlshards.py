@@ -0,0 +1,104 @@
+import gzip
+import io
+import os
+
+import ujson as json
+
+# Index of the shards of a directory, in the order they have to be loaded
+MANIFEST_FILE = 'manifest.json'
+
+
+def encode_query(query):
+    '''
+    :return: query on a single line, line breaks inside strings are escaped
+             (the rendered queries contain no backslash, so the escapes are unambiguous)
+    '''
+    return query.replace('\r', '\\r').replace('\n', '\\n')
+
+
+def decode_query(line):
+    '''
+    :return: query written by encode_query
+    '''
+    return line.rstrip('\n').replace('\\n', '\n').replace('\\r', '\r')
+
+
+class ShardWriter:
+    '''
+    Writes TypeQL queries to gzip-compressed .tql shards, one query per line and at most shard_size queries per
+    shard, named <prefix>-00000.tql.gz, <prefix>-00001.tql.gz...
+    The compressed files carry no timestamp, so rendering the same EM twice gives identical shards.
+    '''
+
+    def __init__(self, directory, prefix, kind, shard_size=100_000, **info):
+        '''
+        :param directory: directory of the shards
+        :param prefix: start of the shard file names
+        :param kind: type of inserted data ("Entity" or "Relationship"), recorded in the manifest
+        :param shard_size: maximum number of queries per shard
+        :param info: other fields recorded in the manifest for each shard (e.g. mission)
+        '''
+        self.directory = directory
+        self.prefix = prefix
+        self.kind = kind
+        self.shard_size = shard_size
+        self.info = info
+        self.shards = []
+        self._file = None
+        self._nb_queries = 0
+
+    def write(self, query):
+        if self._file is None or self._nb_queries == self.shard_size:
+            self._open()
+        self._file.write(encode_query(query))
+        self._file.write('\n')
+        self._nb_queries += 1
+        self.shards[-1]['queries'] = self._nb_queries
+
+    def _open(self):
+        self._close_shard()
+        name = f'{self.prefix}-{len(self.shards):05d}.tql.gz'
+        raw = open(os.path.join(self.directory, name), 'wb')
+        self._file = io.TextIOWrapper(gzip.GzipFile(filename='', mode='wb', fileobj=raw, mtime=0),
+                                      encoding='utf-8', newline='\n')
+        self._raw = raw
+        self._nb_queries = 0
+        self.shards.append(dict(self.info, file=name, kind=self.kind, queries=0))
+
+    def _close_shard(self):
+        if self._file is not None:
+            self._file.close()
+            self._raw.close()
+            self._file = None
+
+    def close(self):
+        '''
+        :return: manifest entries of the written shards
+        '''
+        self._close_shard()
+        return self.shards
+
+
+def iter_shard(path):
+    '''
+    :param path: .tql.gz shard written by ShardWriter
+    :return: generator of the queries of the shard
+    '''
+    with gzip.open(path, 'rt', encoding='utf-8', newline='\n') as file:
+        for line in file:
+            if line.strip():
+                yield decode_query(line)
+
+
+def write_manifest(directory, shards, **info):
+    '''
+    :param shards: manifest entries of the shards (see ShardWriter.close), in loading order
+    :param info: information on the rendering added to the manifest (e.g. templates used)
+    '''
+    with open(os.path.join(directory, MANIFEST_FILE), 'w', encoding='utf-8') as file:
+        json.dump(dict(info, shards=shards), file, indent=2)
+
+
+def read_manifest(directory):
+    with open(os.path.join(directory, MANIFEST_FILE), 'r', encoding='utf-8') as file:
+        return json.load(file)
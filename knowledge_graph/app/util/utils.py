@@ -1,35 +1,101 @@
 from typedb.client import *
+import json
 import re
+from util.batching import AdaptiveBatchSize, commit_batch
 try:
     import pathlib
 except ImportError:
     import pathlib2 as pathlib
 
-def typeql_batch_insertion(insertion_query, parameter_list, session, batch_size=128):
-    bs = batch_size
+def typeql_batch_insertion(insertion_query, parameter_list, session, batch_size=128, adaptive_size=None,
+                           kind='Similarity'):
+    '''
+    Inserts one query per parameters, committed in batches sized by an AdaptiveBatchSize through commit_batch
+    :param insertion_query: insert query, formatted with each parameters dict
+    :param parameter_list: iterable of parameters dicts
+    :param session: running TypeDB session
+    :param batch_size: initial number of queries per transaction
+    :param adaptive_size: optional AdaptiveBatchSize shared with other insertions, created from batch_size otherwise
+    :param kind: type of inserted data, in the telemetry and the report of rejected queries
+    '''
+    adaptive_size = adaptive_size or AdaptiveBatchSize(batch_size)
     batch_query = []
-    counter = 0
+    batch_bytes = 0
 
-    for params_count, params in enumerate(parameter_list):
+    for params in parameter_list:
 
         # print(params)
         typeql_insert_query = insertion_query.format(**params)
-        counter += 1
-
-        if counter < bs and params_count != len(list(parameter_list)) - 1:
-            batch_query.append(typeql_insert_query)
+        batch_query.append(typeql_insert_query)
+        batch_bytes += len(typeql_insert_query)
 
-        else:
+        if adaptive_size.full(len(batch_query), batch_bytes):
+            commit_batch(session, batch_query, kind, adaptive_size=adaptive_size)
+            batch_query = []
+            batch_bytes = 0
 
-            batch_query.append(typeql_insert_query)
-            with session.transaction(TransactionType.WRITE) as transaction:
+    commit_batch(session, batch_query, kind, adaptive_size=adaptive_size)
 
-                for query in batch_query:
-                    #print(query)
-                    transaction.query().insert(query)
-                transaction.commit()
-                counter = 0
-                batch_query = []
+def iter_json_array(path, chunk_size=1 << 20, encoding='utf-8'):
+    '''
+    Stream the items of a file containing a top-level JSON array (e.g. an Engineering Model export) one at a time,
+    reading the file in chunks, so memory stays bounded by the size of one chunk plus one item
+    :param path: path of the .json file
+    :param chunk_size: number of characters read from the file at once
+    :param encoding: encoding of the file
+    :return: generator of the array items
+    '''
+    decoder = json.JSONDecoder()
+    whitespace = ' \t\n\r'
+    # characters which can continue a number decoded at the end of the buffer, e.g. "-0." of "-0.25"
+    number_chars = '0123456789.eE+-'
+
+    with open(path, 'r', encoding=encoding) as file:
+        buffer = file.read(chunk_size)
+        eof = not buffer
+        pos = 0
+        started = False
+
+        while True:
+            # skip whitespace and the separators between items
+            while pos < len(buffer) and (buffer[pos] in whitespace or (started and buffer[pos] == ',')):
+                pos += 1
+
+            if pos == len(buffer):
+                if eof:
+                    raise ValueError(f'{path}: unexpected end of file, JSON array is not closed')
+                buffer = file.read(chunk_size)
+                eof = not buffer
+                pos = 0
+                continue
+
+            if not started:
+                if buffer[pos] != '[':
+                    raise ValueError(f'{path}: file does not contain a top-level JSON array')
+                started = True
+                pos += 1
+                continue
+
+            if buffer[pos] == ']':
+                return
+
+            try:
+                item, end = decoder.raw_decode(buffer, pos)
+            except json.JSONDecodeError:
+                if eof:
+                    raise
+                item, end = None, len(buffer)
+
+            # the item may continue in the next chunk (truncated object or number at the end of the buffer)
+            if not eof and not isinstance(item, (dict, list, str)) and not buffer[end:].strip(number_chars):
+                chunk = file.read(chunk_size)
+                eof = not chunk
+                buffer = buffer[pos:] + chunk
+                pos = 0
+                continue
+
+            yield item
+            pos = end
 
 def load_Acronyms(path):
     '''
@@ -76,3 +142,74 @@ def replace_Acronyms(sentence, acronyms, expansions):
     return sentence
 
 
+class AcronymExpander:
+    '''
+    Acronym expansion of replace_Acronyms with the same output, without searching every acronym of the list in every
+    sentence: the regular expressions are compiled once, and only the acronyms found among the words of the sentence
+    (or, for acronyms with other characters such as "I/O", in its text) are searched.
+    As in replace_Acronyms, the acronyms are applied in the order of the list, the sentence is lowercased once an
+    acronym is found, and an expansion can itself contain acronyms further down the list.
+    '''
+
+    WORD = re.compile(r'\w+')
+
+    def __init__(self, acronyms, expansions):
+        '''
+        :param acronyms: acronyms, see load_Acronyms
+        :param expansions: expansion of each acronym
+        '''
+        # index in the list -> (pattern of the acronym, pattern of its plural, expansion)
+        self._entries = {}
+        # lowercase word -> indices of the acronyms which are this word or whose plural is this word
+        self._by_word = {}
+        # (index, lowercase acronym) of the acronyms which are not a single word
+        self._others = []
+        for count, acronym in enumerate(acronyms):
+            if len(acronym) > 1 and not '.' in acronym:
+                lowered = acronym.lower()
+                self._entries[count] = (re.compile(r'\b{}\b'.format(lowered)), re.compile(r'\b{}s\b'.format(lowered)),
+                                        expansions[count])
+                if self.WORD.fullmatch(lowered):
+                    self._by_word.setdefault(lowered, []).append(count)
+                    self._by_word.setdefault(lowered + 's', []).append(count)
+                else:
+                    self._others.append((count, lowered))
+
+    @classmethod
+    def from_file(cls, path):
+        return cls(*load_Acronyms(path))
+
+    def _candidates(self, lowered, after):
+        '''
+        :return: sorted indices, after `after`, of the acronyms which may be in the lowercase sentence
+        '''
+        found = {count for word in set(self.WORD.findall(lowered)) for count in self._by_word.get(word, ())}
+        found.update(count for count, acronym in self._others if acronym in lowered)
+        return sorted(count for count in found if count > after)
+
+    def expand(self, sentence):
+        '''
+        :return: sentence with its acronyms expanded, as returned by replace_Acronyms
+        '''
+        lowered = sentence.lower()
+        candidates = self._candidates(lowered, -1)
+        position = 0
+        while position < len(candidates):
+            count = candidates[position]
+            position += 1
+            pattern, plural, expansion = self._entries[count]
+            if pattern.search(lowered):
+                sentence = pattern.sub(expansion, lowered)
+            elif plural.search(lowered):
+                sentence = plural.sub(f"{expansion}s", lowered)
+            else:
+                continue
+            lowered = sentence.lower()
+            # the expansion may contain acronyms further down the list
+            candidates = self._candidates(lowered, count)
+            position = 0
+        return sentence
+
+    __call__ = expand
+
+
@@ -0,0 +1,75 @@
+import logging
+from collections import deque
+from concurrent.futures import ThreadPoolExecutor
+
+
+class BatchWriterPool:
+    '''
+    Commits independent batches of insert queries concurrently.
+    Each batch is handed to commit(batch) on one of `writers` threads, which opens its own WRITE transaction on the
+    shared session, so the submitting thread keeps parsing and rendering queries while batches are committed.
+    Results are reported in submission order through on_committed(index, batch, result), always from the submitting
+    thread, so progress bars and checkpoints only ever see a contiguous prefix of committed batches.
+    A batch raising an exception is logged and recorded in `failed`, the remaining batches carry on.
+    '''
+
+    def __init__(self, commit, writers=1, max_pending=None, on_committed=None):
+        '''
+        :param commit: function committing one batch (list of queries) in its own transaction
+        :param writers: number of parallel write transactions
+        :param max_pending: maximum number of batches queued or in flight, defaults to 2 * writers
+        :param on_committed: callback called in submission order with (index, batch, result)
+        '''
+        self.commit = commit
+        self.writers = max(1, writers)
+        self.max_pending = max_pending or 2 * self.writers
+        self.on_committed = on_committed
+        self.failed = []
+        self._submitted = 0
+        self._pending = deque()
+        self._executor = ThreadPoolExecutor(max_workers=self.writers)
+
+    def submit(self, batch):
+        '''
+        Queue one batch for commit, blocks while max_pending batches are already in flight
+        :param batch: list of queries
+        '''
+        if not batch:
+            return
+        index = self._submitted
+        self._submitted += 1
+
+        self._pending.append((index, batch, self._executor.submit(self.commit, batch)))
+        # report all batches finished in order, wait for the oldest one if too many are in flight
+        while self._pending and (self._pending[0][2].done() or len(self._pending) >= self.max_pending):
+            index, batch, future = self._pending.popleft()
+            self._report(index, batch, future.result)
+
+    def close(self):
+        '''
+        Wait for all submitted batches and shut the worker threads down
+        :return: list of (index, batch, exception) for the batches that failed
+        '''
+        while self._pending:
+            index, batch, future = self._pending.popleft()
+            self._report(index, batch, future.result)
+        if self._executor is not None:
+            self._executor.shutdown()
+            self._executor = None
+        return self.failed
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exc_type, exc_value, traceback):
+        self.close()
+
+    def _report(self, index, batch, result):
+        try:
+            result = result()
+        except Exception as error:
+            logging.error(f'Batch {index} of {len(batch)} queries failed: {error}')
+            self.failed.append((index, batch, error))
+            return
+        if self.on_committed is not None:
+            self.on_committed(index, batch, result)